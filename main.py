@@ -8,7 +8,7 @@ from models.simulation_engine import run_simulation
 from utils.config import *
 
 # Main function
-def main():
+def main(resume=False):
     print("[STEP 1] Generating population...")
     agents = generate_synthetic_population(POPULATION_FRACTION)
 
@@ -16,7 +16,13 @@ def main():
     compute_paths(agents, network_data=None)  # placeholder
 
     print("[STEP 3] Running simulation...")
-    run_simulation(agents, SIM_DURATION, TIME_STEP)
+    run_simulation(agents, SIM_DURATION, TIME_STEP, n_workers=N_WORKERS, shard_by=SHARD_BY,
+                   resume=resume, checkpoint_interval=CHECKPOINT_INTERVAL)
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    args = parser.parse_args()
+    main(resume=args.resume)
@@ -12,8 +12,10 @@ class AgentState:
     is_traveling: bool = False
     active_trip_id: Optional[int] = None
     segment_index: Optional[int] = None
+    trip_index: Optional[int] = None  # flat trip row in AgentStore / its RouteKinematics
 
 from collections import defaultdict
+import numpy as np
 import pandas as pd
 
 # Load trip logs and agent profiles
@@ -31,27 +33,100 @@ for _, row in profiles.iterrows():
         current_activity="home"
     )
 
-def update_agent_states(current_time: pd.Timestamp):
-    active_agents = []
-
-    for agent_id, state in agent_states.items():
-        agent_log = logs[logs["agent_id"] == agent_id]
-        
-        # Find activity window that matches current time
-        match = agent_log[
-            (agent_log["start_time"] <= current_time) &
-            (agent_log["end_time"] > current_time)
-        ]
-
-        if not match.empty:
-            row = match.iloc[0]
-            state.current_time = current_time.strftime("%H:%M")
-            state.current_mode = row["mode"] if row["mode"] != "stay" else None
-            state.current_activity = row["activity"]
-            state.location_mucep = row["dest_mucep"] if row["mode"] != "stay" else row["origin_mucep"]
-            state.is_traveling = row["mode"] != "stay"
-            state.active_trip_id = row["trip_id"]
-            state.segment_index = row["segment"]
-            active_agents.append(agent_id)
-
-    return active_agents
+class AgentIntervalIndex:
+    """
+    Activity windows of the progression log, sorted by agent and start time.
+
+    Rows of agent a are offsets[a]:offsets[a + 1]. Each row is keyed by
+    agent code * (n_starts + 1) + rank of its start time, so the latest window
+    starting at or before t is found for every agent with one searchsorted.
+    Windows of an agent are assumed not to overlap. Empty windows (end <=
+    start) are never active and are left out; among windows sharing a start
+    the longest one is found.
+    """
+
+    def __init__(self, logs, agent_ids):
+        self.agent_ids = list(agent_ids)
+        n_agents = len(self.agent_ids)
+
+        code = pd.Categorical(logs["agent_id"], categories=self.agent_ids).codes.astype(np.int64)
+        start = pd.to_datetime(logs["start_time"]).to_numpy("datetime64[ns]").view(np.int64)
+        end = pd.to_datetime(logs["end_time"]).to_numpy("datetime64[ns]").view(np.int64)
+        keep = (code >= 0) & (end > start)
+        code, start, end = code[keep], start[keep], end[keep]
+        rows = logs[keep]
+
+        # Windows sharing a start are ordered by end, so the lookup lands on the longest
+        order = np.lexsort((end, start, code))
+        self.code = code[order]
+        self.start = start[order]
+        self.end = end[order]
+        self.starts = np.unique(self.start)
+        self.keys = self.code * (len(self.starts) + 1) + np.searchsorted(self.starts, self.start)
+        self.offsets = np.searchsorted(self.code, np.arange(n_agents + 1))
+
+        mode = rows["mode"].to_numpy(dtype=object)[order]
+        self.is_traveling = mode != "stay"
+        self.mode = np.where(self.is_traveling, mode, None)
+        self.activity = rows["activity"].to_numpy(dtype=object)[order]
+        self.location = np.where(
+            self.is_traveling,
+            rows["dest_mucep"].to_numpy(dtype=object)[order],
+            rows["origin_mucep"].to_numpy(dtype=object)[order],
+        )
+        self.trip_id = rows["trip_id"].to_numpy(dtype=object)[order]
+        self.segment = rows["segment"].to_numpy(dtype=object)[order]
+
+    def lookup(self, current_time):
+        """Agent positions with an active window at current_time, and their row numbers."""
+        t = pd.Timestamp(current_time).value
+        n_agents = len(self.agent_ids)
+        rank = np.searchsorted(self.starts, t, side="right") - 1
+        query = np.arange(n_agents, dtype=np.int64) * (len(self.starts) + 1) + rank
+        rows = np.searchsorted(self.keys, query, side="right") - 1
+
+        valid = rows >= self.offsets[:-1]
+        valid[valid] = self.end[rows[valid]] > t
+        return np.flatnonzero(valid), rows[valid]
+
+_interval_index = None
+
+def update_agent_states(current_time: pd.Timestamp, store=None):
+    """
+    store: optional AgentStore; each updated state then also gets the flat
+    row of its current trip (trip_index) for the shared kinematics table.
+    """
+    global _interval_index
+    if _interval_index is None:
+        _interval_index = AgentIntervalIndex(logs, agent_states.keys())
+    index = _interval_index
+
+    agents, rows = index.lookup(current_time)
+    agent_ids = [index.agent_ids[a] for a in agents.tolist()]
+    time_str = current_time.strftime("%H:%M")
+
+    # Gather all new values as arrays, then write them back in one pass
+    for agent_id, mode, activity, location, traveling, trip_id, segment in zip(
+        agent_ids,
+        index.mode[rows].tolist(),
+        index.activity[rows].tolist(),
+        index.location[rows].tolist(),
+        index.is_traveling[rows].tolist(),
+        index.trip_id[rows].tolist(),
+        index.segment[rows].tolist(),
+    ):
+        state = agent_states[agent_id]
+        state.current_time = time_str
+        state.current_mode = mode
+        state.current_activity = activity
+        state.location_mucep = location
+        state.is_traveling = traveling
+        state.active_trip_id = trip_id
+        state.segment_index = segment
+
+    if store is not None:
+        positions = pd.Index(store.agent_ids).get_indexer(agent_ids)
+        for agent_id, pos in zip(agent_ids, positions.tolist()):
+            agent_states[agent_id].trip_index = int(store.trip_index(pos)) if pos >= 0 else None
+
+    return agent_ids
@@ -0,0 +1,136 @@
+# agent_store.py
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from models.route_kinematics import RouteKinematics
+
+# Agent state codes (index into STATE_NAMES)
+AT_HOME = 0
+AT_ACTIVITY = 1
+TRAVELING = 2
+STATE_NAMES = np.array(["at_home", "at_activity", "traveling"], dtype=object)
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+
+class AgentStore:
+    """
+    Columnar agent store for the simulation engine.
+
+    Per-agent state lives in NumPy arrays indexed by agent position, and every
+    agent's schedule is flattened into per-trip arrays. An agent's current trip
+    is trip_offsets[i] + current_trip[i].
+    """
+
+    def __init__(self, agents_df):
+        n = len(agents_df)
+        self.agent_ids = agents_df["agent_id"].to_numpy()
+
+        if "state" in agents_df:
+            state = agents_df["state"].map(STATE_CODES).fillna(AT_HOME)
+            self.state = np.array(state, dtype=np.int8)
+        else:
+            self.state = np.full(n, AT_HOME, dtype=np.int8)
+
+        if "current_trip" in agents_df:
+            self.current_trip = np.array(agents_df["current_trip"].fillna(0), dtype=np.int32)
+        else:
+            self.current_trip = np.zeros(n, dtype=np.int32)
+
+        if "trip_start_time" in agents_df:
+            self.trip_start_time = np.array(agents_df["trip_start_time"], dtype=np.float64)
+        else:
+            self.trip_start_time = np.full(n, np.nan)
+        self.route_pos = np.zeros(n, dtype=np.float64)
+        if "home_mucep" in agents_df:
+            self.home_zone = agents_df["home_mucep"].to_numpy(dtype=object)
+        else:
+            self.home_zone = np.full(n, None, dtype=object)
+
+        geoms = np.asarray(agents_df.geometry.values, dtype=object)
+        self.x = shapely.get_x(geoms).astype(np.float64)
+        self.y = shapely.get_y(geoms).astype(np.float64)
+
+        # Flatten schedules into per-trip arrays
+        schedules = agents_df["schedule"].tolist()
+        counts = np.array([len(s) for s in schedules], dtype=np.int64)
+        self.trip_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.trip_offsets[1:])
+        self.n_trips = counts.astype(np.int32)
+
+        trips = [trip for schedule in schedules for trip in schedule]
+        self.trip_agent = np.repeat(np.arange(n, dtype=np.int64), counts)
+        self.trip_start = np.array([t["start_time"] for t in trips], dtype=np.float64)
+        self.trip_travel_time = np.array([t["travel_time"] for t in trips], dtype=np.float64)
+        self.trip_purpose = np.array([t["purpose"] for t in trips], dtype=object)
+        self.trip_mode = np.array([t["mode"] for t in trips], dtype=object)
+        routes = np.array([t["route"] for t in trips], dtype=object)
+        self.kinematics = RouteKinematics(routes, self.trip_travel_time)
+        self.trip_length = self.kinematics.length
+        self.trip_dest_zone = np.array([t.get("dest_mucep") for t in trips], dtype=object)
+        dest = np.array([t["destination_geom"] for t in trips], dtype=object)
+        self.trip_dest_x = shapely.get_x(dest).astype(np.float64)
+        self.trip_dest_y = shapely.get_y(dest).astype(np.float64)
+
+    def __len__(self):
+        return len(self.agent_ids)
+
+    def trip_index(self, idx):
+        """Flat trip index of the current trip for the agents in idx."""
+        return self.trip_offsets[idx] + self.current_trip[idx]
+
+    def departing_mask(self, time):
+        """Agents whose next trip starts at or before `time` and who are not traveling."""
+        mask = (self.current_trip < self.n_trips) & (self.state != TRAVELING)
+        idx = np.flatnonzero(mask)
+        mask[idx] = self.trip_start[self.trip_index(idx)] <= time
+        return mask
+
+    def traveling_mask(self):
+        return self.state == TRAVELING
+
+    def arrived_mask(self):
+        return self.state == AT_ACTIVITY
+
+    def depart(self, idx, time):
+        self.state[idx] = TRAVELING
+        self.trip_start_time[idx] = time
+        self.route_pos[idx] = 0.0
+
+    def advance(self, idx, time):
+        """
+        Move traveling agents along their routes to `time`.
+        Returns the subset of idx that reached the end of their route.
+        """
+        trips = self.trip_index(idx)
+        travel_time = self.trip_travel_time[trips]
+        elapsed = time - self.trip_start_time[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            progress = np.where(travel_time > 0, elapsed / travel_time, 1.0)
+        progress = np.clip(progress, 0.0, 1.0)
+
+        distance = progress * self.trip_length[trips]
+        self.route_pos[idx] = distance
+        self.x[idx], self.y[idx] = self.kinematics.positions(trips, distance)
+
+        return idx[progress >= 1.0]
+
+    def arrive(self, idx):
+        trips = self.trip_index(idx)
+        self.state[idx] = AT_ACTIVITY
+        self.x[idx] = self.trip_dest_x[trips]
+        self.y[idx] = self.trip_dest_y[trips]
+        self.current_trip[idx] += 1
+
+    def to_geodataframe(self, crs="EPSG:32651"):
+        """Build the agent GeoDataFrame (only needed at output time)."""
+        return gpd.GeoDataFrame(
+            {
+                "agent_id": self.agent_ids,
+                "state": STATE_NAMES[self.state],
+                "current_trip": self.current_trip,
+                "trip_start_time": self.trip_start_time,
+                "route_pos": self.route_pos,
+            },
+            geometry=gpd.points_from_xy(self.x, self.y),
+            crs=crs,
+        )
@@ -0,0 +1,76 @@
+# background_writer.py
+
+import atexit
+import queue
+import threading
+import numpy as np
+
+_STOP = object()
+
+def frozen_copy(array):
+    """Read-only copy of an array, safe to hand to the writer thread."""
+    array = np.array(array, copy=True)
+    array.setflags(write=False)
+    return array
+
+class BackgroundWriter:
+    """
+    Runs output jobs (fn, args, kwargs) on a worker thread, in submission order.
+
+    The job queue is bounded: submit() blocks once max_pending jobs are waiting,
+    so the simulation can never run more than max_pending outputs ahead of the
+    disk. close() drains the queue before returning. If a job fails, the
+    remaining jobs are skipped and the error is re-raised on the next
+    submit()/flush()/close(). A writer still open at interpreter exit is
+    closed then, so queued jobs are never dropped.
+    """
+
+    def __init__(self, max_pending=8, name="output-writer"):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._work, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is _STOP:
+                    return
+                if self._error is None:
+                    fn, args, kwargs = job
+                    fn(*args, **kwargs)
+            except BaseException as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Background output job failed") from error
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._thread.is_alive():
+            raise RuntimeError("BackgroundWriter is closed")
+        self._raise_error()
+        self._queue.put((fn, args, kwargs))
+
+    def flush(self):
+        """Block until every submitted job has run."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
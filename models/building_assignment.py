@@ -2,7 +2,6 @@ import pandas as pd
 import geopandas as gpd
 import numpy as np
 from pathlib import Path
-from tqdm import tqdm
 
 # File paths
 BUILDINGS_PATH = Path("data/processed/qc_buildings_tagged.gpkg")
@@ -10,6 +9,9 @@ TRIPS_PATH = Path("data/processed/mucep_form3_cleaned.csv")
 AGENTS_PATH = Path("data/processed/mucep_form2_cleaned.csv")
 OUTPUT_PATH = Path("data/processed/trips_with_destination_buildings.csv")
 
+# Optional building column to weight destination draws by (e.g. floor area); None draws uniformly
+WEIGHT_COL = None
+
 # Load files
 print("📦 Loading data...")
 buildings = gpd.read_file(BUILDINGS_PATH)
@@ -59,37 +61,111 @@ def work_tag_by_job(occupation, sector):
     else:
         return ["office"] if "private" in sec else ["government"]
 
-# Main assign function
-def assign_building(row):
-    zone = row["trip_dest_code"]
-    purpose = row["trip_purpose"]
-    age = row["2_age"]
-    occ = row["6_occupation"]
-    sector = row["7_employment_sector"]
-
-    if pd.isna(zone): return None
-    candidates = buildings[buildings["mucep_zone"] == zone]
-
-    # Attribute-based filtering
-    if purpose == 3:  # School
-        tag = school_tag_by_age(age)
-        candidates = candidates[candidates["tag"].str.contains(tag)]
-    elif purpose == 2:  # Work
-        tags = work_tag_by_job(occ, sector)
-        candidates = candidates[candidates["tag"].isin(tags)]
-    else:
-        tags = fallback_tags.get(purpose, [])
-        candidates = candidates[candidates["tag"].isin(tags)]
+class CandidateIndex:
+    """
+    Destination building candidates by (zone, tag).
 
-    if not candidates.empty:
-        return candidates.sample(1).iloc[0]["building_id"]
-    else:
-        return None
+    Zones and tags are factorized to integer codes and the buildings sorted
+    by (zone, tag) once, so the buildings of one zone with one tag are a
+    contiguous slice of building_ids. Candidate arrays (and cumulative
+    weights, with weight_col) are built once per (zone, set of tags) and
+    reused by every draw.
+    """
+
+    def __init__(self, buildings, zone_col="mucep_zone", tag_col="tag", id_col="building_id", weight_col=None):
+        zone_codes, self.zones = pd.factorize(buildings[zone_col])
+        tag_codes, self.tags = pd.factorize(buildings[tag_col])
+        order = np.lexsort((tag_codes, zone_codes))
+        self.building_ids = buildings[id_col].to_numpy()[order]
+        self.weights = None if weight_col is None else buildings[weight_col].fillna(0).to_numpy(dtype=float)[order]
+
+        keys = zone_codes[order].astype(np.int64) * (len(self.tags) + 1) + tag_codes[order]
+        uniq, start, count = np.unique(keys, return_index=True, return_counts=True)
+        self._slices = dict(zip(uniq.tolist(), zip(start.tolist(), (start + count).tolist())))
+        self._candidates = {}
+
+    def zone_codes(self, zones):
+        """Integer codes of zones; -1 for zones without buildings or missing."""
+        return pd.Index(self.zones).get_indexer(zones)
+
+    def tags_containing(self, text):
+        return tuple(np.flatnonzero(pd.Series(self.tags).str.contains(text, regex=False)).tolist())
+
+    def tags_in(self, tags):
+        codes = pd.Index(self.tags).get_indexer(list(tags))
+        return tuple(codes[codes >= 0].tolist())
+
+    def candidates(self, zone_code, tag_codes):
+        """Positions in building_ids of a zone's buildings with any of tag_codes, and their cumulative weights."""
+        key = (zone_code, tag_codes)
+        if key not in self._candidates:
+            base = zone_code * (len(self.tags) + 1)
+            parts = [np.arange(*self._slices[base + tag]) for tag in tag_codes if base + tag in self._slices]
+            positions = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+            cum_weights = None if self.weights is None else np.cumsum(self.weights[positions])
+            self._candidates[key] = (positions, cum_weights)
+        return self._candidates[key]
+
+    def sample(self, zone_code, tag_codes, size, rng):
+        """size building ids drawn with replacement (by weight if set); None if there is no candidate."""
+        if zone_code < 0:
+            return None
+        positions, cum_weights = self.candidates(zone_code, tag_codes)
+        if not len(positions):
+            return None
+        if cum_weights is None or cum_weights[-1] <= 0:
+            picks = rng.integers(len(positions), size=size)
+        else:
+            picks = np.searchsorted(cum_weights, rng.random(size) * cum_weights[-1], side="right")
+        return self.building_ids[positions[picks]]
+
+def trip_tag_rules(trips):
+    """
+    Tag rule of every trip as a hashable key: ("contains", tag) for school
+    trips (tag by age), ("in", tags) for work trips (tags by occupation and
+    sector) and for other purposes (fallback_tags).
+    """
+    rules = []
+    job_tags = {}
+    columns = ["trip_purpose", "2_age", "6_occupation", "7_employment_sector"]
+    for purpose, age, occ, sector in trips[columns].itertuples(index=False, name=None):
+        if purpose == 3:  # School
+            rules.append(("contains", school_tag_by_age(age)))
+        elif purpose == 2:  # Work
+            if (occ, sector) not in job_tags:
+                job_tags[occ, sector] = ("in", tuple(work_tag_by_job(occ, sector)))
+            rules.append(job_tags[occ, sector])
+        else:
+            rules.append(("in", tuple(fallback_tags.get(purpose, []))))
+    return pd.Series(rules, index=trips.index, dtype=object)
+
+def assign_buildings(trips, index, rng=None):
+    """
+    Destination building id per trip (None where no building matches),
+    drawn at once for each group of trips sharing a (zone, tag rule).
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    zone_codes = index.zone_codes(trips["trip_dest_code"])
+    rule_codes, rules = pd.factorize(trip_tag_rules(trips))
+    tag_codes = [index.tags_containing(value) if kind == "contains" else index.tags_in(value) for kind, value in rules]
+
+    groups, group_of = np.unique(zone_codes.astype(np.int64) * len(rules) + rule_codes, return_inverse=True)
+    order = np.argsort(group_of, kind="stable")
+    bounds = np.searchsorted(group_of[order], np.arange(len(groups) + 1))
+
+    dest = np.full(len(trips), None, dtype=object)
+    for g, group in enumerate(groups):
+        zone_code, rule_code = divmod(int(group), len(rules))
+        members = order[bounds[g]:bounds[g + 1]]
+        drawn = index.sample(zone_code, tag_codes[rule_code], len(members), rng)
+        if drawn is not None:
+            dest[members] = drawn
+    return dest
 
 # Assign destination building per trip
 print("🎯 Assigning destination buildings using agent attributes...")
-tqdm.pandas()
-trips["dest_building_id"] = trips.progress_apply(assign_building, axis=1)
+candidate_index = CandidateIndex(buildings, weight_col=WEIGHT_COL)
+trips["dest_building_id"] = assign_buildings(trips, candidate_index)
 
 # Save output
 trips.to_csv(OUTPUT_PATH, index=False)
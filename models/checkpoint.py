@@ -0,0 +1,97 @@
+# checkpoint.py
+
+import glob
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+CHECKPOINT_VERSION = 1
+
+# Per-agent arrays of the AgentStore that make up the simulation state
+AGENT_ARRAYS = ("state", "current_trip", "trip_start_time", "route_pos", "x", "y")
+
+# Per-trip arrays of the AgentStore that only depend on the run's inputs
+INPUT_ARRAYS = ("trip_offsets", "trip_start", "trip_travel_time", "trip_dest_x", "trip_dest_y")
+
+def input_fingerprint(store):
+    """
+    Hash of the agents and schedules an AgentStore was built from (not of
+    its changing state), so a checkpoint is only resumed with the same inputs.
+    """
+    h = hashlib.sha1("\x00".join(map(str, store.agent_ids)).encode())
+    for name in INPUT_ARRAYS:
+        h.update(np.ascontiguousarray(getattr(store, name)).tobytes())
+    for values in (store.trip_mode, store.trip_purpose, store.trip_dest_zone):
+        h.update("\x00".join(map(str, values)).encode())
+    h.update(np.ascontiguousarray(store.kinematics.x).tobytes())
+    h.update(np.ascontiguousarray(store.kinematics.y).tobytes())
+    return h.hexdigest()
+
+def checkpoint_path(checkpoint_dir, tick):
+    return os.path.join(checkpoint_dir, f"checkpoint_{tick:04}.npz")
+
+def latest_checkpoint(checkpoint_dir):
+    """Path of the checkpoint with the highest tick in checkpoint_dir, or None."""
+    ticks = {}
+    for path in glob.glob(os.path.join(checkpoint_dir, "checkpoint_*.npz")):
+        match = re.fullmatch(r"checkpoint_(\d+)\.npz", os.path.basename(path))
+        if match:
+            ticks[int(match.group(1))] = path
+    # Ticks are only zero-padded to 4 digits, so the names do not sort by tick
+    return ticks[max(ticks)] if ticks else None
+
+def clear_checkpoints(checkpoint_dir):
+    """Remove the checkpoints of an earlier run from checkpoint_dir."""
+    for path in glob.glob(os.path.join(checkpoint_dir, "checkpoint_*.npz")):
+        os.remove(path)
+
+def save_checkpoint(sim, path):
+    """
+    Write the engine state to a compressed .npz: clock, per-agent arrays,
+    pending travel log, event queue, RNG state, metric counters and the
+    engine settings.
+    The file is written next to `path` and moved into place, so a crash
+    mid-write never leaves a truncated checkpoint behind.
+    """
+    store = sim.store
+    agent_idx, trip_idx, events, timestamps = sim.log_arrays()
+    meta = {
+        "version": CHECKPOINT_VERSION,
+        "time": int(sim.time),
+        "tick": int(sim.tick),
+        "next_snapshot": int(sim.next_snapshot),
+        "next_checkpoint": int(sim.next_checkpoint),
+        "snapshot_part": int(sim.snapshot_part),
+        "snapshot_paths": list(sim.snapshot_paths),
+        "n_agents": len(store),
+        "n_trips": int(store.trip_offsets[-1]),
+        "inputs": input_fingerprint(store),
+        "config": sim.config(),
+        "rng_state": sim.rng.bit_generator.state,
+    }
+    arrays = {name: getattr(store, name) for name in AGENT_ARRAYS}
+    arrays.update(
+        log_agent=agent_idx, log_trip=trip_idx, log_event=events, log_timestamp=timestamps,
+        event_queue=np.array(sim.events, dtype=np.int64).reshape(-1, 3),
+        traveling=np.array(sorted(sim.traveling), dtype=np.int64),
+        meta=np.array(json.dumps(meta)),
+    )
+    if sim.metrics is not None:
+        arrays.update({f"metrics_{name}": value for name, value in sim.metrics.get_state().items()})
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """Returns (meta dict, dict of arrays)."""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files}
+    meta = json.loads(str(arrays.pop("meta")))
+    if meta["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {meta['version']} in {path}")
+    return meta, arrays
@@ -1,38 +1,143 @@
+import numpy as np
 import pandas as pd
-from collections import defaultdict
-
-metric_snapshots = []
-
-def collect_metrics(agent_states, current_time):
-    snapshot = {
-        "time": current_time.strftime("%H:%M"),
-        "total_agents": len(agent_states),
-        "num_traveling": 0,
-    }
-
-    # Mode share
-    mode_counts = defaultdict(int)
-    activity_counts = defaultdict(int)
-    zone_occupancy = defaultdict(int)
-    trip_starts = 0
-    trip_ends = 0
-
-    for state in agent_states.values():
-        if state.is_traveling:
-            snapshot["num_traveling"] += 1
-            if state.current_mode:
-                mode_counts[state.current_mode] += 1
-        else:
-            activity_counts[state.current_activity] += 1
-
-        zone_occupancy[state.location_mucep] += 1
-
-    # Flatten into snapshot dict
-    for mode, count in mode_counts.items():
-        snapshot[f"mode_{mode}"] = count
-    for act, count in activity_counts.items():
-        snapshot[f"act_{act}"] = count
-    for zone, count in zone_occupancy.items():
-        snapshot[f"zone_{zone}"] = count
-
-    metric_snapshots.append(snapshot)
+
+TOTAL_COLUMNS = ["total_agents", "num_traveling", "trip_starts", "trip_ends"]
+
+def activity_name(purpose):
+    """Activity key of a trip purpose: MUCEP purpose 1 (to home) is "home", the rest stay as they are."""
+    return "home" if str(purpose).strip() in ("1", "1.0", "home") else purpose
+
+class MetricsAggregator:
+    """
+    Incremental mode / activity / zone counters.
+
+    Each agent sits in one bucket per group: a mode while traveling, an
+    activity while not, and always a zone. The engine reports transitions for
+    the agents that changed (depart, arrive, move), and only those agents are
+    moved between buckets of the dense count arrays, so the cost scales with
+    the number of transitions rather than the population. Unknown codes (-1)
+    are not counted.
+
+    snapshot() appends one fixed-width row per group; to_frame() returns them
+    as a long table with the fixed schema (time, group, key, count).
+    """
+
+    def __init__(self, n_agents, modes, activities, zones, activity=None, zone=None):
+        self.n_agents = n_agents
+        self.vocab = {"mode": list(modes), "activity": list(activities), "zone": list(zones)}
+        self._codes = {group: {key: i for i, key in enumerate(keys)} for group, keys in self.vocab.items()}
+
+        self.traveling = np.zeros(n_agents, dtype=bool)
+        self.mode = np.full(n_agents, -1, dtype=np.int32)
+        self.activity = np.full(n_agents, -1, dtype=np.int32) if activity is None else np.asarray(activity, dtype=np.int32)
+        self.zone = np.full(n_agents, -1, dtype=np.int32) if zone is None else np.asarray(zone, dtype=np.int32)
+
+        self.mode_counts = np.zeros(len(self.vocab["mode"]), dtype=np.int64)
+        self.activity_counts = self._bincount(self.activity, "activity")
+        self.zone_counts = self._bincount(self.zone, "zone")
+        self.trip_starts = 0
+        self.trip_ends = 0
+        self._rows = {"time": [], "total": [], "mode": [], "activity": [], "zone": []}
+
+    def _bincount(self, codes, group):
+        codes = np.asarray(codes)
+        return np.bincount(codes[codes >= 0], minlength=len(self.vocab[group])).astype(np.int64)
+
+    def encode(self, group, values):
+        """Map raw mode / activity / zone values to codes (-1 if unknown)."""
+        codes = self._codes[group]
+        return np.array([codes.get(v, -1) for v in values], dtype=np.int32)
+
+    def _shift(self, counts, group, old, new):
+        counts -= self._bincount(old, group)
+        counts += self._bincount(new, group)
+
+    def update(self, agents, traveling, mode=None, activity=None, zone=None):
+        """Move `agents` to new buckets. None keeps an agent's current code."""
+        agents = np.asarray(agents, dtype=np.int64)
+        was_traveling = self.traveling[agents]
+        now_traveling = np.broadcast_to(np.asarray(traveling, dtype=bool), agents.shape)
+        old_mode, old_activity = self.mode[agents], self.activity[agents]
+        new_mode = old_mode if mode is None else np.asarray(mode, dtype=np.int32)
+        new_activity = old_activity if activity is None else np.asarray(activity, dtype=np.int32)
+
+        # Modes count traveling agents, activities count everyone else
+        self._shift(self.mode_counts, "mode", old_mode[was_traveling], new_mode[now_traveling])
+        self._shift(self.activity_counts, "activity", old_activity[~was_traveling], new_activity[~now_traveling])
+        if zone is not None:
+            zone = np.asarray(zone, dtype=np.int32)
+            self._shift(self.zone_counts, "zone", self.zone[agents], zone)
+            self.zone[agents] = zone
+
+        self.trip_starts += int(np.count_nonzero(~was_traveling & now_traveling))
+        self.trip_ends += int(np.count_nonzero(was_traveling & ~now_traveling))
+        self.traveling[agents] = now_traveling
+        self.mode[agents] = new_mode
+        self.activity[agents] = new_activity
+
+    def depart(self, agents, mode):
+        self.update(agents, True, mode=mode)
+
+    def arrive(self, agents, activity, zone=None):
+        self.update(agents, False, activity=activity, zone=zone)
+
+    def move(self, agents, zone):
+        agents = np.asarray(agents, dtype=np.int64)
+        self.update(agents, self.traveling[agents], zone=zone)
+
+    def snapshot(self, time):
+        rows = self._rows
+        rows["time"].append(time)
+        rows["total"].append([self.n_agents, int(self.traveling.sum()), self.trip_starts, self.trip_ends])
+        rows["mode"].append(self.mode_counts.copy())
+        rows["activity"].append(self.activity_counts.copy())
+        rows["zone"].append(self.zone_counts.copy())
+        self.trip_starts = 0
+        self.trip_ends = 0
+
+    def to_arrays(self):
+        """Snapshot times and one (snapshots x keys) count matrix per group."""
+        rows = self._rows
+        arrays = {"time": np.array(rows["time"]),
+                  "total": np.array(rows["total"], dtype=np.int64).reshape(-1, len(TOTAL_COLUMNS))}
+        for group in ("mode", "activity", "zone"):
+            arrays[group] = np.array(rows[group], dtype=np.int64).reshape(-1, len(self.vocab[group]))
+        return arrays
+
+    def to_frame(self):
+        arrays = self.to_arrays()
+        times = arrays["time"]
+        frames = []
+        for group, keys in [("total", TOTAL_COLUMNS), ("mode", self.vocab["mode"]),
+                            ("activity", self.vocab["activity"]), ("zone", self.vocab["zone"])]:
+            counts = arrays[group]
+            frames.append(pd.DataFrame({
+                "time": np.repeat(times, len(keys)),
+                "group": group,
+                "key": np.tile(np.array(keys, dtype=object), len(times)),
+                "count": counts.ravel(),
+            }))
+        return pd.concat(frames, ignore_index=True)
+
+    def get_state(self):
+        """Counter state as arrays (for checkpoints)."""
+        arrays = self.to_arrays()
+        return {
+            "traveling": self.traveling, "mode": self.mode, "activity": self.activity, "zone": self.zone,
+            "trips": np.array([self.trip_starts, self.trip_ends], dtype=np.int64),
+            "rows_time": arrays["time"].astype(np.int64), "rows_total": arrays["total"],
+            "rows_mode": arrays["mode"], "rows_activity": arrays["activity"], "rows_zone": arrays["zone"],
+        }
+
+    def set_state(self, state):
+        self.traveling = state["traveling"].astype(bool)
+        self.mode = state["mode"].astype(np.int32)
+        self.activity = state["activity"].astype(np.int32)
+        self.zone = state["zone"].astype(np.int32)
+        self.trip_starts, self.trip_ends = (int(v) for v in state["trips"])
+        self.mode_counts = self._bincount(self.mode[self.traveling], "mode")
+        self.activity_counts = self._bincount(self.activity[~self.traveling], "activity")
+        self.zone_counts = self._bincount(self.zone, "zone")
+        self._rows = {"time": state["rows_time"].tolist(), "total": list(state["rows_total"]),
+                      "mode": list(state["rows_mode"]), "activity": list(state["rows_activity"]),
+                      "zone": list(state["rows_zone"])}
@@ -1,28 +1,61 @@
 import geopandas as gpd
 import pandas as pd
-import matplotlib.pyplot as plt
-from shapely.geometry import Point
+import numpy as np
+from matplotlib.figure import Figure
+from shapely.geometry import Point, LineString
 import os
+from models.route_kinematics import RouteKinematics
 
 movement_snapshots = []
 
 def interpolate_position(route: LineString, progress: float):
     return route.interpolate(progress * route.length)
 
-def generate_movement_snapshot(agent_states, current_time):
-    rows = []
-
-    for agent_id, state in agent_states.items():
-        if not state.is_traveling or state.route is None:
-            continue
-
-        route = state.route
-        total_trip_time = state.current_trip_duration
-        time_in_trip = (current_time - state.trip_start_time).total_seconds() / 60
-
-        progress = min(1.0, max(0.0, time_in_trip / total_trip_time)) if total_trip_time > 0 else 1.0
-        location = interpolate_position(route, progress)
+def save_snapshot_map(gdf, title, out_path):
+    # Figure API instead of pyplot so this can run on a writer thread
+    fig = Figure(figsize=(10, 10))
+    ax = fig.subplots()
+    gdf.plot(ax=ax, color='blue', markersize=5)
+    ax.set_title(title)
+    ax.axis('off')
+    fig.savefig(out_path, dpi=150)
+
+def generate_movement_snapshot(agent_states, current_time, kinematics=None, writer=None):
+    """
+    kinematics: optional RouteKinematics shared with the engine, indexed by each
+    state's trip_index (the flat AgentStore trip row, not the MUCEP
+    active_trip_id). Without it, or for states with no trip_index, a table is
+    built for this step's routes.
+    writer: optional BackgroundWriter; the debug PNG is then rendered off-thread.
+    """
+    traveling = [
+        (agent_id, state) for agent_id, state in agent_states.items()
+        if state.is_traveling and state.route is not None
+    ]
+    if not traveling:
+        return
+
+    total_trip_time = np.array([s.current_trip_duration for _, s in traveling], dtype=np.float64)
+    time_in_trip = np.array(
+        [(current_time - s.trip_start_time).total_seconds() / 60 for _, s in traveling]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        progress = np.where(total_trip_time > 0, time_in_trip / total_trip_time, 1.0)
+
+    xs = np.empty(len(traveling))
+    ys = np.empty(len(traveling))
+    shared = np.zeros(len(traveling), dtype=bool)
+    if kinematics is not None:
+        trips = np.array([-1 if s.trip_index is None else s.trip_index for _, s in traveling], dtype=np.int64)
+        shared = trips >= 0
+        xs[shared], ys[shared] = kinematics.positions_at_progress(trips[shared], progress[shared])
+    local = np.flatnonzero(~shared)
+    if len(local):
+        local_kinematics = RouteKinematics([traveling[i][1].route for i in local])
+        xs[local], ys[local] = local_kinematics.positions_at_progress(np.arange(len(local)), progress[local])
 
+    rows = []
+    for agent_id, state in traveling:
         rows.append({
             "agent_id": agent_id,
             "household_id": state.household_id,
@@ -34,20 +67,19 @@ def generate_movement_snapshot(agent_states, current_time):
             "segment_time": state.segment_duration,
             "trip_start_time": state.trip_start_time.strftime("%H:%M"),
             "time": current_time.strftime("%H:%M"),
-            "geometry": location
         })
 
     if rows:
-        gdf = gpd.GeoDataFrame(rows, geometry="geometry", crs="EPSG:4326")
+        gdf = gpd.GeoDataFrame(rows, geometry=gpd.points_from_xy(xs, ys), crs="EPSG:4326")
         movement_snapshots.append((current_time.strftime("%H%M"), gdf))
 
         # Optional: save debug map image for the time step
-        fig, ax = plt.subplots(figsize=(10, 10))
-        gdf.plot(ax=ax, color='blue', markersize=5)
-        ax.set_title(f"Agent Snapshot @ {current_time.strftime('%H:%M')}")
-        plt.axis('off')
-        plt.savefig(f"outputs/animation_snapshots/map_{current_time.strftime('%H%M')}.png", dpi=150)
-        plt.close()
+        title = f"Agent Snapshot @ {current_time.strftime('%H:%M')}"
+        out_path = f"outputs/animation_snapshots/map_{current_time.strftime('%H%M')}.png"
+        if writer is not None:
+            writer.submit(save_snapshot_map, gdf.copy(), title, out_path)
+        else:
+            save_snapshot_map(gdf, title, out_path)
 
 def export_snapshots_to_geojson(output_dir="outputs/animation_snapshots"):
     os.makedirs(output_dir, exist_ok=True)
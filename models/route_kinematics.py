@@ -0,0 +1,91 @@
+# route_kinematics.py
+
+import numpy as np
+import shapely
+
+class RouteKinematics:
+    """
+    Per-trip route table stored as flat vertex arrays.
+
+    Vertices of all routes are concatenated; trip i owns vertices
+    offsets[i]:offsets[i + 1]. For every vertex we keep x/y, the distance along
+    its route (cum_dist) and the time since departure at which it is reached
+    (cum_time). A running distance over all routes (global_dist) is monotone,
+    so positions for any set of trips come from one searchsorted + lerp.
+    """
+
+    def __init__(self, routes, travel_times=None):
+        routes = np.asarray(routes, dtype=object)
+        counts = shapely.get_num_coordinates(routes).astype(np.int64)
+        coords = shapely.get_coordinates(routes)
+
+        # Routes need two vertices to interpolate on; pad degenerate ones with
+        # their single vertex (or NaN when empty)
+        short = np.flatnonzero(counts < 2)
+        if len(short):
+            ends = np.cumsum(counts)[short]
+            fill = np.full((len(short), 2), np.nan)
+            single = counts[short] == 1
+            fill[single] = coords[ends[single] - 1]
+            pad = 2 - counts[short]
+            coords = np.insert(coords, np.repeat(ends, pad), np.repeat(fill, pad, axis=0), axis=0)
+            counts = np.maximum(counts, 2)
+
+        self.offsets = np.zeros(len(routes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        self.x = coords[:, 0]
+        self.y = coords[:, 1]
+
+        seg_len = np.zeros(len(coords))
+        seg_len[1:] = np.hypot(np.diff(self.x), np.diff(self.y))
+        starts = self.offsets[:-1]
+        seg_len[starts] = 0.0
+        seg_len = np.nan_to_num(seg_len)
+
+        self.global_dist = np.cumsum(seg_len)
+        self.base = self.global_dist[starts]
+        self.length = self.global_dist[self.offsets[1:] - 1] - self.base
+        self.cum_dist = self.global_dist - np.repeat(self.base, counts)
+
+        if travel_times is None:
+            self.travel_time = np.full(len(routes), np.nan)
+            self.cum_time = np.full(len(coords), np.nan)
+        else:
+            self.travel_time = np.asarray(travel_times, dtype=np.float64)
+            route_len = np.repeat(self.length, counts)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                frac = np.where(route_len > 0, self.cum_dist / route_len, 1.0)
+            self.cum_time = frac * np.repeat(self.travel_time, counts)
+
+    def __len__(self):
+        return len(self.length)
+
+    def positions(self, trips, distance):
+        """x, y arrays at `distance` along each trip's route (clamped to the route)."""
+        trips = np.asarray(trips, dtype=np.int64)
+        distance = np.clip(distance, 0.0, self.length[trips])
+        query = self.base[trips] + distance
+
+        seg = np.searchsorted(self.global_dist, query, side="right") - 1
+        seg = np.clip(seg, self.offsets[trips], self.offsets[trips + 1] - 2)
+
+        d0 = self.global_dist[seg]
+        span = self.global_dist[seg + 1] - d0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(span > 0, (query - d0) / span, 0.0)
+        x = self.x[seg] + t * (self.x[seg + 1] - self.x[seg])
+        y = self.y[seg] + t * (self.y[seg + 1] - self.y[seg])
+        return x, y
+
+    def positions_at_progress(self, trips, progress):
+        """Positions at a fraction (0-1) of each trip's route length."""
+        trips = np.asarray(trips, dtype=np.int64)
+        return self.positions(trips, np.clip(progress, 0.0, 1.0) * self.length[trips])
+
+    def positions_at_time(self, trips, elapsed):
+        """Positions `elapsed` seconds after departure, assuming constant speed."""
+        trips = np.asarray(trips, dtype=np.int64)
+        travel_time = self.travel_time[trips]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            progress = np.where(travel_time > 0, elapsed / travel_time, 1.0)
+        return self.positions_at_progress(trips, progress)
@@ -1,35 +1,50 @@
 import geopandas as gpd
+from utils.config import N_WORKERS, ROUTE_CACHE_PATH, ROUTE_CACHE_SIZE
+from utils.geospatial import building_snap_table
+from utils.route_cache import RouteCache
 
 all_routes = []
 updated_agents = []
+route_cache = RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_PATH)
 
+agent_trips = []
+trip_refs = []
 for agent in agents_with_trips:
     for trip in agent["trips"]:
-        agent_trip = {
+        agent_trips.append({
             "agent_id": agent["agent_id"],
             "trip_id": trip["trip_id"],
             "origin_building_id": trip["origin_building_id"],
             "dest_building_id": trip["dest_building_id"],
             "predicted_mode": trip["predicted_mode"]
-        }
-
-        route, total_time, total_cost, used_mode = route_with_fallback(agent_trip, G_combined, buildings_df)
-
-        if route:
-            all_routes.extend(route)
-            trip.update({
-                "used_mode": used_mode,
-                "total_travel_time": total_time,
-                "total_travel_cost": total_cost
-            })
-        else:
-            trip.update({
-                "used_mode": None,
-                "total_travel_time": None,
-                "total_travel_cost": None
-            })
-
-    updated_agents.append(agent)
+        })
+        trip_refs.append(trip)
+
+# Every building is snapped to its nearest network node once, then all
+# trips are routed at once on a pool of N_WORKERS processes
+snap = building_snap_table(buildings_df, G_combined)
+routed = route_trips_with_fallback(agent_trips, G_combined, buildings_df, n_workers=N_WORKERS, cache=route_cache,
+                                   snap=snap)
+
+for trip, (route, total_time, total_cost, used_mode) in zip(trip_refs, routed):
+    if route:
+        all_routes.extend(route)
+        trip.update({
+            "used_mode": used_mode,
+            "total_travel_time": total_time,
+            "total_travel_cost": total_cost
+        })
+    else:
+        trip.update({
+            "used_mode": None,
+            "total_travel_time": None,
+            "total_travel_cost": None
+        })
+
+updated_agents.extend(agents_with_trips)
+
+route_cache.close()
+print(f"Route cache: {route_cache.stats()}")
 
 route_gdf = gpd.GeoDataFrame(all_routes, geometry="geometry", crs="EPSG:32651")  # or your preferred CRS
 route_gdf.to_file("data/processed/agent_routes.geojson", driver="GeoJSON")
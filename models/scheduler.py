@@ -59,40 +59,180 @@ def populate_scheduler(agent_profiles):
 
 import json
 from collections import defaultdict
+from itertools import count
 
-def simulate_day(scheduler, agent_profiles, agent_states, interval_minutes=5, output_path="outputs/agent_logs.json"):
+def write_json_log(payload, output_path):
+    with open(output_path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Saved simulation log to {output_path}")
+
+CHANGE_LOG_COLUMNS = ["timestep", "agent_id", "status", "location", "remaining_time"]
+
+class ChangeLogWriter:
+    """
+    Change-only progression log, streamed to CSV or Parquet in chunks.
+
+    A row is written only when an agent's status or location changes or a new
+    trip starts; the initial state of every agent is written at timestep -1.
+    remaining_time is the value at the end of that step and counts down by one
+    per step while in transit (see reconstruct_progression).
+    """
+
+    def __init__(self, output_path, chunk_size=100_000):
+        self.output_path = str(output_path)
+        self.chunk_size = chunk_size
+        self.rows = []
+        self.rows_written = 0
+        self._parquet_writer = None
+
+    def record(self, timestep, agent_id, state):
+        self.rows.append((timestep, agent_id, state["status"], state["location"], state["remaining_time"]))
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        chunk = pd.DataFrame(self.rows, columns=CHANGE_LOG_COLUMNS)
+        if self.output_path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            if self._parquet_writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self._parquet_writer = pq.ParquetWriter(self.output_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=self._parquet_writer.schema, preserve_index=False)
+            self._parquet_writer.write_table(table)
+        else:
+            chunk.to_csv(self.output_path, mode="w" if self.rows_written == 0 else "a",
+                         header=self.rows_written == 0, index=False)
+        self.rows_written += len(chunk)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+def read_change_log(change_log_path):
+    if str(change_log_path).endswith(".parquet"):
+        return pd.read_parquet(change_log_path)
+    return pd.read_csv(change_log_path)
+
+def reconstruct_progression(change_log_path, timesteps=None, total_steps=288):
+    """
+    Rebuild the full per-step view (one row per agent per timestep, as in
+    save_agent_progression_csv) from a change-only log. Pass `timesteps` to
+    materialize only some steps.
+    """
+    changes = read_change_log(change_log_path)
+    changes = changes.sort_values("timestep", kind="stable").rename(columns={"timestep": "changed_at"})
+    timesteps = np.arange(total_steps) if timesteps is None else np.sort(np.asarray(timesteps))
+    agent_ids = changes["agent_id"].unique()
+
+    grid = pd.DataFrame({
+        "timestep": np.repeat(timesteps, len(agent_ids)),
+        "agent_id": np.tile(agent_ids, len(timesteps)),
+    })
+    full = pd.merge_asof(grid, changes, left_on="timestep", right_on="changed_at",
+                         by="agent_id", allow_exact_matches=True)
+    in_transit = full["status"] == "in_transit"
+    elapsed = full["timestep"] - full["changed_at"]
+    full["remaining_time"] = np.where(in_transit, full["remaining_time"] - elapsed, full["remaining_time"])
+    return full[CHANGE_LOG_COLUMNS].reset_index(drop=True)
+
+def simulate_day(scheduler, agent_profiles, agent_states, interval_minutes=5, output_path="outputs/agent_logs.json", writer=None,
+                 log_format="full", change_log_path="outputs/agent_changes.csv", chunk_size=100_000,
+                 return_modal_time=False):
+    """
+    writer: optional BackgroundWriter; the JSON log is then written off-thread
+    (call writer.close() to make sure it is on disk).
+    log_format="changes" streams a change-only log to change_log_path (.csv or
+    .parquet) instead of keeping every agent's state for every step in
+    memory; the JSON then only holds the modal times and the log path, and
+    the change log path is returned. Use reconstruct_progression() to get the
+    per-step view back.
+
+    Only agents in transit are touched each step: trips are put on a timing
+    wheel keyed on their arrival step. Modal minutes are kept in a dense
+    agent x mode matrix; with return_modal_time=True the result is
+    (log, (modal_minutes, agent_ids, modes)).
+    """
     TOTAL_STEPS = 288  # 24h * (60 / 5min)
     time_log = []
-    
-    # Cumulative modal times
-    modal_time_tracker = defaultdict(lambda: defaultdict(int))  # agent_id → mode → total_minutes
+    change_log = ChangeLogWriter(change_log_path, chunk_size) if log_format == "changes" else None
+    if change_log is not None:
+        for agent_id, state in agent_states.items():
+            change_log.record(-1, agent_id, state)
+
+    # Cumulative modal times: agent code x mode code → total minutes
+    agent_ids = list(agent_states)
+    agent_code = {agent_id: i for i, agent_id in enumerate(agent_ids)}
+    modes = list(dict.fromkeys(
+        [s["current_trip"]["mode"] for s in agent_states.values() if s["status"] == "in_transit"]
+        + [trip["mode"] for t in range(TOTAL_STEPS) for trip in scheduler.get(t, [])]
+    ))
+    mode_code = {mode: j for j, mode in enumerate(modes)}
+    modal_minutes = np.zeros((len(agent_ids), len(modes)), dtype=np.int64)
+
+    # agent_id → (departure step, mode code, arrival step, trip token) for agents in transit
+    in_transit = {}
+    arrivals = defaultdict(list)  # arrival step → [(agent_id, trip token)]
+    tokens = count()  # a fresh token per boarding, so a superseded trip's arrival is ignored
+
+    def board(agent_id, trip, departed, remaining):
+        # In transit from step `departed` until remaining_time hits 0, and for at least one step
+        arrival = departed + max(remaining, 1) - 1
+        token = next(tokens)
+        in_transit[agent_id] = (departed, mode_code[trip["mode"]], arrival, token)
+        arrivals[arrival].append((agent_id, token))
+
+    def settle(agent_id, steps):
+        _, mode, _, _ = in_transit.pop(agent_id)
+        modal_minutes[agent_code[agent_id], mode] += steps * interval_minutes
+
+    # Agents already travelling at the start of the day
+    for agent_id, state in agent_states.items():
+        if state["status"] == "in_transit":
+            board(agent_id, state["current_trip"], 0, state["remaining_time"])
 
     for t in range(TOTAL_STEPS):
         active_trips = scheduler.get(t, [])
+        changed = {}  # agents touched this step, in a stable order
 
-        # Start new trips
+        # Start new trips (a new trip supersedes one still under way)
         for trip in active_trips:
             agent_id = trip["agent_id"]
+            if agent_id in in_transit:
+                settle(agent_id, t - in_transit[agent_id][0])
+            remaining = int(np.ceil(trip["travel_time"] / interval_minutes))
+            board(agent_id, trip, t, remaining)
             agent_states[agent_id]["status"] = "in_transit"
             agent_states[agent_id]["current_trip"] = trip
-            agent_states[agent_id]["remaining_time"] = int(np.ceil(trip["travel_time"] / interval_minutes))
+            agent_states[agent_id]["remaining_time"] = remaining - 1
+            changed[agent_id] = True
 
-        # Update ongoing trips
-        for agent_id, state in agent_states.items():
-            if state["status"] == "in_transit":
-                state["remaining_time"] -= 1
+        # Finish the trips arriving this step
+        for agent_id, token in arrivals.pop(t, ()):
+            if agent_id not in in_transit or in_transit[agent_id][3] != token:
+                continue  # superseded by a later trip
+            settle(agent_id, t - in_transit[agent_id][0] + 1)
+            state = agent_states[agent_id]
+            state["status"] = "idle"
+            state["location"] = state["current_trip"]["destination"]
+            state["current_trip"] = None
+            state["remaining_time"] = 0
+            changed[agent_id] = True
 
-                # Add to modal time
-                current_mode = state["current_trip"]["mode"]  # e.g., "walk", "bus", "rail"
-                modal_time_tracker[agent_id][current_mode] += interval_minutes
-
-                if state["remaining_time"] <= 0:
-                    state["status"] = "idle"
-                    state["location"] = state["current_trip"]["destination"]
-                    state["current_trip"] = None
-                    state["remaining_time"] = 0
+        if change_log is not None:
+            for agent_id in changed:
+                change_log.record(t, agent_id, agent_states[agent_id])
+            continue
 
         # Log snapshot
+        for agent_id, (_, _, arrival, _) in in_transit.items():
+            agent_states[agent_id]["remaining_time"] = arrival - t
         snapshot = {
             "timestep": t,
             "agent_states": {
@@ -106,16 +246,36 @@ def simulate_day(scheduler, agent_profiles, agent_states, interval_minutes=5, ou
         }
         time_log.append(snapshot)
 
-    # Save logs
-    with open(output_path, "w") as f:
-        json.dump({
-            "agent_progression": time_log,
-            "modal_time_tracker": modal_time_tracker
-        }, f, indent=2)
+    # Trips still under way at the end of the day
+    for agent_id, (departed, _, arrival, _) in list(in_transit.items()):
+        agent_states[agent_id]["remaining_time"] = arrival - (TOTAL_STEPS - 1)
+        settle(agent_id, TOTAL_STEPS - departed)
 
-    print(f"Saved simulation log to {output_path}")
+    # Save logs
+    modal_time_tracker = modal_time_to_dict(modal_minutes, agent_ids, modes)
+    payload = {
+        "agent_progression": time_log,
+        "modal_time_tracker": modal_time_tracker
+    }
+    if change_log is not None:
+        change_log.close()
+        payload = {"change_log": change_log.output_path, "modal_time_tracker": modal_time_tracker}
+        time_log = change_log.output_path
+    if writer is not None:
+        writer.submit(write_json_log, payload, output_path)
+    else:
+        write_json_log(payload, output_path)
+    if return_modal_time:
+        return time_log, (modal_minutes, agent_ids, modes)
     return time_log
 
+def modal_time_to_dict(modal_minutes, agent_ids, modes):
+    """agent_id → mode → total minutes, for the agent/mode pairs with any travel time."""
+    tracker = {}
+    for i, j in zip(*np.nonzero(modal_minutes)):
+        tracker.setdefault(agent_ids[i], {})[modes[j]] = int(modal_minutes[i, j])
+    return tracker
+
 import csv
 
 def save_agent_progression_csv(agent_progression, output_path="outputs/agent_progression.csv"):
@@ -142,8 +302,9 @@ def save_modal_time_csv(modal_time_tracker, output_path="outputs/agent_modal_tim
         row = {"agent_id": agent_id}
         row.update(modes)
         rows.append(row)
+    fieldnames = list(dict.fromkeys(key for row in rows for key in row))
     with open(output_path, "w", newline="") as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, restval=0)
         writer.writeheader()
         writer.writerows(rows)
     print(f"Saved modal time CSV to {output_path}")
@@ -0,0 +1,129 @@
+# sharded_runner.py
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from models.simulation_engine import EVENT_NAMES, make_engine
+from models.snapshot_stream import SnapshotStreamWriter, iter_snapshots
+from models.agent_store import STATE_NAMES
+from utils.config import OUTPUT_DIR
+
+# Shard keys: household or home MUCEP zone
+SHARD_COLUMNS = {"household": "household_id", "household_id": "household_id",
+                 "zone": "home_mucep", "home_mucep": "home_mucep"}
+
+def partition_agents(agents, n_shards, by="household_id"):
+    """
+    Split agents into n_shards groups of whole households (or home zones).
+
+    Groups are handed out largest-first to the least loaded shard, with ties
+    broken by key, so the split is balanced and the same on every run.
+    Returns one array of agent row positions per shard, in input order.
+    """
+    keys = agents[SHARD_COLUMNS[by]].astype(str).to_numpy()
+    uniq, inverse, sizes = np.unique(keys, return_inverse=True, return_counts=True)
+
+    load = np.zeros(n_shards, dtype=np.int64)
+    group_shard = np.empty(len(uniq), dtype=np.int64)
+    for g in np.lexsort((uniq, -sizes)):
+        shard = int(np.argmin(load))
+        group_shard[g] = shard
+        load[shard] += sizes[g]
+
+    agent_shard = group_shard[inverse]
+    return [np.flatnonzero(agent_shard == s) for s in range(n_shards)]
+
+def _run_shard(shard_id, agents, output_dir, resume, engine_kwargs):
+    shard_dir = os.path.join(output_dir, f"shard_{shard_id:03}")
+    sim = make_engine(agents, shard_dir, resume, verbose=False, **engine_kwargs)
+    sim.run()
+    metrics = sim.metrics.to_frame() if sim.metrics is not None else None
+    return sim.log_frame(), sim.snapshot_paths, metrics
+
+def merge_logs(shard_logs, agent_ids):
+    """Concatenate shard logs in the order a single engine would have logged them."""
+    logs = pd.concat(shard_logs, ignore_index=True)
+    position = pd.Series(np.arange(len(agent_ids)), index=pd.Index(agent_ids))
+    logs["_agent_pos"] = position.loc[logs["agent_id"]].to_numpy()
+    logs["_event"] = pd.Categorical(logs["event"], categories=EVENT_NAMES).codes
+    logs = logs.sort_values(["timestamp", "_event", "_agent_pos"], kind="stable")
+    return logs.drop(columns=["_agent_pos", "_event"]).reset_index(drop=True)
+
+def merge_metrics(shard_metrics):
+    """
+    Sum the shard metric tables (time, group, key, count) into one. Every
+    counter is additive over agents; a key missing from a shard counts 0.
+    """
+    metrics = pd.concat(shard_metrics, ignore_index=True)
+    metrics = metrics.groupby(["group", "time", "key"], sort=False, dropna=False)["count"].sum().reset_index()
+    metrics["_group"] = pd.Categorical(metrics["group"], categories=["total", "mode", "activity", "zone"]).codes
+    metrics = metrics.sort_values(["_group", "time"], kind="stable")
+    return metrics[["time", "group", "key", "count"]].reset_index(drop=True)
+
+def merge_snapshots(snapshot_paths, shard_positions, agent_ids, out_path, fmt="parquet"):
+    """
+    Interleave the shard snapshot streams back into one stream in global agent
+    order. snapshot_paths holds each shard's list of part files. Shards
+    snapshot on the same clock, so their i-th snapshots line up.
+    """
+    perm = np.concatenate(shard_positions)
+    n_agents = len(agent_ids)
+    streams = [iter_snapshots(parts) for parts in snapshot_paths]
+    with SnapshotStreamWriter(out_path, agent_ids, fmt=fmt, state_names=STATE_NAMES) as writer:
+        for snapshots in zip(*streams):
+            times = {time for time, _ in snapshots}
+            if len(times) != 1:
+                raise ValueError(f"Shard snapshots are out of step: times {sorted(times)}")
+            parts = [table for _, table in snapshots]
+            state = np.empty(n_agents, dtype=np.int8)
+            x = np.empty(n_agents)
+            y = np.empty(n_agents)
+            tick = parts[0]["tick"][0].as_py()
+            time = snapshots[0][0]
+            state[perm] = np.concatenate([p["state"].to_numpy() for p in parts])
+            x[perm] = np.concatenate([p["x"].to_numpy() for p in parts])
+            y[perm] = np.concatenate([p["y"].to_numpy() for p in parts])
+            writer.write(tick, time, state, x, y)
+
+def run_sharded(agents, n_workers=None, by="household_id", output_dir=OUTPUT_DIR, resume=False,
+                **engine_kwargs):
+    """
+    Run one SimulationEngine per shard of households (or home zones) in a
+    process pool, then merge the travel logs, snapshot streams and (with
+    collect_metrics) the agent metrics.
+
+    Agents do not interact, so the merged outputs match a single engine run
+    over all agents; x / y agree up to floating-point rounding, since route
+    distances are accumulated over each shard's own routes. Snapshots must
+    use a columnar format.
+    With resume=True each shard continues from its own latest checkpoint
+    (the partition is deterministic, so shards line up across runs).
+    """
+    n_workers = n_workers or os.cpu_count()
+    engine_kwargs.setdefault("snapshot_format", "parquet")
+    fmt = engine_kwargs["snapshot_format"]
+    if fmt == "geojson":
+        raise ValueError("Sharded runs need a columnar snapshot_format ('parquet' or 'arrow')")
+
+    os.makedirs(output_dir, exist_ok=True)
+    shard_positions = [p for p in partition_agents(agents, n_workers, by=by) if len(p)]
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [
+            pool.submit(_run_shard, i, agents.iloc[positions], output_dir, resume, engine_kwargs)
+            for i, positions in enumerate(shard_positions)
+        ]
+        results = [f.result() for f in futures]
+
+    agent_ids = agents["agent_id"].to_numpy()
+    shard_logs = [log for log, _, _ in results]
+    logs = merge_logs(shard_logs, agent_ids)
+    logs.to_csv(os.path.join(output_dir, "agent_travel_logs.csv"), index=False)
+
+    merge_snapshots([path for _, path, _ in results], shard_positions, agent_ids,
+                    os.path.join(output_dir, f"snapshots.{fmt}"), fmt=fmt)
+
+    shard_metrics = [metrics for _, _, metrics in results if metrics is not None]
+    if shard_metrics:
+        merge_metrics(shard_metrics).to_csv(os.path.join(output_dir, "agent_metrics.csv"), index=False)
+    return logs
@@ -1,99 +1,502 @@
 # simulation_engine.py
 
+import contextlib
+import heapq
+import numpy as np
 import pandas as pd
 import geopandas as gpd
-import shapely
-from shapely.geometry import Point, LineString
-from shapely.ops import substring
 import os
-from utils.config import TIME_STEP,OUTPUT_DIR
+from models.agent_store import AgentStore, STATE_NAMES
+from models.snapshot_stream import (SnapshotStreamWriter, SNAPSHOT_FORMATS, concat_snapshot_streams,
+                                    truncate_snapshot_stream)
+from models.background_writer import BackgroundWriter, frozen_copy
+from models.metrics_hook import MetricsAggregator, activity_name
+from models.checkpoint import (AGENT_ARRAYS, checkpoint_path, clear_checkpoints, input_fingerprint,
+                               latest_checkpoint, load_checkpoint, save_checkpoint)
+from utils.config import TIME_STEP,SIM_DURATION,SHARD_BY,OUTPUT_DIR
 from datetime import datetime
 
 # Simulation tick size in seconds (5 minutes)
 TICK_SIZE = TIME_STEP
 MAX_TIME = 86100  # 11:55 PM
 
+# Event codes used in the travel log
+DEPART = 0
+ARRIVE = 1
+EVENT_NAMES = np.array(["DEPART", "ARRIVE"], dtype=object)
+
+def ceil_to_tick(times, tick_size=TICK_SIZE):
+    """Smallest multiple of tick_size that is >= each time (NaN stays NaN)."""
+    times = np.asarray(times, dtype=np.float64)
+    k = np.ceil(times / tick_size)
+    # Guard against rounding in the division pushing k one tick too far
+    k = np.where((k - 1) * tick_size >= times, k - 1, k)
+    return k * tick_size
+
 class SimulationEngine:
-    def __init__(self, agents_df, output_dir=OUTPUT_DIR):
-        self.agents = agents_df.copy()
+    """
+    scheduling="tick" re-examines every agent on each tick. scheduling="event"
+    keeps a heap of pending departure/arrival events (snapped to the tick grid,
+    so outputs match tick mode) and only touches agents that have an event due
+    or are currently traveling.
+
+    snapshot_format="geojson" writes one file per snapshot; "parquet" or "arrow"
+    append every snapshot to a single columnar file (snapshots.parquet /
+    snapshots.arrow). snapshot_interval (seconds, a multiple of tick_size)
+    sets how often snapshots are taken, independently of the tick size.
+
+    background_output=True hands read-only copies of the snapshot arrays to a
+    BackgroundWriter thread so serialization overlaps with the next ticks; at
+    most max_pending_outputs snapshots can be waiting to be written.
+
+    checkpoint_interval (seconds of simulated time) periodically saves the
+    engine state to checkpoint_dir; SimulationEngine.resume() continues a run
+    from such a checkpoint. Columnar snapshot streams start a new part file
+    (snapshots.partNNN.<fmt>) at every checkpoint so a crash never corrupts
+    snapshots written before it.
+
+    collect_metrics=True keeps a MetricsAggregator fed with every departure
+    and arrival; it records a row at each snapshot and is written to
+    agent_metrics.csv at the end of the run.
+    """
+
+    def __init__(self, agents_df, output_dir=OUTPUT_DIR, scheduling="tick",
+                 snapshot_format="geojson", snapshot_interval=None,
+                 background_output=False, max_pending_outputs=8,
+                 tick_size=TICK_SIZE, max_time=MAX_TIME, verbose=True,
+                 checkpoint_interval=None, checkpoint_dir=None, seed=None,
+                 collect_metrics=False):
+        if scheduling not in ("tick", "event"):
+            raise ValueError(f"Unknown scheduling mode: {scheduling}")
+        if snapshot_format not in ("geojson",) + SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {snapshot_format}")
+        snapshot_interval = snapshot_interval or tick_size
+        if snapshot_interval % tick_size:
+            raise ValueError(f"snapshot_interval must be a multiple of the tick size ({tick_size}s)")
+        self.tick_size = tick_size
+        self.max_time = max_time
+        self.verbose = verbose
+        self.scheduling = scheduling
+        self.snapshot_format = snapshot_format
+        self.snapshot_interval = snapshot_interval
+        self.store = AgentStore(agents_df)
         self.time = 0
         self.tick = 0
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
+        # Travel log kept as chunks of (agent index, trip index, event code, timestamp)
         self.logs = []
         self.snapshots = []
+        # Event mode: heap of (time, event code, agent index) and the set of traveling agents
+        self.events = []
+        self.traveling = set()
+        self.next_snapshot = self.time
+        self.snapshot_writer = None
+        self.snapshot_part = 0
+        self.snapshot_paths = []
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_dir = checkpoint_dir or os.path.join(output_dir, "checkpoints")
+        self.next_checkpoint = self.time + (checkpoint_interval or 0)
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.started = False
+        self.metrics = self.init_metrics() if collect_metrics else None
+        self.writer = BackgroundWriter(max_pending_outputs) if background_output else None
+
+    @property
+    def agents(self):
+        return self.store.to_geodataframe()
+
+    def init_metrics(self):
+        store = self.store
+        zones = pd.unique(np.concatenate([store.home_zone, store.trip_dest_zone]))
+        zones = [z for z in zones if not pd.isna(z)]
+        # Trips home end in the same "home" activity every agent starts in
+        trip_activity = np.array([activity_name(p) for p in store.trip_purpose], dtype=object)
+        activities = ["home"] + [a for a in pd.unique(trip_activity) if a != "home"]
+        metrics = MetricsAggregator(len(store), pd.unique(store.trip_mode), activities, zones)
+        metrics.update(np.arange(len(store)), False, activity=np.zeros(len(store), dtype=np.int32),
+                       zone=metrics.encode("zone", store.home_zone))
+
+        # Codes per trip, so transitions are reported without any lookups
+        self.trip_mode_code = metrics.encode("mode", store.trip_mode)
+        self.trip_activity_code = metrics.encode("activity", trip_activity)
+        self.trip_zone_code = metrics.encode("zone", store.trip_dest_zone)
+        return metrics
+
+    def report_metrics(self, agent_idx, trip_idx, event_type):
+        metrics = self.metrics
+        if event_type == DEPART:
+            metrics.depart(agent_idx, self.trip_mode_code[trip_idx])
+        else:
+            # Keep the current zone when the destination zone is unknown
+            zone = self.trip_zone_code[trip_idx]
+            zone = np.where(zone >= 0, zone, metrics.zone[agent_idx])
+            metrics.arrive(agent_idx, self.trip_activity_code[trip_idx], zone)
+
+    def config(self):
+        """Settings needed to rebuild an equivalent engine on resume."""
+        return {
+            "scheduling": self.scheduling,
+            "snapshot_format": self.snapshot_format,
+            "snapshot_interval": self.snapshot_interval,
+            "tick_size": self.tick_size,
+            "max_time": self.max_time,
+            "checkpoint_interval": self.checkpoint_interval,
+            "seed": self.seed,
+            "collect_metrics": self.metrics is not None,
+        }
+
+    @classmethod
+    def resume(cls, agents_df, checkpoint=None, output_dir=OUTPUT_DIR, **kwargs):
+        """
+        Rebuild an engine from a checkpoint file (default: the latest one in
+        output_dir/checkpoints). agents_df must be the same input the
+        checkpointed run was started with.
+        """
+        checkpoint = checkpoint or latest_checkpoint(
+            kwargs.get("checkpoint_dir") or os.path.join(output_dir, "checkpoints")
+        )
+        if checkpoint is None:
+            raise FileNotFoundError(f"No checkpoint found for {output_dir}")
+        meta, arrays = load_checkpoint(checkpoint)
+        sim = cls(agents_df, output_dir=output_dir, **{**meta["config"], **kwargs})
+        sim.load_state(meta, arrays)
+        return sim
+
+    def load_state(self, meta, arrays):
+        store = self.store
+        if meta.get("inputs") != input_fingerprint(store):
+            raise ValueError("Checkpoint does not match the agents/schedules given")
+        for name in AGENT_ARRAYS:
+            getattr(store, name)[:] = arrays[name]
+        self.time = meta["time"]
+        self.tick = meta["tick"]
+        self.next_snapshot = meta["next_snapshot"]
+        self.next_checkpoint = meta["next_checkpoint"]
+        self.snapshot_part = meta["snapshot_part"]
+        self.snapshot_paths = meta["snapshot_paths"]
+        if self.snapshot_format in SNAPSHOT_FORMATS:
+            # A run that already finished merged its parts into one file; drop the ticks this run writes again
+            merged = self.merged_snapshot_path()
+            if os.path.exists(merged) and truncate_snapshot_stream(merged, self.tick):
+                self.snapshot_paths = [merged]
+        self.rng.bit_generator.state = meta["rng_state"]
+        self.logs = [(arrays["log_agent"], arrays["log_trip"], arrays["log_event"], arrays["log_timestamp"])]
+        self.events = [tuple(e) for e in arrays["event_queue"].tolist()]
+        heapq.heapify(self.events)
+        self.traveling = set(arrays["traveling"].tolist())
+        if self.metrics is not None:
+            self.metrics.set_state({name[len("metrics_"):]: value for name, value in arrays.items()
+                                    if name.startswith("metrics_")})
+        self.started = True
+
+    def save_checkpoint(self):
+        # Close the current snapshot part so everything before the checkpoint is complete on disk
+        self.output(self.close_snapshot_stream)
+        self.snapshot_part += 1
+        if self.writer is not None:
+            self.writer.flush()
+        path = checkpoint_path(self.checkpoint_dir, self.tick)
+        save_checkpoint(self, path)
+        if self.verbose:
+            print(f"[Checkpoint] {path}")
 
     def run(self):
-        while self.time <= MAX_TIME:
-            print(f"[Tick {self.tick}] Time: {self.time // 3600:02}:{(self.time % 3600) // 60:02}")
-            self.tick_agents()
-            self.save_snapshot()
-            self.time += TICK_SIZE
-            self.tick += 1
-        self.save_logs()
+        if not self.started and self.checkpoint_interval:
+            # A fresh run must never be resumed from an earlier run's checkpoints
+            clear_checkpoints(self.checkpoint_dir)
+        if self.scheduling == "event" and not self.started:
+            self.init_events()
+        self.started = True
+        finished = False
+        try:
+            while self.time <= self.max_time:
+                if self.verbose:
+                    print(f"[Tick {self.tick}] Time: {self.time // 3600:02}:{(self.time % 3600) // 60:02}")
+                snapshot_due = self.time >= self.next_snapshot
+                if self.scheduling == "event":
+                    self.process_events(update_positions=snapshot_due)
+                else:
+                    self.tick_agents()
+                if snapshot_due:
+                    self.save_snapshot()
+                    self.next_snapshot += self.snapshot_interval
+                self.advance_clock()
+                if self.checkpoint_interval and self.time >= self.next_checkpoint and self.time <= self.max_time:
+                    while self.next_checkpoint <= self.time:
+                        self.next_checkpoint += self.checkpoint_interval
+                    self.save_checkpoint()
+            finished = True
+        finally:
+            if finished:
+                self.close()
+            else:
+                # Keep the snapshots written so far readable; the run's own error is re-raised
+                with contextlib.suppress(Exception):
+                    self.close_output()
+
+    def advance_clock(self):
+        if self.scheduling == "event":
+            # Jump straight to the next tick with an event or a snapshot
+            next_time = self.next_snapshot
+            if self.events:
+                next_time = min(next_time, self.events[0][0])
+            self.time = max(next_time, self.time + self.tick_size)
+        else:
+            self.time += self.tick_size
+        self.tick = self.time // self.tick_size
+
+    def output(self, fn, *args):
+        """Run an output job, on the writer thread when background output is on."""
+        if self.writer is not None:
+            self.writer.submit(fn, *args)
+        else:
+            fn(*args)
+
+    def close(self):
+        try:
+            self.output(self.close_snapshot_stream)
+            self.save_logs()
+            if self.metrics is not None:
+                metrics_path = os.path.join(self.output_dir, "agent_metrics.csv")
+                self.output(self.write_logs, self.metrics.to_frame(), metrics_path)
+        finally:
+            self.close_output()
+        self.merge_snapshot_parts()
+
+    def merge_snapshot_parts(self):
+        """Concatenate the snapshot parts split at checkpoints into one snapshots.<fmt> file."""
+        merged = self.merged_snapshot_path()
+        if self.snapshot_paths and self.snapshot_paths != [merged]:
+            concat_snapshot_streams(self.snapshot_paths, merged)
+            self.snapshot_paths = [merged]
+
+    def close_output(self):
+        """Run the queued output jobs, stop the writer thread and finish the snapshot stream."""
+        writer, self.writer = self.writer, None
+        try:
+            if writer is not None:
+                writer.close()
+        finally:
+            self.close_snapshot_stream()
+
+    def close_snapshot_stream(self):
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.close()
+            self.snapshot_writer = None
 
     def tick_agents(self):
-        for idx, agent in self.agents.iterrows():
-            agent_id = agent['agent_id']
-            state = agent['state']
-            schedule = agent['schedule']
-            current_trip = agent.get('current_trip', 0)
-
-            # Check if new trip starts
-            if current_trip < len(schedule):
-                trip_info = schedule[current_trip]
-                if self.time >= trip_info['start_time'] and state != 'traveling':
-                    # Start new trip
-                    self.agents.at[idx, 'state'] = 'traveling'
-                    self.agents.at[idx, 'trip_start_time'] = self.time
-                    self.agents.at[idx, 'route_pos'] = 0.0
-                    self.log_event(agent_id, 'DEPART', trip_info)
-
-            # Process traveling agents
-            if state == 'traveling':
-                trip_info = schedule[current_trip]
-                route = trip_info['route']
-                travel_time = trip_info['travel_time']
-                segment_speed = route.length / travel_time  # units per sec
-                time_elapsed = self.time - agent.get('trip_start_time', self.time)
-                distance_traveled = min(segment_speed * time_elapsed, route.length)
-
-                # Update position
-                new_pos = substring(route, 0, distance_traveled)
-                self.agents.at[idx, 'geometry'] = new_pos.interpolate(1.0, normalized=True)
-
-                # Check for arrival
-                if distance_traveled >= route.length:
-                    self.agents.at[idx, 'state'] = 'at_activity'
-                    self.agents.at[idx, 'geometry'] = trip_info['destination_geom']
-                    self.agents.at[idx, 'current_trip'] = current_trip + 1
-                    self.log_event(agent_id, 'ARRIVE', trip_info)
-
-    def log_event(self, agent_id, event_type, trip_info):
-        self.logs.append({
-            'agent_id': agent_id,
-            'event': event_type,
-            'trip_purpose': trip_info['purpose'],
-            'mode': trip_info['mode'],
-            'start_time': trip_info['start_time'],
-            'duration': trip_info['travel_time'],
-            'timestamp': self.time
+        store = self.store
+
+        # Masks are taken before any update so new departures start moving next tick
+        departing = np.flatnonzero(store.departing_mask(self.time))
+        traveling = np.flatnonzero(store.traveling_mask())
+
+        # Start new trips
+        if len(departing):
+            store.depart(departing, self.time)
+            self.log_event(departing, store.trip_index(departing), DEPART)
+
+        # Process traveling agents
+        if len(traveling):
+            arrived = store.advance(traveling, self.time)
+            if len(arrived):
+                trips = store.trip_index(arrived)
+                store.arrive(arrived)
+                self.log_event(arrived, trips, ARRIVE)
+
+    def init_events(self):
+        store = self.store
+        self.events = []
+        traveling = np.flatnonzero(store.traveling_mask())
+        self.traveling = set(traveling.tolist())
+
+        # Agents already on a trip arrive on the first tick past start + travel time
+        if len(traveling):
+            trips = store.trip_index(traveling)
+            due = store.trip_start_time[traveling] + store.trip_travel_time[trips]
+            arrival = np.maximum(ceil_to_tick(due - self.time, self.tick_size), 0) + self.time
+            self.push_events(arrival, ARRIVE, traveling)
+
+        idle = np.flatnonzero(~store.traveling_mask())
+        self.schedule_departures(idle, self.time)
+
+    def push_events(self, times, event_type, agent_idx):
+        valid = np.isfinite(times)
+        for t, i in zip(times[valid].astype(np.int64).tolist(), agent_idx[valid].tolist()):
+            heapq.heappush(self.events, (t, event_type, i))
+
+    def schedule_departures(self, agent_idx, earliest):
+        """Queue the next trip of each agent no earlier than `earliest`."""
+        store = self.store
+        agent_idx = agent_idx[store.current_trip[agent_idx] < store.n_trips[agent_idx]]
+        if len(agent_idx):
+            start = store.trip_start[store.trip_index(agent_idx)]
+            self.push_events(np.maximum(ceil_to_tick(start, self.tick_size), earliest), DEPART, agent_idx)
+
+    def schedule_arrivals(self, agent_idx):
+        """Queue arrivals for agents that departed at the current time."""
+        travel_time = self.store.trip_travel_time[self.store.trip_index(agent_idx)]
+        # Departing agents are first moved on the following tick
+        ticks = np.maximum(ceil_to_tick(travel_time, self.tick_size), self.tick_size)
+        self.push_events(self.time + ticks, ARRIVE, agent_idx)
+
+    def pop_due_events(self):
+        departing, arriving = [], []
+        while self.events and self.events[0][0] <= self.time:
+            _, event_type, agent = heapq.heappop(self.events)
+            (departing if event_type == DEPART else arriving).append(agent)
+        return np.array(sorted(departing), dtype=np.int64), np.array(sorted(arriving), dtype=np.int64)
+
+    def process_events(self, update_positions=True):
+        store = self.store
+        departing, arriving = self.pop_due_events()
+        moving = np.fromiter(self.traveling.difference(arriving.tolist()), dtype=np.int64)
+
+        if len(departing):
+            store.depart(departing, self.time)
+            self.log_event(departing, store.trip_index(departing), DEPART)
+
+        if len(arriving):
+            arrived = store.advance(arriving, self.time)
+            # Rounding can leave an agent a hair short of the end; retry next tick
+            late = np.setdiff1d(arriving, arrived)
+            self.push_events(np.full(len(late), self.time + self.tick_size), ARRIVE, late)
+            if len(arrived):
+                trips = store.trip_index(arrived)
+                store.arrive(arrived)
+                self.log_event(arrived, trips, ARRIVE)
+                self.traveling.difference_update(arrived.tolist())
+                self.schedule_departures(arrived, self.time + self.tick_size)
+
+        # Move agents still en route so snapshots show their current position
+        if update_positions and len(moving):
+            store.advance(moving, self.time)
+
+        if len(departing):
+            self.traveling.update(departing.tolist())
+            self.schedule_arrivals(departing)
+
+    def log_event(self, agent_idx, trip_idx, event_type):
+        self.logs.append((
+            np.asarray(agent_idx, dtype=np.int64),
+            np.asarray(trip_idx, dtype=np.int64),
+            np.full(len(agent_idx), event_type, dtype=np.int8),
+            np.full(len(agent_idx), self.time, dtype=np.int64),
+        ))
+        if self.metrics is not None:
+            self.report_metrics(agent_idx, trip_idx, event_type)
+
+    def log_arrays(self):
+        """The travel log as (agent index, trip index, event code, timestamp) arrays."""
+        if self.logs:
+            return tuple(np.concatenate(c) for c in zip(*self.logs))
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.int8), empty
+
+    def log_frame(self):
+        store = self.store
+        agent_idx, trip_idx, events, timestamps = self.log_arrays()
+        return pd.DataFrame({
+            'agent_id': store.agent_ids[agent_idx],
+            'event': EVENT_NAMES[events],
+            'trip_purpose': store.trip_purpose[trip_idx],
+            'mode': store.trip_mode[trip_idx],
+            'start_time': store.trip_start[trip_idx],
+            'duration': store.trip_travel_time[trip_idx],
+            'timestamp': timestamps
         })
 
     def save_snapshot(self):
-        gdf = self.agents[['agent_id', 'state', 'geometry']].copy()
-        gdf = gpd.GeoDataFrame(gdf, geometry='geometry', crs='EPSG:32651')
-        out_path = os.path.join(self.output_dir, f"snapshot_{self.tick:04}.geojson")
+        if self.metrics is not None:
+            self.metrics.snapshot(self.time)
+        store = self.store
+        state, x, y = frozen_copy(store.state), frozen_copy(store.x), frozen_copy(store.y)
+        if self.snapshot_format == "geojson":
+            self.output(self.write_geojson_snapshot, self.tick, state, x, y)
+        else:
+            self.output(self.write_stream_snapshot, self.snapshot_path(), self.tick, self.time, state, x, y)
+
+    def merged_snapshot_path(self):
+        return os.path.join(self.output_dir, f"snapshots.{self.snapshot_format}")
+
+    def snapshot_path(self):
+        if self.snapshot_part == 0:
+            path = self.merged_snapshot_path()
+        else:
+            path = os.path.join(self.output_dir, f"snapshots.part{self.snapshot_part:03}.{self.snapshot_format}")
+        if path not in self.snapshot_paths:
+            self.snapshot_paths.append(path)
+        return path
+
+    def write_geojson_snapshot(self, tick, state, x, y):
+        gdf = gpd.GeoDataFrame(
+            {'agent_id': self.store.agent_ids, 'state': STATE_NAMES[state]},
+            geometry=gpd.points_from_xy(x, y), crs='EPSG:32651'
+        )
+        out_path = os.path.join(self.output_dir, f"snapshot_{tick:04}.geojson")
         gdf.to_file(out_path, driver='GeoJSON')
 
+    def write_stream_snapshot(self, out_path, tick, time, state, x, y):
+        if self.snapshot_writer is not None and self.snapshot_writer.path != str(out_path):
+            self.close_snapshot_stream()
+        if self.snapshot_writer is None:
+            self.snapshot_writer = SnapshotStreamWriter(
+                out_path, self.store.agent_ids, fmt=self.snapshot_format, state_names=STATE_NAMES
+            )
+        self.snapshot_writer.write(tick, time, state, x, y)
+
     def save_logs(self):
-        log_df = pd.DataFrame(self.logs)
+        log_df = self.log_frame()
         log_path = os.path.join(self.output_dir, "agent_travel_logs.csv")
+        self.output(self.write_logs, log_df, log_path)
+
+    def write_logs(self, log_df, log_path):
         log_df.to_csv(log_path, index=False)
 
 
+def run_simulation(agents, sim_duration=SIM_DURATION, time_step=TIME_STEP, n_workers=1,
+                   shard_by=SHARD_BY, output_dir=OUTPUT_DIR, resume=False, **engine_kwargs):
+    """
+    Run a day of simulation. With n_workers > 1 agents are sharded by
+    household (or home zone) across a process pool; see sharded_runner.
+    resume=True continues from the latest checkpoint when there is one.
+    """
+    engine_kwargs.update(tick_size=time_step, max_time=sim_duration - time_step)
+    if n_workers > 1:
+        from models.sharded_runner import run_sharded
+        return run_sharded(agents, n_workers=n_workers, by=shard_by, output_dir=output_dir,
+                           resume=resume, **engine_kwargs)
+
+    sim = make_engine(agents, output_dir, resume, **engine_kwargs)
+    sim.run()
+    return sim.log_frame()
+
+
+def make_engine(agents, output_dir, resume=False, **engine_kwargs):
+    """New engine, or one restored from the latest checkpoint when resuming."""
+    checkpoint_dir = engine_kwargs.get("checkpoint_dir") or os.path.join(output_dir, "checkpoints")
+    if resume and latest_checkpoint(checkpoint_dir):
+        return SimulationEngine.resume(agents, output_dir=output_dir, **engine_kwargs)
+    return SimulationEngine(agents, output_dir=output_dir, **engine_kwargs)
+
+
 # Example usage (if run as script)
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", nargs="?", const="latest", default=None,
+                        help="continue from a checkpoint file (default: the latest one)")
+    parser.add_argument("--checkpoint-interval", type=int, default=3600,
+                        help="seconds of simulated time between checkpoints")
+    args = parser.parse_args()
+
     agents = gpd.read_file("data/processed/agent_profiles.geojson")  # Preloaded with schedule, routes, etc.
-    sim = SimulationEngine(agents)
+    if args.resume:
+        checkpoint = None if args.resume == "latest" else args.resume
+        sim = SimulationEngine.resume(agents, checkpoint)
+    else:
+        sim = SimulationEngine(agents, checkpoint_interval=args.checkpoint_interval)
     sim.run()
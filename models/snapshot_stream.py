@@ -0,0 +1,212 @@
+# snapshot_stream.py
+
+import json
+import os
+import numpy as np
+import geopandas as gpd
+
+SNAPSHOT_FORMATS = ("parquet", "arrow")
+
+class SnapshotStreamWriter:
+    """
+    Appends agent snapshots to a single columnar file, one row group (Parquet)
+    or record batch (Arrow IPC) per snapshot.
+
+    Columns: tick (int32), time (int32), agent_id (dictionary-encoded),
+    state (int8 state code), x / y (float64). The CRS and the state code
+    names are kept in the schema metadata.
+    """
+
+    def __init__(self, path, agent_ids, fmt="parquet", crs="EPSG:32651", state_names=None):
+        import pyarrow as pa
+
+        if fmt not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format: {fmt}")
+        self.path = str(path)
+        self.fmt = fmt
+        self.n_agents = len(agent_ids)
+        self._agent_ids = pa.DictionaryArray.from_arrays(
+            pa.array(np.arange(self.n_agents, dtype=np.int32)), pa.array(agent_ids)
+        )
+        metadata = {"crs": crs}
+        if state_names is not None:
+            metadata["state_names"] = json.dumps(list(state_names))
+        self.schema = pa.schema([
+            ("tick", pa.int32()),
+            ("time", pa.int32()),
+            ("agent_id", self._agent_ids.type),
+            ("state", pa.int8()),
+            ("x", pa.float64()),
+            ("y", pa.float64()),
+        ], metadata=metadata)
+
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            import pyarrow.ipc as ipc
+            self._writer = ipc.new_file(self.path, self.schema)
+
+    def write(self, tick, time, state, x, y):
+        import pyarrow as pa
+
+        n = self.n_agents
+        batch = pa.record_batch([
+            pa.array(np.full(n, tick, dtype=np.int32)),
+            pa.array(np.full(n, time, dtype=np.int32)),
+            self._agent_ids,
+            pa.array(np.asarray(state, dtype=np.int8)),
+            pa.array(np.asarray(x, dtype=np.float64)),
+            pa.array(np.asarray(y, dtype=np.float64)),
+        ], schema=self.schema)
+        if self.fmt == "parquet":
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_snapshot_table(path, ticks=None, columns=None):
+    """Read a snapshot stream as a pyarrow Table, optionally filtered to some ticks."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    path = str(path)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        filters = [("tick", "in", list(ticks))] if ticks is not None else None
+        table = pq.read_table(path, columns=columns, filters=filters)
+    else:
+        import pyarrow.ipc as ipc
+        with pa.memory_map(path) as source:
+            table = ipc.open_file(source).read_all()
+        if ticks is not None:
+            table = table.filter(pc.is_in(table["tick"], pa.array(list(ticks), pa.int32())))
+        if columns is not None:
+            table = table.select(columns)
+    return table
+
+def iter_snapshot_batches(path):
+    """
+    Yield the stream one row group / record batch at a time. The writer
+    emits one per snapshot, but Parquet splits large snapshots into several
+    row groups; use iter_snapshots to get whole snapshots.
+    """
+    import pyarrow as pa
+
+    path = str(path)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(i)
+    else:
+        import pyarrow.ipc as ipc
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+def iter_snapshots(paths):
+    """
+    Yield (time, table) for each snapshot in one or more stream files, in
+    order. Rows are grouped on the time column, so a snapshot split over
+    several row groups comes back as one table.
+    """
+    import pyarrow as pa
+
+    pending, current = [], None
+    for path in paths:
+        for batch in iter_snapshot_batches(path):
+            if isinstance(batch, pa.RecordBatch):
+                batch = pa.Table.from_batches([batch])
+            times = batch["time"].to_numpy()
+            starts = np.r_[0, np.flatnonzero(np.diff(times)) + 1]
+            for start, stop in zip(starts, np.r_[starts[1:], len(times)]):
+                time = int(times[start])
+                if pending and time != current:
+                    yield current, pa.concat_tables(pending)
+                    pending = []
+                current = time
+                pending.append(batch.slice(start, stop - start))
+    if pending:
+        yield current, pa.concat_tables(pending)
+
+def _snapshot_schema(path):
+    path = str(path)
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    with pa.memory_map(path) as source:
+        return ipc.open_file(source).schema
+
+def _rewrite_snapshot_streams(paths, out_path, before_tick=None):
+    import pyarrow.compute as pc
+
+    out_path = str(out_path)
+    tmp_path = out_path + ".tmp"
+    schema = _snapshot_schema(paths[0])
+    if out_path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(tmp_path, schema)
+    else:
+        import pyarrow.ipc as ipc
+        writer = ipc.new_file(tmp_path, schema)
+    try:
+        with writer:
+            for path in paths:
+                for batch in iter_snapshot_batches(path):
+                    if before_tick is not None:
+                        batch = batch.filter(pc.less(batch["tick"], before_tick))
+                    if batch.num_rows:
+                        writer.write(batch)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, out_path)
+
+def concat_snapshot_streams(paths, out_path):
+    """
+    Concatenate snapshot streams (the parts a checkpointed run wrote) into a
+    single file at out_path, which may be one of the inputs. The other
+    inputs are removed once the merged file is in place.
+    """
+    paths = [str(p) for p in paths]
+    _rewrite_snapshot_streams(paths, out_path)
+    for path in paths:
+        if path != str(out_path):
+            os.remove(path)
+
+def truncate_snapshot_stream(path, before_tick):
+    """
+    Drop the snapshots taken at or after before_tick from a stream file.
+    Returns False, leaving the file untouched, when there are none.
+    """
+    ticks = read_snapshot_table(path, columns=["tick"])["tick"]
+    if len(ticks) == 0 or ticks.to_numpy().max() < before_tick:
+        return False
+    _rewrite_snapshot_streams([str(path)], path, before_tick=before_tick)
+    return True
+
+def read_snapshot_stream(path, ticks=None):
+    """Load (some ticks of) a snapshot stream back into a point GeoDataFrame."""
+    table = read_snapshot_table(path, ticks=ticks)
+    metadata = table.schema.metadata or {}
+    df = table.to_pandas()
+    df["agent_id"] = df["agent_id"].astype(object)
+    if b"state_names" in metadata:
+        names = np.array(json.loads(metadata[b"state_names"]), dtype=object)
+        df["state_name"] = names[df["state"].to_numpy()]
+    crs = metadata.get(b"crs", b"EPSG:32651").decode()
+    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df["x"], df["y"]), crs=crs)
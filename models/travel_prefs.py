@@ -1,3 +1,8 @@
+import numpy as np
+from utils.compiled_graph import compile_graph
+from utils.geospatial import building_snap_table
+from utils.route_cache import MISSING, cached_shortest_path
+
 def train_mode_preference_model(trip_csv_path):
     import pandas as pd
     from sklearn.ensemble import RandomForestClassifier
@@ -72,59 +77,99 @@ def apply_mode_predictions_to_agents(agent_profiles_df, predicted_modes_df):
     merged_df["predicted_mode"] = merged_df["predicted_mode"].fillna(1).astype(int)
     return merged_df
 
+# Preferred network mode and the penalty on every other mode, per mode code
+MODE_PENALTIES = {
+    1: ("walk", 3),    # Walk
+    2: ("jeep", 2),    # Jeepney
+    3: ("bus", 2.5),   # Bus
+    4: ("rail", 2),    # Rail
+}
+DEFAULT_PENALTY = 1.2  # Default: less strict, any non-walk edge
+
+def edge_weight(data, mode_code):
+    """Weight of one edge for an agent preferring mode_code."""
+    mode = data.get("mode", "walk")
+    base_time = data.get("travel_time", 1)
+    if mode_code in MODE_PENALTIES:
+        preferred, penalty = MODE_PENALTIES[mode_code]
+        return base_time if mode == preferred else base_time * penalty
+    return base_time * DEFAULT_PENALTY if mode != "walk" else base_time
+
+def mode_weight_name(cg, mode_code):
+    """
+    Name of the per-edge weight array for mode_code on a CompiledGraph,
+    computed once per graph with the same penalties as edge_weight().
+    """
+    name = f"mode_weight_{mode_code}"
+    if name not in cg.edge_attrs:
+        base_time = np.where(np.isnan(cg.travel_time), 1, cg.travel_time)
+        preferred, penalty = MODE_PENALTIES.get(mode_code, ("walk", DEFAULT_PENALTY))
+        on_mode = cg.mode_mask(preferred, default="walk")
+        cg.add_weight(name, np.where(on_mode, base_time, base_time * penalty))
+    return name
+
 def assign_edge_weights_based_on_mode(G, mode_code):
     """
     Assigns weights to edges in the network graph based on agent's preferred mode.
+    Returns a weighted copy; routing uses the compiled mode_weight_name() arrays instead.
     """
     G_mod = G.copy()
     for u, v, k, data in G_mod.edges(keys=True, data=True):
-        mode = data.get("mode", "walk")
-        base_time = data.get("travel_time", 1)
-
-        # Sample penalty schema (you can fine-tune)
-        if mode_code == 1:  # Walk
-            weight = base_time if mode == "walk" else base_time * 3
-        elif mode_code == 2:  # Jeepney
-            weight = base_time if mode == "jeep" else base_time * 2
-        elif mode_code == 3:  # Bus
-            weight = base_time if mode == "bus" else base_time * 2.5
-        elif mode_code == 4:  # Rail
-            weight = base_time if mode == "rail" else base_time * 2
-        else:  # Default: less strict
-            weight = base_time * 1.2 if mode != "walk" else base_time
-
-        data["weight"] = weight
+        data["weight"] = edge_weight(data, mode_code)
     return G_mod
 
-def route_with_mode_preference(agent, G_combined, buildings_df):
-    import networkx as nx
+def route_edge_data(G, cg, edge_id):
+    """Attributes of a compiled edge, read back from the networkx graph when there is one."""
+    if G is cg:
+        mode = cg.mode[edge_id]
+        return {
+            "mode": cg.mode_names[mode] if mode >= 0 else "walk",
+            "travel_time": cg.travel_time[edge_id],
+            "travel_cost": cg.cost[edge_id],
+            "geometry": None,
+        }
+    u = cg.node_ids[cg.edge_source[edge_id]]
+    v = cg.node_ids[cg.edge_target[edge_id]]
+    return G[u][v][cg.edge_key[edge_id]] if G.is_multigraph() else G[u][v]
+
+def building_nodes(building_ids, G_combined, buildings_df, snap=None):
+    """
+    Integer nodes of the compiled graph nearest to buildings (-1 if none):
+    array lookups in snap (a geospatial.building_snap_table of G_combined)
+    when given, else one KD-tree query for just these buildings.
+    """
+    import pandas as pd
+
+    building_ids = pd.Index(building_ids)
+    if snap is None:
+        snap = building_snap_table(buildings_df.loc[building_ids.unique()], G_combined)
+    return snap["node"].reindex(building_ids).fillna(-1).to_numpy(dtype=np.int64)
+
+def route_with_mode_preference(agent, G_combined, buildings_df, cache=None, snap=None):
+    cg = compile_graph(G_combined)
 
-    origin_building = buildings_df.loc[agent["origin_building_id"]]
-    dest_building = buildings_df.loc[agent["dest_building_id"]]
     mode_pref = agent["predicted_mode"]
 
-    # Adjust edge weights based on modal preference
-    G_weighted = assign_edge_weights_based_on_mode(G_combined, mode_pref)
+    # Edge weights based on modal preference
+    weight = mode_weight_name(cg, mode_pref)
 
     # Get nearest nodes
-    orig_node = get_nearest_node(origin_building.geometry, G_weighted)
-    dest_node = get_nearest_node(dest_building.geometry, G_weighted)
+    orig_node, dest_node = building_nodes([agent["origin_building_id"], agent["dest_building_id"]],
+                                          G_combined, buildings_df, snap)
 
     # Find shortest path
-    try:
-        path = nx.shortest_path(G_weighted, source=orig_node, target=dest_node, weight="weight")
-        path_edges = list(zip(path[:-1], path[1:]))
-    except nx.NetworkXNoPath:
+    path = cached_shortest_path(cg, orig_node, dest_node, weight, cache)
+    if path is None:
         return None
 
     # Reconstruct the route with attributes (travel time, mode, geometry)
     route_info = []
     total_time = 0
-    for u, v in path_edges:
-        edge_data = G_weighted.get_edge_data(u, v, 0)
+    for u, v, edge_id in zip(path[:-1], path[1:], cg.edge_ids(path, weight)):
+        edge_data = route_edge_data(G_combined, cg, edge_id)
         route_info.append({
-            "from": u,
-            "to": v,
+            "from": cg.node_ids[u],
+            "to": cg.node_ids[v],
             "mode": edge_data["mode"],
             "travel_time": edge_data["travel_time"],
             "geometry": edge_data["geometry"]
@@ -137,53 +182,123 @@ def route_with_mode_preference(agent, G_combined, buildings_df):
         "total_travel_time": total_time
     }
 
-def route_with_fallback(agent, G_combined, buildings_df, max_fallbacks=2):
-    import networkx as nx
-    
+def route_segments_along(agent, G_combined, cg, path, weight):
+    """Route segments of a compiled path with its total travel time and cost."""
+    route_segments = []
+    total_time = 0
+    total_cost = 0
+
+    for u, v, edge_id in zip(path[:-1], path[1:], cg.edge_ids(path, weight)):
+        edge_data = route_edge_data(G_combined, cg, edge_id)
+        seg_time = edge_data.get("travel_time", 1)
+        seg_cost = edge_data.get("travel_cost", 0)
+        route_segments.append({
+            "agent_id": agent["agent_id"],
+            "trip_id": agent["trip_id"],
+            "from_node": cg.node_ids[u],
+            "to_node": cg.node_ids[v],
+            "mode": edge_data["mode"],
+            "travel_time": seg_time,
+            "travel_cost": seg_cost,
+            "geometry": edge_data["geometry"]
+        })
+        total_time += seg_time
+        total_cost += seg_cost
+
+    return route_segments, total_time, total_cost
+
+def route_with_fallback(agent, G_combined, buildings_df, max_fallbacks=2, cache=None, snap=None):
+    cg = compile_graph(G_combined)
+
     preferred_mode = agent["predicted_mode"]
     fallback_modes = [m for m in [1, 2, 3, 4, 5] if m != preferred_mode][:max_fallbacks]
 
+    # The end nodes do not depend on the mode
+    orig_node, dest_node = building_nodes([agent["origin_building_id"], agent["dest_building_id"]],
+                                          G_combined, buildings_df, snap)
+
     all_modes = [preferred_mode] + fallback_modes
     for mode in all_modes:
-        G_weighted = assign_edge_weights_based_on_mode(G_combined, mode)
-
-        origin_geom = buildings_df.loc[agent["origin_building_id"]].geometry
-        dest_geom = buildings_df.loc[agent["dest_building_id"]].geometry
-
-        orig_node = get_nearest_node(origin_geom, G_weighted)
-        dest_node = get_nearest_node(dest_geom, G_weighted)
-
-        try:
-            path = nx.shortest_path(G_weighted, source=orig_node, target=dest_node, weight="weight")
-            path_edges = list(zip(path[:-1], path[1:]))
-            route_segments = []
-            total_time = 0
-            total_cost = 0
-
-            for u, v in path_edges:
-                edge_data = G_weighted.get_edge_data(u, v, 0)
-                seg_time = edge_data.get("travel_time", 1)
-                seg_cost = edge_data.get("travel_cost", 0)
-                route_segments.append({
-                    "agent_id": agent["agent_id"],
-                    "trip_id": agent["trip_id"],
-                    "from_node": u,
-                    "to_node": v,
-                    "mode": edge_data["mode"],
-                    "travel_time": seg_time,
-                    "travel_cost": seg_cost,
-                    "geometry": edge_data["geometry"]
-                })
-                total_time += seg_time
-                total_cost += seg_cost
-
-            return route_segments, total_time, total_cost, mode  # success
-
-        except nx.NetworkXNoPath:
+        weight = mode_weight_name(cg, mode)
+        path = cached_shortest_path(cg, orig_node, dest_node, weight, cache)
+        if path is None:
             continue
 
+        route_segments, total_time, total_cost = route_segments_along(agent, G_combined, cg, path, weight)
+        return route_segments, total_time, total_cost, mode  # success
+
     return None, None, None, None  # fallback failed
 
+def route_trips_with_fallback(agent_trips, G_combined, buildings_df, max_fallbacks=2, n_workers=None,
+                              chunk_size=1024, cache=None, snap=None):
+    """
+    route_with_fallback for a list of trips on a process pool (see
+    utils.parallel_routing). Returns the same (segments, time, cost, mode)
+    tuples, in trip order. Only the preferred-mode route is looked up in
+    cache: a cached None (no route by that mode) sends the trip straight to
+    its fallbacks. Routes found by the workers are stored back into it, and
+    a preferred mode that failed is cached as None. Without a snap table the
+    trips' buildings are snapped in one query.
+    """
+    from utils.parallel_routing import ParallelRouter
+
+    cg = compile_graph(G_combined)
+    modes = sorted({1, 2, 3, 4, 5} | {trip["predicted_mode"] for trip in agent_trips})
+    weights = [mode_weight_name(cg, mode) for mode in modes]
+
+    # One row per trip: the weights to try, preferred mode first (-1 pads)
+    weight_rank = np.full((len(agent_trips), max_fallbacks + 1), -1, dtype=np.int64)
+    for i, trip in enumerate(agent_trips):
+        fallback_modes = [m for m in [1, 2, 3, 4, 5] if m != trip["predicted_mode"]][:max_fallbacks]
+        ranked = [modes.index(m) for m in [trip["predicted_mode"]] + fallback_modes]
+        weight_rank[i, :len(ranked)] = ranked
+
+    ends = building_nodes([t["origin_building_id"] for t in agent_trips] + [t["dest_building_id"] for t in agent_trips],
+                          G_combined, buildings_df, snap)
+    origins, dests = ends[:len(agent_trips)], ends[len(agent_trips):]
+
+    paths = [None] * len(agent_trips)
+    used = np.full(len(agent_trips), -1, dtype=np.int64)
+    preferred = weight_rank[:, 0].copy()
+    todo = []
+    for i in range(len(agent_trips)):
+        weight = weights[preferred[i]]
+        path = MISSING
+        if cache is not None and origins[i] >= 0 and dests[i] >= 0:
+            path = cache.get((int(origins[i]), int(dests[i]), weight, cg.fingerprint(weight)))
+        if path is MISSING:
+            todo.append(i)
+        elif path is None:
+            # Known to have no route by the preferred mode: only the fallbacks are searched
+            weight_rank[i] = np.append(weight_rank[i, 1:], -1)
+            todo.append(i)
+        else:
+            paths[i], used[i] = np.asarray(path, dtype=np.int64), preferred[i]
+
+    if todo:
+        todo = np.asarray(todo)
+        with ParallelRouter({"combined": cg}, weights, n_workers, chunk_size) as router:
+            routed = router.paths("combined", origins[todo], dests[todo], weights, weight_rank[todo])
+            for i, (path, w) in zip(todo, routed):
+                searched = weight_rank[i, 0] == preferred[i] and origins[i] >= 0 and dests[i] >= 0
+                if cache is not None and searched and w != preferred[i]:
+                    weight = weights[preferred[i]]
+                    cache.put((int(origins[i]), int(dests[i]), weight, cg.fingerprint(weight)), None)
+                if path is None:
+                    continue
+                paths[i], used[i] = np.asarray(path, dtype=np.int64), w
+                if cache is not None:
+                    cache.put((int(origins[i]), int(dests[i]), weights[w], cg.fingerprint(weights[w])), path)
+
+    results = []
+    for trip, path, w in zip(agent_trips, paths, used):
+        if path is None:
+            results.append((None, None, None, None))
+            continue
+        route_segments, total_time, total_cost = route_segments_along(trip, G_combined, cg, path, weights[w])
+        results.append((route_segments, total_time, total_cost, modes[w]))
+    return results
+
 trip_csv = "data/raw/qc-mucep/3_Trip.csv"
 
 # Train model
@@ -0,0 +1,14 @@
+import sys
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# The package __init__ files star-import script modules that run on import,
+# so the tests load submodules (models.x, utils.y) without executing them.
+for _name in ("models", "utils"):
+    if _name not in sys.modules:
+        _package = types.ModuleType(_name)
+        _package.__path__ = [str(ROOT / _name)]
+        sys.modules[_name] = _package
@@ -0,0 +1,37 @@
+import importlib
+
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def agent_state(tmp_path, monkeypatch):
+    # The module reads the progression log and agent profiles on import
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "outputs" / "simulation").mkdir(parents=True)
+    (tmp_path / "outputs" / "agents").mkdir(parents=True)
+    pd.DataFrame(columns=["agent_id", "start_time", "end_time", "mode", "activity", "origin_mucep",
+                          "dest_mucep", "trip_id", "segment"]).to_csv(
+        tmp_path / "outputs" / "simulation" / "agent_progression.csv", index=False)
+    pd.DataFrame({"agent_id": ["a1"], "household_id": ["h1"], "home_mucep": [1]}).to_csv(
+        tmp_path / "outputs" / "agents" / "agent_profiles.csv", index=False)
+    return importlib.reload(importlib.import_module("models.agent_state"))
+
+def window(agent_id, start, end, activity, mode="stay"):
+    return {"agent_id": agent_id, "start_time": f"2024-01-01 {start}", "end_time": f"2024-01-01 {end}",
+            "mode": mode, "activity": activity, "origin_mucep": 1, "dest_mucep": 2, "trip_id": 1, "segment": 0}
+
+def test_zero_length_window_does_not_hide_window_with_same_start(agent_state):
+    logs = pd.DataFrame([
+        window("a1", "08:00", "09:00", "work"),
+        window("a1", "08:00", "08:00", "instant"),
+        window("a2", "08:00", "08:00", "instant"),
+        window("a2", "08:00", "08:30", "travel", mode="jeep"),
+    ])
+    index = agent_state.AgentIntervalIndex(logs, ["a1", "a2"])
+
+    agents, rows = index.lookup(pd.Timestamp("2024-01-01 08:15"))
+    assert agents.tolist() == [0, 1]
+    assert index.activity[rows].tolist() == ["work", "travel"]
+
+    agents, rows = index.lookup(pd.Timestamp("2024-01-01 08:45"))
+    assert agents.tolist() == [0]
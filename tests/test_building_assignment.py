@@ -0,0 +1,63 @@
+import importlib
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+def make_buildings():
+    zones = ["z1", "z1", "z1", "z2", "z2", "z1", "z2", "z1"]
+    tags = ["office", "elementary school", "mall", "office", "Government", "office", "hospital", None]
+    return gpd.GeoDataFrame({"building_id": [f"b{i}" for i in range(len(zones))], "mucep_zone": zones, "tag": tags,
+                             "floor_area": [10.0, 5.0, 3.0, 1.0, 2.0, 0.0, 4.0, 1.0]},
+                            geometry=[Point(i, 0) for i in range(len(zones))], crs="EPSG:32651")
+
+@pytest.fixture
+def assignment(tmp_path, monkeypatch):
+    # The module is a script: it reads its inputs and writes its output on import
+    trips = pd.DataFrame({"household_no": [1, 1, 2, 2], "hh_member_no": [1, 2, 1, 1], "trip_purpose": [2, 3, 5, 4],
+                          "trip_dest_code": ["z1", "z1", "z1", "z9"]})
+    agents = pd.DataFrame({"household_no": [1, 1, 2], "hh_member_no": [1, 2, 1], "2_age": [40, 8, 30],
+                           "6_occupation": ["clerk", "student", "engineer"],
+                           "7_employment_sector": ["private", None, "private"]})
+    inputs = {"mucep_form3_cleaned.csv": trips, "mucep_form2_cleaned.csv": agents}
+    monkeypatch.setattr(gpd, "read_file", lambda path, **kwargs: make_buildings())
+    monkeypatch.setattr(pd, "read_csv", lambda path, **kwargs: inputs[str(path).rsplit("/", 1)[-1]].copy())
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data" / "processed").mkdir(parents=True)
+    monkeypatch.delitem(sys.modules, "models.building_assignment", raising=False)
+    return importlib.import_module("models.building_assignment")
+
+def test_candidates_are_the_zone_buildings_with_the_tags(assignment):
+    buildings = make_buildings()
+    buildings["tag"] = buildings["tag"].fillna("")
+    index = assignment.CandidateIndex(buildings)
+
+    z1 = index.zone_codes(["z1"])[0]
+    positions, _ = index.candidates(z1, index.tags_in(["office", "mall"]))
+    assert sorted(index.building_ids[positions]) == ["b0", "b2", "b5"]
+    positions, _ = index.candidates(z1, index.tags_containing("school"))
+    assert index.building_ids[positions].tolist() == ["b1"]
+    assert index.zone_codes(["z9", None]).tolist() == [-1, -1]
+    assert index.sample(-1, index.tags_in(["office"]), 3, np.random.default_rng(0)) is None
+    assert index.sample(z1, index.tags_in(["hospital"]), 3, np.random.default_rng(0)) is None
+
+def test_weighted_draws_follow_weights(assignment):
+    buildings = make_buildings()
+    buildings["tag"] = buildings["tag"].fillna("")
+    index = assignment.CandidateIndex(buildings, weight_col="floor_area")
+
+    drawn = index.sample(index.zone_codes(["z1"])[0], index.tags_in(["office", "mall"]), 13000,
+                         np.random.default_rng(0))
+    counts = pd.Series(drawn).value_counts()
+    assert "b5" not in counts  # zero floor area
+    assert abs(counts["b0"] / counts["b2"] - 10 / 3) < 0.3
+
+def test_assign_buildings_respects_zone_and_tag_rules(assignment):
+    dest = assignment.assign_buildings(assignment.trips, assignment.candidate_index, np.random.default_rng(0))
+    # Work (private clerk) → office in z1, school (age 8) → elementary, shopping → mall, unknown zone → None
+    assert dest[0] in {"b0", "b5"}
+    assert dest[1:].tolist() == ["b1", "b2", None]
+    assert assignment.OUTPUT_PATH.exists()
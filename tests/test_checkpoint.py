@@ -0,0 +1,9 @@
+from models.checkpoint import checkpoint_path, latest_checkpoint
+
+def test_latest_checkpoint_compares_ticks_numerically(tmp_path):
+    assert latest_checkpoint(str(tmp_path)) is None
+    for tick in (12, 9999, 10000, 950):
+        open(checkpoint_path(str(tmp_path), tick), "wb").close()
+    (tmp_path / "checkpoint_99999.npz.tmp").write_bytes(b"")
+
+    assert latest_checkpoint(str(tmp_path)) == checkpoint_path(str(tmp_path), 10000)
@@ -0,0 +1,47 @@
+import geopandas as gpd
+import networkx as nx
+import numpy as np
+from shapely.geometry import Point, box
+
+from utils.geospatial import METRIC_CRS, NodeIndex, building_snap_table, get_nearest_node, project_xy
+
+def make_graph(n=30, seed=0):
+    rng = np.random.default_rng(seed)
+    lonlat = project_xy(rng.uniform(280000, 283000, n), rng.uniform(1615000, 1618000, n), METRIC_CRS, "EPSG:4326")
+    G = nx.DiGraph()
+    for i, (lon, lat) in enumerate(lonlat):
+        G.add_node(f"n{i}", x=lon, y=lat)
+    G.add_node("no_xy")  # no coordinates: never a snap target
+    G.add_edges_from((f"n{i}", f"n{i + 1}") for i in range(n - 1))
+    return G
+
+def brute_force(G, xy):
+    ids = [node for node, data in G.nodes(data=True) if "x" in data]
+    nodes_xy = project_xy([G.nodes[i]["x"] for i in ids], [G.nodes[i]["y"] for i in ids], "EPSG:4326", METRIC_CRS)
+    dist = np.hypot(*(xy[:, None, :] - nodes_xy[None, :, :]).transpose(2, 0, 1))
+    return np.array(ids)[dist.argmin(axis=1)], dist.min(axis=1)
+
+def test_snap_table_matches_brute_force():
+    G = make_graph()
+    rng = np.random.default_rng(1)
+    xy = np.column_stack([rng.uniform(279500, 283500, 50), rng.uniform(1614500, 1618500, 50)])
+    buildings = gpd.GeoDataFrame(geometry=[box(x - 5, y - 5, x + 5, y + 5) for x, y in xy], crs=METRIC_CRS,
+                                 index=[f"b{i}" for i in range(50)])
+
+    snap = building_snap_table(buildings, G)
+    expected_ids, expected_dist = brute_force(G, xy)
+    assert snap.index.tolist() == buildings.index.tolist()
+    assert snap["node_id"].tolist() == expected_ids.tolist()
+    np.testing.assert_allclose(snap["snap_dist_m"], expected_dist, rtol=1e-9)
+    assert get_nearest_node(Point(*xy[7]), G) == expected_ids[7]
+
+    # The same buildings given in lon/lat snap to the same nodes
+    assert building_snap_table(buildings.to_crs("EPSG:4326"), G)["node_id"].tolist() == expected_ids.tolist()
+
+def test_query_limits_and_missing_points():
+    index = NodeIndex(["a", "b"], [0.0, 100.0], [0.0, np.nan], graph_crs=METRIC_CRS)
+    nodes, dist = index.query_xy([[1.0, 0.0], [90.0, 0.0], [np.nan, 0.0]], max_distance=50)
+
+    assert nodes.tolist() == [0, -1, -1]
+    assert dist[0] == 1.0 and np.isinf(dist[1:]).all()
+    assert index.nearest([Point(1, 0), Point(500, 0)], max_distance=50) == ["a", None]
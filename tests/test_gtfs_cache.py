@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+
+import utils.gtfs_cache as gtfs_cache
+from utils.gtfs_cache import ingest_gtfs, open_gtfs
+
+def write_feed(path, stop_times_ids=("X", 2, 2), trip_ids=("T1", "T1", None)):
+    path.mkdir(exist_ok=True)
+    pd.DataFrame({"stop_id": [1, 2, 10], "stop_name": ["one", "two", "ten"], "stop_lat": [14.6, 14.61, 14.62],
+                  "stop_lon": [121.0, 121.01, 121.02]}).to_csv(path / "stops.txt", index=False)
+    pd.DataFrame({"trip_id": list(trip_ids), "stop_id": list(stop_times_ids), "stop_sequence": [0, 1, 0],
+                  "arrival_time": ["08:00:00", "25:10:00", "09:00:00"],
+                  "departure_time": ["08:00:00", "25:10:00", "09:00:00"]}).to_csv(path / "stop_times.txt", index=False)
+    pd.DataFrame({"trip_id": ["T1", None], "route_id": ["R1", "R1"]}).to_csv(path / "trips.txt", index=False)
+    pd.DataFrame({"route_id": ["R1"], "route_short_name": ["r1"]}).to_csv(path / "routes.txt", index=False)
+
+def test_mixed_numeric_and_string_ids(tmp_path):
+    write_feed(tmp_path / "feed")
+    feed = ingest_gtfs(tmp_path / "feed", tmp_path / "cache")
+
+    # stops.txt reads as integers, stop_times.txt as strings: all become strings
+    assert list(feed.ids("stop")) == ["1", "10", "2", "X"]
+    stops = feed.table("stops")
+    assert stops["stop_id"].astype(str).tolist() == ["1", "2", "10"]
+    stop_times = feed.table("stop_times")
+    assert stop_times["stop_id"].astype(str).tolist() == ["X", "2", "2"]
+    assert stop_times["arrival_time"].tolist() == [28800, 90600, 32400]
+
+def test_missing_ids_do_not_join(tmp_path):
+    write_feed(tmp_path / "feed")
+    feed = ingest_gtfs(tmp_path / "feed", tmp_path / "cache")
+
+    # The stop time without a trip must not pick up the trip row without an id
+    merged = feed.stop_times(["trip_id", "stop_id", "route_id", "route_short_name"])
+    assert merged["trip_id"].astype(str).tolist() == ["T1", "T1"]
+    assert merged["route_short_name"].tolist() == ["r1", "r1"]
+
+def test_open_gtfs_hashes_only_changed_files(tmp_path, monkeypatch):
+    write_feed(tmp_path / "feed")
+    open_gtfs(tmp_path / "feed", tmp_path / "cache")
+
+    hashed = []
+    file_hash = gtfs_cache.file_hash
+    monkeypatch.setattr(gtfs_cache, "file_hash", lambda path: hashed.append(path) or file_hash(path))
+    open_gtfs(tmp_path / "feed", tmp_path / "cache")
+    assert hashed == []
+
+    # Rewriting the same bytes changes the mtime: hashed once, then trusted again
+    stops = tmp_path / "feed" / "stops.txt"
+    stops.write_bytes(stops.read_bytes())
+    os.utime(stops, ns=(stops.stat().st_atime_ns, stops.stat().st_mtime_ns + 10**9))
+    open_gtfs(tmp_path / "feed", tmp_path / "cache")
+    assert hashed
+    hashed.clear()
+    open_gtfs(tmp_path / "feed", tmp_path / "cache")
+    assert hashed == []
+
+    write_feed(tmp_path / "feed", stop_times_ids=(1, 2, 2))
+    feed = open_gtfs(tmp_path / "feed", tmp_path / "cache")
+    assert feed.table("stop_times")["stop_id"].astype(str).tolist() == ["1", "2", "2"]
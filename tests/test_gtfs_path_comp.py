@@ -0,0 +1,74 @@
+import geopandas as gpd
+import networkx as nx
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from utils.compiled_graph import load_graph, save_graph
+
+pytest.importorskip("tqdm")
+from utils.gtfs_path_comp import compute_agent_paths_geometries, compute_agent_paths_with_transfers
+from utils.route_cache import RouteCache
+
+def line_graph(nodes, y):
+    G = nx.Graph()
+    for i, node in enumerate(nodes):
+        G.add_node(node, x=1000.0 * i, y=y)
+    for i in range(len(nodes) - 1):
+        G.add_edge(nodes[i], nodes[i + 1], length=1000.0)
+    return G
+
+def make_network():
+    # Road r0..r4 and rail t..s3 share the transfer stop t
+    G_road = line_graph(["r0", "r1", "r2", "r3", "t"], 0.0)
+    G_rail = line_graph(["t", "s1", "s2", "s3"], 0.0)
+    for i, node in enumerate(["t", "s1", "s2", "s3"]):
+        G_rail.nodes[node]["x"] = 4000.0 + 1000.0 * i
+
+    buildings = gpd.GeoDataFrame({
+        "building_id": ["b0", "b1", "b2", "b3"],
+        "nearest_road_stop_id": ["r0", "r3", "t", "t"],
+        "nearest_rail_stop_id": ["t", "t", "s1", "s3"],
+        "geometry": [Point(0, 10), Point(3000, 10), Point(5000, 10), Point(7000, 10)],
+    }, crs="EPSG:32651").set_index("building_id")
+    trips = pd.DataFrame({
+        "agent_id": ["a1", "a1", "a2", "a3"],
+        "trip_no": [0, 1, 0, 0],
+        "origin_building_id": ["b0", "b1", "b2", "b0"],
+        "destination_building_id": ["b1", "b0", "b3", "b3"],
+        "preferred_mode": ["road", "road", "rail", "mixed"],
+    })
+    return G_road, G_rail, buildings, trips
+
+@pytest.mark.parametrize("batch", [False, True])
+def test_geometries_from_saved_graphs_match_networkx(tmp_path, batch):
+    G_road, G_rail, buildings, trips = make_network()
+    save_graph(G_road, tmp_path / "road")
+    save_graph(G_rail, tmp_path / "rail")
+    expected = compute_agent_paths_geometries(trips, buildings, G_road, G_rail, batch=batch)
+    loaded = compute_agent_paths_geometries(trips, buildings, load_graph(tmp_path / "road"),
+                                            load_graph(tmp_path / "rail"), batch=batch)
+
+    assert expected["mode"].tolist() == ["road", "road", "rail", "mixed"]
+    assert expected.geometry.iloc[3].length == 7000.0
+    pd.testing.assert_frame_equal(pd.DataFrame(loaded.drop(columns="geometry")),
+                                  pd.DataFrame(expected.drop(columns="geometry")))
+    assert loaded.geometry.geom_equals(expected.geometry).all()
+
+def test_parallel_paths_use_the_route_cache(tmp_path):
+    G_road, G_rail, buildings, trips = make_network()
+    expected = compute_agent_paths_with_transfers(trips, buildings, G_road, G_rail)
+
+    with RouteCache(path=tmp_path / "routes.sqlite") as cache:
+        first = compute_agent_paths_with_transfers(trips, buildings, G_road, G_rail, cache=cache, n_workers=2)
+        # The two r0 <-> r3 road trips, the rail trip and the transfer trip
+        assert cache.stats()["misses"] == 4 and len(cache) == 4
+        serial = compute_agent_paths_with_transfers(trips, buildings, G_road, G_rail, cache=cache)
+        assert cache.stats()["hits"] == 4
+    pd.testing.assert_frame_equal(first, expected)
+    pd.testing.assert_frame_equal(serial, expected)
+
+    with RouteCache(path=tmp_path / "routes.sqlite") as cache:
+        again = compute_agent_paths_with_transfers(trips, buildings, G_road, G_rail, cache=cache, n_workers=2)
+        assert cache.stats()["misses"] == 0
+    pd.testing.assert_frame_equal(again, expected)
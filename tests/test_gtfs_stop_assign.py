@@ -0,0 +1,43 @@
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import box
+
+from utils.gtfs_stop_assign import assign_nearest_stop, assign_nearest_stops, load_stops
+
+def make_inputs(n_buildings=40, n_stops=12, seed=0):
+    rng = np.random.default_rng(seed)
+    x, y = rng.uniform(280000, 285000, n_buildings), rng.uniform(1615000, 1620000, n_buildings)
+    buildings = gpd.GeoDataFrame({"building_id": np.arange(n_buildings)},
+                                 geometry=[box(a, b, a + 20, b + 20) for a, b in zip(x, y)], crs="EPSG:32651")
+    stops_xy = gpd.GeoSeries(gpd.points_from_xy(rng.uniform(280000, 285000, n_stops),
+                                                rng.uniform(1615000, 1620000, n_stops)), crs="EPSG:32651")
+    lonlat = stops_xy.to_crs("EPSG:4326")
+    stops = load_stops(pd.DataFrame({"stop_id": [f"S{i}" for i in range(n_stops)],
+                                     "stop_lon": lonlat.x, "stop_lat": lonlat.y}))
+    return buildings, stops, stops_xy
+
+def test_k_nearest_stops_in_distance_order():
+    buildings, stops, stops_xy = make_inputs()
+    out = assign_nearest_stops(buildings, {"road": stops}, k=3)
+
+    centroids = buildings.geometry.centroid
+    dist = np.hypot(centroids.x.to_numpy()[:, None] - stops_xy.x.to_numpy(),
+                    centroids.y.to_numpy()[:, None] - stops_xy.y.to_numpy())
+    order = np.argsort(dist, axis=1)[:, :3]
+    for j, suffix in enumerate(["", "_2", "_3"]):
+        assert out[f"nearest_road_stop_id{suffix}"].tolist() == [f"S{i}" for i in order[:, j]]
+        np.testing.assert_allclose(out[f"nearest_road_stop_dist_m{suffix}"],
+                                   np.take_along_axis(dist, order[:, j:j + 1], axis=1)[:, 0], rtol=1e-6)
+
+    # Same CRS and nearest stop as the single-stop assignment it replaces
+    single = assign_nearest_stop(buildings, stops, "road")
+    assert out.crs == single.crs == "EPSG:4326"
+    assert out["nearest_road_stop_id"].tolist() == single["nearest_road_stop_id"].tolist()
+
+def test_k_larger_than_stop_count():
+    buildings, stops, _ = make_inputs(n_stops=2)
+    out = assign_nearest_stops(buildings, {"rail": stops}, k=3, chunk_size=7)
+
+    assert "nearest_rail_stop_id_2" in out and "nearest_rail_stop_id_3" not in out
+    assert (out["nearest_rail_stop_dist_m"] <= out["nearest_rail_stop_dist_m_2"]).all()
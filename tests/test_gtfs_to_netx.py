@@ -0,0 +1,61 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from utils.gtfs_to_netx import GRAPH_COLUMNS, build_graph, haversine_m, load_gtfs
+
+def write_feed(path, n_stops=15, n_trips=30, seed=0):
+    rng = np.random.default_rng(seed)
+    path.mkdir()
+    pd.DataFrame({"stop_id": [f"S{i}" for i in range(n_stops)], "stop_name": [f"stop {i}" for i in range(n_stops)],
+                  "stop_lat": 14.6 + rng.uniform(0, 0.05, n_stops),
+                  "stop_lon": 121.0 + rng.uniform(0, 0.05, n_stops)}).to_csv(path / "stops.txt", index=False)
+    rows = []
+    for t in range(n_trips):
+        for seq, stop in enumerate(rng.choice(n_stops, rng.integers(2, 6), replace=False)):
+            rows.append(dict(trip_id=f"T{t:02}", stop_id=f"S{stop}", stop_sequence=seq,
+                             arrival_time="08:00:00", departure_time="08:00:00"))
+    # Out of order on disk: edges follow stop_sequence, not row order
+    pd.DataFrame(rows).sample(frac=1, random_state=0).to_csv(path / "stop_times.txt", index=False)
+    pd.DataFrame({"trip_id": [f"T{t:02}" for t in range(n_trips)],
+                  "route_id": [f"R{t % 4}" for t in range(n_trips)]}).to_csv(path / "trips.txt", index=False)
+    pd.DataFrame({"route_id": [f"R{r}" for r in range(4)]}).to_csv(path / "routes.txt", index=False)
+
+def loop_graph(stops, stop_times):
+    # The per-trip loop build_graph replaced (haversine instead of geodesic distances)
+    coords = stops.set_index("stop_id")
+    G = nx.DiGraph()
+    for stop_id, row in coords.iterrows():
+        G.add_node(stop_id, lat=row["stop_lat"], lon=row["stop_lon"], name=row["stop_name"])
+    for _, group in stop_times.groupby("trip_id"):
+        stops_in_order = group.sort_values("stop_sequence")
+        for (u, _), (v, route) in zip(stops_in_order[["stop_id", "route_id"]].values[:-1],
+                                      stops_in_order[["stop_id", "route_id"]].values[1:]):
+            distance = haversine_m(coords.loc[u, "stop_lat"], coords.loc[u, "stop_lon"],
+                                   coords.loc[v, "stop_lat"], coords.loc[v, "stop_lon"])
+            G.add_edge(u, v, weight=float(distance), route=route)
+    return G
+
+def assert_same_graph(G, expected):
+    assert dict(G.nodes(data=True)) == dict(expected.nodes(data=True))
+    assert set(G.edges) == set(expected.edges)
+    for u, v, data in expected.edges(data=True):
+        assert G.edges[u, v]["route"] == data["route"]
+        assert np.isclose(G.edges[u, v]["weight"], data["weight"])
+
+def test_build_graph_matches_trip_loop(tmp_path):
+    write_feed(tmp_path / "feed")
+    stops, stop_times = load_gtfs(tmp_path / "feed")
+    assert_same_graph(build_graph(stops, stop_times), loop_graph(stops, stop_times))
+
+def test_build_graph_from_cached_feed(tmp_path):
+    write_feed(tmp_path / "feed")
+    stops, stop_times = load_gtfs(tmp_path / "feed")
+    cached_stops, cached_stop_times = load_gtfs(tmp_path / "feed", tmp_path / "cache", GRAPH_COLUMNS)
+
+    G = build_graph(cached_stops, cached_stop_times)
+    assert_same_graph(nx.relabel_nodes(G, str), loop_graph(stops, stop_times))
+
+def test_haversine_one_degree_of_latitude():
+    np.testing.assert_allclose(haversine_m([0.0, 14.0], [121.0, 121.0], [1.0, 14.0], [121.0, 121.0]),
+                               [6371000 * np.pi / 180, 0.0])
@@ -0,0 +1,61 @@
+import importlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+from shapely.geometry import LineString, Point
+
+from models.route_kinematics import RouteKinematics
+
+def load_net_anim(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # the module creates its output directory on import
+    net_anim = importlib.import_module("models.net_anim")
+    net_anim.movement_snapshots.clear()
+    return net_anim
+
+def traveling_state(route, now, **kwargs):
+    return SimpleNamespace(
+        is_traveling=True, route=route, current_trip_duration=10.0,
+        trip_start_time=now - timedelta(minutes=5), household_id="h1", current_mode="jeep",
+        current_segment=0, origin_stop_id=None, destination_stop_id=None, segment_mode=None,
+        segment_duration=None, **kwargs,
+    )
+
+def test_shared_kinematics_use_flat_trip_index(tmp_path, monkeypatch):
+    net_anim = load_net_anim(tmp_path, monkeypatch)
+
+    routes = [LineString([(0, 0), (10, 0)]), LineString([(0, 100), (0, 200)])]
+    kinematics = RouteKinematics(routes)
+    now = datetime(2024, 1, 1, 8, 0)
+    state = traveling_state(
+        routes[1], now,
+        active_trip_id=0,  # MUCEP trip id: points at the wrong kinematics row
+        trip_index=1,
+    )
+    submitted = []
+    writer = SimpleNamespace(submit=lambda *args: submitted.append(args))
+
+    net_anim.generate_movement_snapshot({"a1": state}, now, kinematics=kinematics, writer=writer)
+
+    _, gdf = net_anim.movement_snapshots[-1]
+    assert np.allclose([gdf.geometry.x[0], gdf.geometry.y[0]], [0, 150])
+    assert len(submitted) == 1
+
+def test_states_without_trip_index_use_their_own_route(tmp_path, monkeypatch):
+    net_anim = load_net_anim(tmp_path, monkeypatch)
+
+    routes = [LineString([(0, 0), (10, 0)]), LineString([(0, 100), (0, 200)])]
+    now = datetime(2024, 1, 1, 8, 0)
+    states = {"a1": traveling_state(routes[1], now, trip_index=None),
+              "a2": traveling_state(routes[1], now, trip_index=1)}
+    writer = SimpleNamespace(submit=lambda *args: None)
+
+    net_anim.generate_movement_snapshot(states, now, kinematics=RouteKinematics(routes), writer=writer)
+    _, gdf = net_anim.movement_snapshots[-1]
+    assert np.allclose(gdf.geometry.x, [0, 0]) and np.allclose(gdf.geometry.y, [150, 150])
+
+    net_anim.generate_movement_snapshot({"a1": states["a1"]}, now, kinematics=RouteKinematics(routes),
+                                        writer=writer)
+    _, gdf = net_anim.movement_snapshots[-1]
+    assert np.allclose([gdf.geometry.x[0], gdf.geometry.y[0]], [0, 150])
+    assert net_anim.interpolate_position(routes[1], 0.25).equals(Point(0, 125))
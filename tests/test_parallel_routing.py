@@ -0,0 +1,62 @@
+import networkx as nx
+import numpy as np
+
+from utils import parallel_routing
+from utils.compiled_graph import CompiledGraph, compile_graph
+from utils.parallel_routing import SharedGraphs, attach_graphs, fallback_paths
+
+def grid_graph():
+    G = nx.DiGraph()
+    rng = np.random.default_rng(0)
+    for u, v in nx.grid_2d_graph(6, 6).edges:
+        G.add_edge(u, v, length=float(rng.uniform(1, 10)))
+        if rng.random() < 0.7:
+            G.add_edge(v, u, length=float(rng.uniform(1, 10)))
+    return compile_graph(G)
+
+def test_fallback_paths_in_origin_batches_match_one_search():
+    cg = grid_graph()
+    rng = np.random.default_rng(1)
+    origins = rng.integers(0, cg.n_nodes, 50)
+    targets = rng.integers(0, cg.n_nodes, 50)
+    weight_rank = np.zeros((50, 1), dtype=np.int64)
+
+    paths, used = fallback_paths(cg, origins, targets, ["length"], weight_rank, batch_size=len(origins))
+    batched, batched_used = fallback_paths(cg, origins, targets, ["length"], weight_rank, batch_size=3)
+
+    assert used.tolist() == batched_used.tolist()
+    assert [None if p is None else p.tolist() for p in paths] == [None if p is None else p.tolist() for p in batched]
+
+def test_shared_graphs_carry_reverse_matrices():
+    cg = grid_graph()
+    with SharedGraphs({"rail": cg}, reverse=("rail",)) as shared:
+        attach_graphs(shared.descriptor)
+        try:
+            rail = parallel_routing._graphs["rail"]
+            assert isinstance(rail, CompiledGraph)
+            assert ("length", "reverse") in rail._matrices
+            dist, _ = rail.dijkstra([0, 5], reverse=True)
+            expected, _ = cg.dijkstra([0, 5], reverse=True)
+            np.testing.assert_array_equal(dist, expected)
+        finally:
+            parallel_routing._graphs.clear()
+            while parallel_routing._attached:
+                parallel_routing._attached.pop().close()
+
+def test_tree_batches_are_sized_from_node_count():
+    assert parallel_routing.tree_batch_size(36) == 256
+    big = parallel_routing.tree_batch_size(1_000_000)
+    assert 1 <= big < 256 and big * 1_000_000 * 12 <= parallel_routing.TREE_BATCH_BYTES
+    assert parallel_routing.tree_batch_size(10**9) == 1
+
+def test_parallel_router_batch_size():
+    cg = grid_graph()
+    rng = np.random.default_rng(2)
+    origins = rng.integers(0, cg.n_nodes, 40)
+    targets = rng.integers(0, cg.n_nodes, 40)
+    expected, _ = fallback_paths(cg, origins, targets, ["length"], np.zeros((40, 1), dtype=np.int64))
+
+    with parallel_routing.ParallelRouter({"road": cg}, n_workers=2, chunk_size=16, batch_size=3) as router:
+        routed = list(router.paths("road", origins, targets))
+
+    assert [p for p, _ in routed] == [None if p is None else p.tolist() for p in expected]
@@ -0,0 +1,50 @@
+import networkx as nx
+import numpy as np
+
+from utils.compiled_graph import CompiledGraph, compile_graph
+from utils.route_cache import MISSING, RouteCache, cached_node_path, cached_shortest_path
+
+def test_lru_evicts_least_recently_used():
+    cache = RouteCache(maxsize=2)
+    cache.put("a", [1])
+    cache.put("b", [2])
+    assert cache.get("a") == [1]  # "b" is now the oldest
+    cache.put("c", [3])
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == [1] and cache.get("c") == [3]
+    assert cache.stats()["evictions"] == 1 and len(cache) == 2
+
+def test_sqlite_tier_round_trip(tmp_path):
+    path = tmp_path / "routes.sqlite"
+    with RouteCache(maxsize=1, path=path, flush_every=2) as cache:
+        cache.put((1, 2, "length", "fp"), [1, 5, 2])
+        cache.put((3, 4, "length", "fp"), None)
+        cache.put((5, 6, "length", "fp"), [5, 6])
+        # Evicted from memory but still pending: read back before any flush
+        assert cache.get((1, 2, "length", "fp")) == [1, 5, 2]
+
+    with RouteCache(path=path) as cache:
+        assert cache.get((1, 2, "length", "fp")) == [1, 5, 2]
+        assert cache.get((3, 4, "length", "fp")) is None
+        assert cache.get((5, 6, "length", "fp")) == [5, 6]
+        assert cache.get((1, 2, "length", "other")) is MISSING
+        assert cache.stats()["disk_hits"] == 3
+
+def test_cached_paths_follow_graph_fingerprint():
+    G = nx.DiGraph()
+    G.add_edge("a", "b", length=1.0)
+    G.add_edge("b", "c", length=1.0)
+    G.add_edge("a", "c", length=5.0)
+    cache = RouteCache()
+
+    assert cached_node_path(compile_graph(G), "a", "c", cache=cache) == ["a", "b", "c"]
+    assert cached_node_path(compile_graph(G), "a", "c", cache=cache) == ["a", "b", "c"]
+    assert cache.hits == 1
+
+    # A changed weight is a different fingerprint, never the stale route
+    G.edges["a", "c"]["length"] = 1.0
+    cg = CompiledGraph.from_networkx(G)
+    assert cached_node_path(cg, "a", "c", cache=cache) == ["a", "c"]
+    assert cached_shortest_path(cg, 0, -1, cache=cache) is None
+    assert isinstance(cached_shortest_path(cg, cg.node_index("a"), cg.node_index("c"), cache=cache), np.ndarray)
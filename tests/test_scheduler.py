@@ -0,0 +1,64 @@
+import builtins
+import importlib
+
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    # The module builds its initial agent_states from a global the calling script provides
+    monkeypatch.setattr(builtins, "agent_home_buildings", {}, raising=False)
+    return importlib.import_module("models.scheduler")
+
+def trip(agent_id, mode, travel_time, destination):
+    return {"agent_id": agent_id, "mode": mode, "travel_time": travel_time, "destination": destination}
+
+@pytest.mark.parametrize("first, second", [((10, "short"), (30, "long")), ((30, "long"), (10, "short"))])
+def test_two_trips_of_one_agent_in_the_same_step(scheduler, tmp_path, first, second):
+    schedule = {0: [trip("a1", "walk", *first), trip("a1", "bus", *second)]}
+    agent_states = {"a1": {"status": "idle", "location": "home", "current_trip": None, "remaining_time": 0}}
+
+    log, (modal_minutes, agent_ids, modes) = scheduler.simulate_day(
+        schedule, [], agent_states, output_path=str(tmp_path / "log.json"), return_modal_time=True)
+
+    # The second trip supersedes the first: only its arrival ends the journey
+    steps = int(second[0] / 5)
+    status = [snapshot["agent_states"]["a1"]["status"] for snapshot in log[:steps]]
+    assert status == ["in_transit"] * (steps - 1) + ["idle"]
+    assert log[-1]["agent_states"]["a1"]["location"] == second[1]
+    assert modal_minutes[0, modes.index("bus")] == second[0]
+    assert modal_minutes[0, modes.index("walk")] == 0
+
+def initial_states():
+    return {
+        "a1": {"status": "idle", "location": "home", "current_trip": None, "remaining_time": 0},
+        "a2": {"status": "idle", "location": "home", "current_trip": None, "remaining_time": 0},
+        "a3": {"status": "idle", "location": "home", "current_trip": None, "remaining_time": 0},
+    }
+
+@pytest.mark.parametrize("suffix", ["csv", "parquet"])
+def test_change_log_reconstructs_full_progression(scheduler, tmp_path, suffix):
+    schedule = {
+        3: [trip("a1", "walk", 12, "work"), trip("a2", "bus", 40, "school")],
+        20: [trip("a1", "bus", 25, "home")],
+        100: [trip("a3", "rail", 5, "mall"), trip("a2", "walk", 7, "home")],
+    }
+    log = scheduler.simulate_day(schedule, [], initial_states(), output_path=str(tmp_path / "log.json"))
+    expected = pd.DataFrame([
+        dict(timestep=snapshot["timestep"], agent_id=agent_id, **state)
+        for snapshot in log for agent_id, state in snapshot["agent_states"].items()
+    ])
+
+    change_path = scheduler.simulate_day(schedule, [], initial_states(), output_path=str(tmp_path / "changes.json"),
+                                         log_format="changes", change_log_path=str(tmp_path / f"changes.{suffix}"),
+                                         chunk_size=4)
+    changes = scheduler.read_change_log(change_path)
+    # Initial states plus one row per agent and step with a boarding or an arrival (a3 does both at 100)
+    assert len(changes) == 3 + 9
+
+    full = scheduler.reconstruct_progression(change_path)
+    pd.testing.assert_frame_equal(full, expected[full.columns.tolist()], check_dtype=False)
+
+    some = scheduler.reconstruct_progression(change_path, timesteps=[110, 4])
+    pd.testing.assert_frame_equal(some, expected[expected["timestep"].isin([4, 110])].reset_index(drop=True),
+                                  check_dtype=False)
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from models.sharded_runner import merge_snapshots
+from models.simulation_engine import run_simulation
+from models.snapshot_stream import read_snapshot_table
+from tests.test_simulation_engine import make_agents
+
+def read_metrics(output_dir):
+    metrics = pd.read_csv(output_dir / "agent_metrics.csv")
+    metrics["key"] = metrics["key"].astype(str)
+    return metrics.sort_values(["group", "time", "key"]).reset_index(drop=True)
+
+def write_shard_stream(path, agent_pos, times):
+    rows = [dict(tick=t // 60, time=t, agent_id=f"a{i}", state=i % 3, x=float(i), y=float(t + i))
+            for t in times for i in agent_pos]
+    # Small row groups split every snapshot, as ParquetWriter does past its size limit
+    pq.write_table(pa.Table.from_pylist(rows), path, row_group_size=3)
+
+def test_merge_snapshots_groups_rows_by_time(tmp_path):
+    times = [0, 300, 600]
+    shard_positions = [np.array([0, 2, 4, 6]), np.array([1, 3, 5])]
+    paths = []
+    for s, positions in enumerate(shard_positions):
+        path = str(tmp_path / f"shard_{s}.parquet")
+        write_shard_stream(path, positions, times)
+        paths.append([path])
+    agent_ids = np.array([f"a{i}" for i in range(7)], dtype=object)
+    out_path = tmp_path / "snapshots.parquet"
+    merge_snapshots(paths, shard_positions, agent_ids, str(out_path))
+
+    table = read_snapshot_table(out_path).to_pandas()
+    assert table["time"].tolist() == [t for t in times for _ in range(7)]
+    assert table["x"].tolist() == [float(i) for _ in times for i in range(7)]
+    assert table["y"].tolist() == [float(t + i) for t in times for i in range(7)]
+
+def test_sharded_run_merges_agent_metrics(tmp_path):
+    agents = make_agents(30, seed=1)
+    kwargs = dict(snapshot_format="parquet", collect_metrics=True)
+    run_simulation(agents, 7200, 300, n_workers=1, output_dir=str(tmp_path / "single"), verbose=False, **kwargs)
+    run_simulation(agents, 7200, 300, n_workers=3, output_dir=str(tmp_path / "sharded"), **kwargs)
+
+    pd.testing.assert_frame_equal(read_metrics(tmp_path / "single"), read_metrics(tmp_path / "sharded"))
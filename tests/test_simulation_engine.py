@@ -0,0 +1,116 @@
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from shapely.geometry import LineString, Point
+
+from models.simulation_engine import SimulationEngine, ceil_to_tick
+
+def make_agents(n=20, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(n):
+        home = Point(rng.uniform(0, 1000), rng.uniform(0, 1000))
+        dest = Point(rng.uniform(0, 1000), rng.uniform(0, 1000))
+        schedule = [dict(start_time=float(rng.uniform(0, 3000)), route=LineString([home, dest]),
+                         travel_time=float(rng.uniform(300, 3000)), purpose=2, mode="jeep",
+                         destination_geom=dest, dest_mucep=1)]
+        rows.append(dict(agent_id=f"a{i}", household_id=f"h{i // 3}", state="at_home", current_trip=0,
+                         schedule=schedule, geometry=home))
+    return gpd.GeoDataFrame(rows, geometry="geometry", crs="EPSG:32651")
+
+def test_failed_run_leaves_readable_snapshots(tmp_path):
+    sim = SimulationEngine(make_agents(), output_dir=str(tmp_path), snapshot_format="parquet",
+                           background_output=True, verbose=False)
+    tick_agents = sim.tick_agents
+
+    def failing_tick():
+        if sim.tick == 5:
+            raise RuntimeError("boom")
+        tick_agents()
+
+    sim.tick_agents = failing_tick
+    with pytest.raises(RuntimeError, match="boom"):
+        sim.run()
+
+    assert sim.writer is None and sim.snapshot_writer is None
+    table = pq.read_table(sim.snapshot_paths[0])
+    assert table.num_rows == 5 * 20
+
+def test_fresh_run_clears_earlier_checkpoints(tmp_path):
+    checkpoint_dir = tmp_path / "checkpoints"
+    checkpoint_dir.mkdir()
+    stale = checkpoint_dir / "checkpoint_9999.npz"
+    stale.write_bytes(b"")
+
+    sim = SimulationEngine(make_agents(), output_dir=str(tmp_path), checkpoint_interval=3600,
+                           snapshot_format="parquet", verbose=False)
+    sim.run()
+
+    assert not stale.exists()
+    assert list(checkpoint_dir.glob("checkpoint_*.npz"))
+
+def test_checkpointed_run_merges_snapshot_parts(tmp_path):
+    sim = SimulationEngine(make_agents(), output_dir=str(tmp_path), checkpoint_interval=3600,
+                           snapshot_format="parquet", max_time=4 * 3600, verbose=False)
+    sim.run()
+
+    merged = tmp_path / "snapshots.parquet"
+    assert sim.snapshot_paths == [str(merged)]
+    assert [p.name for p in tmp_path.glob("snapshots*")] == ["snapshots.parquet"]
+    expected = pq.read_table(merged)
+    ticks = expected["tick"].to_numpy()
+    assert np.all(np.diff(ticks) >= 0) and len(ticks) == len(np.unique(ticks)) * 20
+
+    # Resuming the finished run must not duplicate the ticks after the checkpoint
+    resumed = SimulationEngine.resume(make_agents(), output_dir=str(tmp_path), verbose=False)
+    resumed.run()
+    assert pq.read_table(merged).equals(expected)
+
+def test_resume_rejects_checkpoint_of_other_inputs(tmp_path):
+    sim = SimulationEngine(make_agents(seed=0), output_dir=str(tmp_path), checkpoint_interval=3600,
+                           snapshot_format="parquet", verbose=False)
+    sim.run()
+
+    # Same numbers of agents and trips, different schedules
+    with pytest.raises(ValueError, match="does not match"):
+        SimulationEngine.resume(make_agents(seed=1), output_dir=str(tmp_path), verbose=False)
+    SimulationEngine.resume(make_agents(seed=0), output_dir=str(tmp_path), verbose=False)
+
+def test_trips_home_count_as_home_activity(tmp_path):
+    agents = make_agents(6)
+    for schedule in agents["schedule"]:
+        work = schedule[0]
+        schedule.append(dict(work, start_time=work["start_time"] + 6000, purpose=1, dest_mucep=2))
+    sim = SimulationEngine(agents, output_dir=str(tmp_path), snapshot_format="parquet", collect_metrics=True,
+                           max_time=20000, verbose=False)
+    sim.run()
+
+    activity = sim.metrics.to_frame().query("group == 'activity'")
+    last = activity[activity["time"] == activity["time"].max()]
+    assert dict(zip(last["key"], last["count"])) == {"home": 6, 2: 0}
+
+def test_event_scheduling_matches_tick_scheduling(tmp_path):
+    agents = make_agents(12, seed=3)
+    for schedule in agents["schedule"]:
+        first = schedule[0]
+        schedule.append(dict(first, start_time=first["start_time"] + 4000, travel_time=first["travel_time"] / 2,
+                             purpose=1, dest_mucep=2))
+    results = {}
+    for scheduling in ("tick", "event"):
+        sim = SimulationEngine(agents, output_dir=str(tmp_path / scheduling), scheduling=scheduling,
+                               snapshot_format="parquet", max_time=12000, verbose=False)
+        sim.run()
+        results[scheduling] = sim.log_frame(), pq.read_table(sim.snapshot_paths[0]).to_pandas()
+
+    tick_log, tick_snapshots = results["tick"]
+    event_log, event_snapshots = results["event"]
+    assert (tick_log["event"] == "ARRIVE").sum() == 24
+    pd.testing.assert_frame_equal(event_log, tick_log)
+    pd.testing.assert_frame_equal(event_snapshots.drop(columns=["x", "y"]), tick_snapshots.drop(columns=["x", "y"]))
+    np.testing.assert_allclose(event_snapshots[["x", "y"]], tick_snapshots[["x", "y"]], atol=1e-6)
+
+def test_ceil_to_tick():
+    times = np.array([0.0, 1.0, 60.0, 60.0000001, 119.99, np.nan])
+    np.testing.assert_array_equal(ceil_to_tick(times, 60), [0.0, 60.0, 60.0, 120.0, 120.0, np.nan])
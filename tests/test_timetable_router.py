@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+from utils.timetable_router import Timetable, gtfs_time_to_seconds
+
+STOPS = ["A", "B", "C", "D", "E", "W"]
+
+def hms(text):
+    h, m, s = (text + ":00").split(":")[:3]
+    return int(h) * 3600 + int(m) * 60 + int(s)
+
+def timetable(trips, footpaths=(), min_transfer_s=0):
+    """trips: trip id → [(stop, "HH:MM"), ...]; footpaths: (stop, stop, seconds), walkable both ways."""
+    code = {stop: i for i, stop in enumerate(STOPS)}
+    dep_stop, arr_stop, dep_time, arr_time, trip = [], [], [], [], []
+    for t, calls in enumerate(trips.values()):
+        for (a, dep), (b, arr) in zip(calls[:-1], calls[1:]):
+            dep_stop.append(code[a])
+            arr_stop.append(code[b])
+            dep_time.append(hms(dep))
+            arr_time.append(hms(arr))
+            trip.append(t)
+    links = sorted({(code[a], code[b], w) for a, b, w in footpaths} | {(code[b], code[a], w) for a, b, w in footpaths})
+    source = np.array([a for a, _, _ in links], dtype=np.int64)
+    return Timetable(STOPS, list(trips), list(trips), np.arange(len(trips)), dep_stop, arr_stop, dep_time, arr_time,
+                     trip, foot_indptr=np.searchsorted(source, np.arange(len(STOPS) + 1)),
+                     foot_target=np.array([b for _, b, _ in links], dtype=np.int32),
+                     foot_time=np.array([w for _, _, w in links], dtype=np.int64), min_transfer_s=min_transfer_s)
+
+def test_earliest_arrival_on_one_trip():
+    tt = timetable({"T1": [("A", "08:00"), ("B", "08:10"), ("C", "08:20")]})
+
+    journey = tt.earliest_arrival("A", hms("07:55"), "C")
+    assert journey["arrival"] == hms("08:20")
+    assert journey["travel_time"] == hms("08:20") - hms("07:55")
+    assert journey["transfers"] == 0
+    assert [(leg["from_stop"], leg["to_stop"], leg["trip_id"]) for leg in journey["legs"]] == [("A", "C", "T1")]
+    assert tt.earliest_arrival("A", hms("08:01"), "C") is None
+
+def test_transfer_respects_min_transfer_time():
+    trips = {
+        "T1": [("A", "08:00"), ("C", "08:20")],
+        "T2": [("C", "08:21"), ("D", "08:30")],
+        "T3": [("C", "08:25"), ("D", "08:45")],
+    }
+    quick = timetable(trips).earliest_arrival("A", hms("08:00"), "D")
+    assert quick["arrival"] == hms("08:30")
+    assert quick["transfers"] == 1
+    assert [leg["trip_id"] for leg in quick["legs"]] == ["T1", "T2"]
+
+    slow = timetable(trips, min_transfer_s=120).earliest_arrival("A", hms("08:00"), "D")
+    assert slow["arrival"] == hms("08:45")
+    assert [leg["trip_id"] for leg in slow["legs"]] == ["T1", "T3"]
+
+def test_walk_from_origin_needs_no_transfer_slack():
+    # W is 42 s from B; the bus leaves B at 08:02
+    tt = timetable({"T1": [("B", "08:02"), ("E", "08:15")]}, footpaths=[("W", "B", 42)], min_transfer_s=120)
+
+    journey = tt.earliest_arrival("W", hms("08:00"), "E")
+    assert journey["arrival"] == hms("08:15")
+    assert [leg["mode"] for leg in journey["legs"]] == ["walk", "transit"]
+
+    profile = tt.profile("W", "E", hms("07:00"), hms("09:00"))
+    assert profile[["departure", "arrival"]].values.tolist() == [[hms("08:02") - 42, hms("08:15")]]
+
+def test_walk_after_a_stop_first_reached_on_foot():
+    # B is reached on foot from A first; E is only reachable by walking on from the later vehicle arrival at B
+    trips = {"T1": [("A", "08:00"), ("C", "08:05"), ("B", "08:10")]}
+    tt = timetable(trips, footpaths=[("A", "B", 60), ("B", "E", 60)], min_transfer_s=60)
+
+    journey = tt.earliest_arrival("A", hms("08:00"), "E")
+    assert journey["arrival"] == hms("08:11")
+    assert [(leg["mode"], leg["from_stop"], leg["to_stop"]) for leg in journey["legs"]] == [
+        ("transit", "A", "B"), ("walk", "B", "E")]
+
+def test_times_past_midnight():
+    assert gtfs_time_to_seconds(pd.Series(["23:50:00", "24:10:05", None])).tolist() == [85800, 87005, -1]
+    stops = pd.DataFrame({"stop_id": ["A", "B"], "stop_lat": [14.60, 14.61], "stop_lon": [121.00, 121.01]})
+    stop_times = pd.DataFrame({
+        "trip_id": ["N1", "N1"], "route_id": ["R1", "R1"], "stop_id": ["A", "B"], "stop_sequence": [1, 2],
+        "arrival_time": ["23:50:00", "24:10:00"], "departure_time": ["23:50:00", "24:10:00"],
+    })
+    tt = Timetable.from_gtfs(stops, stop_times)
+
+    journey = tt.earliest_arrival("A", hms("23:45"), "B")
+    assert journey["arrival"] == hms("24:10")
+    assert journey["legs"][0]["route_id"] == "R1"
+
+def test_profile_keeps_only_pareto_optimal_departures():
+    tt = timetable({
+        "T1": [("A", "07:50"), ("C", "08:25")],  # dominated: T2 leaves later and arrives earlier
+        "T2": [("A", "08:00"), ("C", "08:20")],
+        "T3": [("A", "08:05"), ("C", "08:30")],
+        "T4": [("A", "09:30"), ("C", "09:40")],  # outside the window
+    })
+
+    profile = tt.profile("A", "C", hms("07:00"), hms("09:00"))
+    assert profile.columns.tolist() == ["departure", "arrival", "travel_time", "transfers"]
+    assert profile[["departure", "arrival"]].values.tolist() == [
+        [hms("08:05"), hms("08:30")], [hms("08:00"), hms("08:20")]]
+    assert profile["transfers"].tolist() == [0, 0]
+
+def test_profile_matches_earliest_arrival_with_transfers():
+    trips = {
+        "T1": [("A", "08:00"), ("B", "08:10"), ("C", "08:20")],
+        "T2": [("B", "08:11"), ("D", "08:30")],  # 1 min after T1 reaches B: too tight
+        "T3": [("C", "08:25"), ("D", "08:35")],
+        "T4": [("A", "08:15"), ("D", "09:00")],
+    }
+    tt = timetable(trips, min_transfer_s=120)
+
+    profile = tt.profile("A", "D", hms("07:00"), hms("09:00"))
+    assert profile[["departure", "arrival", "transfers"]].values.tolist() == [
+        [hms("08:15"), hms("09:00"), 0], [hms("08:00"), hms("08:35"), 1]]
+    for departure, arrival in profile[["departure", "arrival"]].values.tolist():
+        assert tt.earliest_arrival("A", departure, "D")["arrival"] == arrival
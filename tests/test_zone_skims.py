@@ -0,0 +1,71 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.compiled_graph import compile_graph
+from utils.zone_skims import ZoneSkims, attach_skims, build_skims
+
+def toy_graph(seed=0, cost=True):
+    rng = np.random.default_rng(seed)
+    G = nx.DiGraph()
+    for i in range(30):
+        G.add_node(i, x=float(i), y=0.0)
+    for _ in range(150):
+        u, v = (int(n) for n in rng.choice(30, 2, replace=False))
+        attrs = dict(travel_time=float(rng.uniform(1, 10)), length=float(rng.uniform(10, 500)),
+                     route=f"R{rng.integers(0, 4)}")
+        if cost:
+            attrs["travel_cost"] = float(rng.uniform(0, 5))
+        G.add_edge(u, v, **attrs)
+    return G
+
+def test_skims_match_networkx_shortest_paths(tmp_path):
+    G = toy_graph()
+    zones = [101.0, 102.0, 103.0, 104.0, 105.0, 106.0]
+    zone_nodes = compile_graph(G).node_index([0, 5, 11, 17, 23, 29])
+    skims = build_skims({"road": G}, {"road": zone_nodes}, zones, tmp_path, n_workers=2, chunk_size=4)
+
+    mismatches = 0
+    for zo, o in zip(zones, [0, 5, 11, 17, 23, 29]):
+        for zd, d in zip(zones, [0, 5, 11, 17, 23, 29]):
+            try:
+                path = nx.dijkstra_path(G, o, d, weight="travel_time")
+            except nx.NetworkXNoPath:
+                mismatches += not np.isnan(skims.get(zo, zd, "road"))
+                continue
+            edges = [G.edges[u, v] for u, v in zip(path[:-1], path[1:])]
+            routes = [e["route"] for e in edges]
+            boardings = sum(1 for k, r in enumerate(routes) if k == 0 or r != routes[k - 1])
+            expected = {
+                "travel_time": sum(e["travel_time"] for e in edges),
+                "distance": sum(e["length"] for e in edges),
+                "cost": sum(e["travel_cost"] for e in edges),
+                "transfers": max(boardings - 1, 0),
+            }
+            for metric, value in expected.items():
+                mismatches += not np.isclose(skims.get(zo, zd, "road", metric), value, rtol=1e-5, atol=1e-4)
+    assert mismatches == 0
+
+def test_zone_codes_match_across_int_float_and_str(tmp_path):
+    G = toy_graph()
+    build_skims({"road": G}, {"road": compile_graph(G).node_index([0, 5, 11])}, [3.0, 6.0, 9.0], tmp_path, n_workers=1)
+    skims = ZoneSkims(tmp_path)
+
+    expected = skims.lookup([3.0], [6.0], "road")
+    assert not np.isnan(expected[0])
+    np.testing.assert_array_equal(skims.lookup([3], [6], "road"), expected)
+    np.testing.assert_array_equal(skims.lookup(["3"], ["6"], "road"), expected)
+    assert np.isnan(skims.lookup([4], [6], "road")[0])
+
+def test_graph_without_cost_gets_no_cost_skim_and_stays_unchanged(tmp_path):
+    G = toy_graph(cost=False)
+    skims = build_skims({"rail": G}, {"rail": compile_graph(G).node_index([0, 5])}, ["A", "B"], tmp_path, n_workers=1)
+
+    assert skims.metrics["rail"] == ["travel_time", "distance", "transfers"]
+    with pytest.raises(KeyError):
+        skims.lookup(["A"], ["B"], "rail", "cost")
+    trips = pd.DataFrame({"origin_mucep_code": ["A"], "destination_mucep_code": ["B"]})
+    trips = attach_skims(trips, skims, metrics=("travel_time", "cost"))
+    assert "rail_travel_time" in trips and "rail_cost" not in trips
+    assert "skim_time" not in compile_graph(G).edge_attrs
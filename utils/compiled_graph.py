@@ -0,0 +1,387 @@
+# compiled_graph.py
+
+import copy
+import hashlib
+import json
+import weakref
+import numpy as np
+import pandas as pd
+
+EDGE_FLOAT_ATTRS = ("length", "travel_time", "cost")
+EDGE_CODE_ATTRS = ("mode", "route")
+
+# networkx edge attributes read for each compiled attribute, in order of preference
+ATTR_SOURCES = {
+    "length": ("length", "weight"),
+    "travel_time": ("travel_time",),
+    "cost": ("travel_cost", "cost"),
+    "mode": ("mode",),
+    "route": ("route", "route_id"),
+}
+
+# Arrays of a compiled graph, besides the "edge:<attr>" attributes and compiled weight matrices
+GRAPH_ARRAYS = ("node_ids", "node_x", "node_y", "edge_source", "edge_target", "edge_key",
+                "pair_start", "pair_key", "edge_pair", "indices", "indptr")
+
+def _first_attr(data, names):
+    for name in names:
+        value = data.get(name)
+        if value is not None:
+            return value
+    return None
+
+def _plain_array(values):
+    """Object array of ids as int64 when they are all integers, else as fixed-width strings."""
+    if all(isinstance(value, (int, np.integer)) and not isinstance(value, bool) for value in values):
+        return values.astype(np.int64)
+    return values.astype(str)
+
+def _encode(values):
+    """Integer codes (-1 for missing) and the list of names they index."""
+    codes, names = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    return codes.astype(np.int32), list(names)
+
+class CompiledGraph:
+    """
+    Read-only CSR form of a routing graph with integer node ids.
+
+    Nodes are numbered 0..n-1 and node_ids maps them back to the original
+    ids. Edges are sorted by (source, target); parallel edges are kept in
+    the edge arrays and collapsed to the cheapest one per (source, target)
+    pair when a weight is compiled into a sparse matrix.
+
+    Edge attributes: length, travel_time, cost (float64, NaN when missing),
+    mode and route (int32 codes into mode_names / route_names, -1 when
+    missing) and key (the networkx edge key, for looking up the original
+    edge data). Extra per-edge weights can be added with add_weight().
+    """
+
+    def __init__(self, node_ids, edge_source, edge_target, edge_attrs, mode_names=(), route_names=(),
+                 node_x=None, node_y=None, edge_key=None):
+        self.node_ids = np.asarray(node_ids)
+        n = len(self.node_ids)
+        order = np.lexsort((edge_target, edge_source))
+        self.edge_source = np.asarray(edge_source, dtype=np.int32)[order]
+        self.edge_target = np.asarray(edge_target, dtype=np.int32)[order]
+        self.edge_attrs = {name: np.asarray(values)[order] for name, values in edge_attrs.items()}
+        self.edge_key = None if edge_key is None else np.asarray(edge_key)[order]
+        self.mode_names = list(mode_names)
+        self.route_names = list(route_names)
+        self.node_x = np.full(n, np.nan) if node_x is None else np.asarray(node_x, dtype=np.float64)
+        self.node_y = np.full(n, np.nan) if node_y is None else np.asarray(node_y, dtype=np.float64)
+
+        # Unique (source, target) pairs in CSR layout
+        pair_key = self.edge_source.astype(np.int64) * n + self.edge_target
+        first = np.ones(len(pair_key), dtype=bool)
+        first[1:] = pair_key[1:] != pair_key[:-1]
+        self.pair_start = np.flatnonzero(first)
+        self.pair_key = pair_key[self.pair_start]
+        self.edge_pair = np.cumsum(first) - 1
+        self.indices = self.edge_target[self.pair_start]
+        self.indptr = np.searchsorted(self.edge_source[self.pair_start], np.arange(n + 1)).astype(np.int32)
+
+        self._node_index = None
+        self._matrices = {}
+        self._fingerprints = {}
+
+    @classmethod
+    def from_networkx(cls, G):
+        """Compile a networkx (Multi)(Di)Graph. Undirected edges are added in both directions."""
+        node_ids = list(G.nodes)
+        node_pos = {node: i for i, node in enumerate(node_ids)}
+        if G.is_multigraph():
+            edges = [(u, v, k, d) for u, v, k, d in G.edges(keys=True, data=True)]
+        else:
+            edges = [(u, v, None, d) for u, v, d in G.edges(data=True)]
+        if not G.is_directed():
+            edges += [(v, u, k, d) for u, v, k, d in edges if u != v]
+
+        attrs = {
+            name: [_first_attr(d, ATTR_SOURCES[name]) for _, _, _, d in edges]
+            for name in EDGE_FLOAT_ATTRS + EDGE_CODE_ATTRS
+        }
+        edge_attrs = {name: np.array(attrs[name], dtype=np.float64) for name in EDGE_FLOAT_ATTRS}
+        edge_attrs["mode"], mode_names = _encode(attrs["mode"])
+        edge_attrs["route"], route_names = _encode(attrs["route"])
+
+        node_x = np.array([_first_attr(G.nodes[n], ("x", "lon")) for n in node_ids], dtype=np.float64)
+        node_y = np.array([_first_attr(G.nodes[n], ("y", "lat")) for n in node_ids], dtype=np.float64)
+        return cls(
+            np.array(node_ids, dtype=object),
+            np.array([node_pos[u] for u, _, _, _ in edges], dtype=np.int32),
+            np.array([node_pos[v] for _, v, _, _ in edges], dtype=np.int32),
+            edge_attrs,
+            mode_names=mode_names,
+            route_names=route_names,
+            node_x=node_x,
+            node_y=node_y,
+            edge_key=np.array([k for _, _, k, _ in edges], dtype=object) if G.is_multigraph() else None,
+        )
+
+    def to_arrays(self, weights=(), reverse=False):
+        """
+        The graph as a flat dict of plain (non-object) arrays plus a small
+        JSON-able meta dict. For each of `weights` the compiled matrix is
+        included too ("matrix:<weight>:data" / ":best_edge"), and with
+        reverse=True the reversed matrix as well ("matrix:<weight>:reverse:data"
+        / ":indices" / ":indptr"). Object ids become int64 or strings.
+        from_arrays() rebuilds the graph on top of these arrays without
+        copying them.
+        """
+        arrays = {}
+        for name in GRAPH_ARRAYS:
+            value = getattr(self, name)
+            if value is not None:
+                arrays[name] = _plain_array(value) if value.dtype == object else value
+        for name, values in self.edge_attrs.items():
+            arrays[f"edge:{name}"] = values
+        for weight in weights:
+            m, best_edge = self.matrix(weight)
+            arrays[f"matrix:{weight}:data"] = m.data
+            arrays[f"matrix:{weight}:best_edge"] = best_edge
+            if reverse:
+                r = self.reverse_matrix(weight)
+                arrays[f"matrix:{weight}:reverse:data"] = r.data
+                arrays[f"matrix:{weight}:reverse:indices"] = r.indices
+                arrays[f"matrix:{weight}:reverse:indptr"] = r.indptr
+        meta = {"mode_names": self.mode_names, "route_names": self.route_names}
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Graph view over arrays from to_arrays() (e.g. shared memory or memmaps); nothing is copied."""
+        from scipy.sparse import csr_matrix
+
+        cg = cls.__new__(cls)
+        for name in GRAPH_ARRAYS:
+            setattr(cg, name, arrays.get(name))
+        cg.edge_attrs = {name[len("edge:"):]: values for name, values in arrays.items() if name.startswith("edge:")}
+        cg.mode_names = list(meta["mode_names"])
+        cg.route_names = list(meta["route_names"])
+        cg._node_index = None
+        cg._matrices = {}
+        cg._fingerprints = {}
+        n = len(cg.node_ids)
+        for name in arrays:
+            if name.startswith("matrix:") and name.endswith(":reverse:data"):
+                weight = name[len("matrix:"):-len(":reverse:data")]
+                indices, indptr = arrays[f"matrix:{weight}:reverse:indices"], arrays[f"matrix:{weight}:reverse:indptr"]
+                m = csr_matrix((arrays[name], indices, indptr), shape=(n, n), copy=False)
+                cg._matrices[(weight, "reverse")] = m
+            elif name.startswith("matrix:") and name.endswith(":data"):
+                weight = name[len("matrix:"):-len(":data")]
+                m = csr_matrix((arrays[name], cg.indices, cg.indptr), shape=(n, n), copy=False)
+                cg._matrices[weight] = (m, arrays[f"matrix:{weight}:best_edge"])
+        return cg
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_source)
+
+    def __getattr__(self, name):
+        # Edge attribute arrays: cg.length, cg.travel_time, cg.mode, ...
+        edge_attrs = self.__dict__.get("edge_attrs", {})
+        if name in edge_attrs:
+            return edge_attrs[name]
+        raise AttributeError(name)
+
+    def copy(self):
+        """Shallow copy sharing the arrays; weights added to the copy leave this graph untouched."""
+        cg = copy.copy(self)
+        cg.edge_attrs = dict(self.edge_attrs)
+        cg._matrices = dict(self._matrices)
+        cg._fingerprints = dict(self._fingerprints)
+        return cg
+
+    def add_weight(self, name, values):
+        """Register a per-edge weight array (in edge order) under name."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (self.n_edges,):
+            raise ValueError(f"Weight {name!r} needs one value per edge")
+        self.edge_attrs[name] = values
+        self._matrices.pop(name, None)
+        self._matrices.pop((name, "reverse"), None)
+        self._fingerprints.pop(name, None)
+
+    def fingerprint(self, weight=None):
+        """
+        Short hash of the network (node ids, edges and their attributes) and,
+        if given, of one weight array. Keys cached routes to this graph.
+        """
+        if weight not in self._fingerprints:
+            if weight is None:
+                h = hashlib.sha1("\x00".join(map(str, self.node_ids)).encode())
+                for array in (self.edge_source, self.edge_target):
+                    h.update(np.ascontiguousarray(array).tobytes())
+                for name in EDGE_FLOAT_ATTRS + EDGE_CODE_ATTRS:
+                    if name in self.edge_attrs:
+                        h.update(np.ascontiguousarray(self.edge_attrs[name]).tobytes())
+                h.update(json.dumps([self.mode_names, self.route_names], default=str).encode())
+            else:
+                h = hashlib.sha1(self.fingerprint().encode())
+                h.update(np.ascontiguousarray(self.edge_attrs[weight]).tobytes())
+            self._fingerprints[weight] = h.hexdigest()[:16]
+        return self._fingerprints[weight]
+
+    def mode_mask(self, mode, default=None):
+        """Edges whose mode is `mode`; edges without a mode count as `default`."""
+        code = self.mode_names.index(mode) if mode in self.mode_names else -2
+        mask = self.mode == code
+        if default is not None and mode == default:
+            mask |= self.mode == -1
+        return mask
+
+    def node_index(self, node_ids):
+        """Integer ids for original node ids; -1 for nodes not in the graph."""
+        if self._node_index is None:
+            self._node_index = pd.Index(self.node_ids)
+        scalar = np.ndim(node_ids) == 0
+        ids = self._node_index.get_indexer(pd.Index([node_ids] if scalar else list(node_ids), dtype=object))
+        return int(ids[0]) if scalar else ids
+
+    def matrix(self, weight):
+        """
+        Sparse CSR matrix of an edge weight (attribute name), keeping the
+        cheapest parallel edge per (source, target). Also returns the edge id
+        chosen for every matrix entry. Missing (NaN) weights become inf.
+        """
+        if weight not in self._matrices:
+            from scipy.sparse import csr_matrix
+
+            w = self.edge_attrs[weight].astype(np.float64)
+            w = np.where(np.isnan(w), np.inf, w)
+            best_edge = np.lexsort((w, self.edge_pair))[self.pair_start]
+            n = self.n_nodes
+            m = csr_matrix((w[best_edge], self.indices, self.indptr), shape=(n, n))
+            self._matrices[weight] = (m, best_edge)
+        return self._matrices[weight]
+
+    def reverse_matrix(self, weight):
+        """The matrix of weight with every edge reversed (CSR)."""
+        if (weight, "reverse") not in self._matrices:
+            self._matrices[(weight, "reverse")] = self.matrix(weight)[0].T.tocsr()
+        return self._matrices[(weight, "reverse")]
+
+    def dijkstra(self, sources, weight="length", reverse=False, limit=np.inf):
+        """
+        Single- or multi-source distances and predecessors from scipy csgraph.
+        sources are integer node ids. With reverse=True the searches run on
+        the reversed graph (distances *to* the sources).
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        m = self.reverse_matrix(weight) if reverse else self.matrix(weight)[0]
+        return dijkstra(m, directed=True, indices=sources, return_predecessors=True, limit=limit)
+
+    def edge_ids_between(self, sources, targets, weight="length"):
+        """Edge ids for source -> target node pairs (the cheapest parallel edges for weight)."""
+        keys = np.asarray(sources, dtype=np.int64) * self.n_nodes + np.asarray(targets, dtype=np.int64)
+        return self.matrix(weight)[1][np.searchsorted(self.pair_key, keys)]
+
+    def edge_ids(self, path, weight="length"):
+        """Edge ids along a path of integer node ids."""
+        path = np.asarray(path, dtype=np.int64)
+        return self.edge_ids_between(path[:-1], path[1:], weight)
+
+    def path_weight(self, path, attr, weight="length"):
+        return float(self.edge_attrs[attr][self.edge_ids(path, weight)].sum())
+
+    def shortest_path_indices(self, source, target, weight="length"):
+        """Shortest path between integer node ids as an index array, or None."""
+        if source < 0 or target < 0:
+            return None
+        dist, pred = self.dijkstra(source, weight)
+        return path_from_predecessors(pred, source, target)
+
+    def shortest_path(self, source, target, weight="length"):
+        """Shortest path between original node ids as a list, or None if there is none."""
+        path = self.shortest_path_indices(self.node_index(source), self.node_index(target), weight)
+        return None if path is None else self.node_ids[path].tolist()
+
+def path_from_predecessors(pred, source, target):
+    """Walk a scipy predecessor row back from target; None if target is unreachable."""
+    if source == target:
+        return np.array([source], dtype=np.int64)
+    if pred[target] < 0:
+        return None
+    path = [target]
+    node = target
+    while node != source:
+        node = pred[node]
+        path.append(node)
+    return np.array(path[::-1], dtype=np.int64)
+
+_compiled = weakref.WeakKeyDictionary()
+
+def compile_graph(G):
+    """
+    CompiledGraph for a networkx graph, built once per graph object and
+    reused afterwards (recompile after mutating G with CompiledGraph.from_networkx).
+    A CompiledGraph is returned as is.
+    """
+    if isinstance(G, CompiledGraph):
+        return G
+    cg = _compiled.get(G)
+    if cg is None:
+        cg = _compiled[G] = CompiledGraph.from_networkx(G)
+    return cg
+
+GRAPH_FORMAT_VERSION = 1
+
+def _json_value(value):
+    return value.item() if isinstance(value, np.generic) else str(value)
+
+def save_graph(G, path, weights=("length",)):
+    """
+    Write a graph (networkx or CompiledGraph) as a directory of raw .npy
+    arrays (see CompiledGraph.to_arrays, including the compiled matrices of
+    `weights`) and a versioned manifest.json. load_graph memory-maps it
+    back, so processes opening the same directory share it through the
+    page cache.
+    """
+    from pathlib import Path
+
+    cg = compile_graph(G)
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    arrays, meta = cg.to_arrays(weights=[w for w in weights if w in cg.edge_attrs])
+    files = {}
+    for key, array in arrays.items():
+        name = key.replace(":", "__") + ".npy"
+        np.save(path / name, np.ascontiguousarray(array))
+        files[key] = {"file": name, "dtype": array.dtype.str, "shape": list(array.shape)}
+    manifest = {
+        "version": GRAPH_FORMAT_VERSION,
+        "n_nodes": cg.n_nodes,
+        "n_edges": cg.n_edges,
+        "fingerprint": cg.fingerprint(),
+        "meta": meta,
+        "arrays": files,
+    }
+    # The manifest goes last: a directory without one is an incomplete write
+    with open(path / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2, default=_json_value)
+    return path
+
+def load_graph(path, mmap=True):
+    """
+    CompiledGraph saved by save_graph. With mmap the arrays are read-only
+    np.memmap views (opening costs the same whatever the graph size);
+    otherwise they are read into memory.
+    """
+    from pathlib import Path
+
+    path = Path(path)
+    with open(path / "manifest.json") as f:
+        manifest = json.load(f)
+    if manifest["version"] != GRAPH_FORMAT_VERSION:
+        raise ValueError(f"Unsupported graph format version {manifest['version']} in {path}")
+    arrays = {
+        key: np.load(path / spec["file"], mmap_mode="r" if mmap else None)
+        for key, spec in manifest["arrays"].items()
+    }
+    return CompiledGraph.from_arrays(arrays, manifest["meta"])
@@ -28,6 +28,23 @@ SIM_DURATION = 86400  # 24 hours
 
 POPULATION_FRACTION = 0.10
 
+# Parallel runs: worker processes and how agents are sharded ("household_id" or "home_mucep").
+# 1 runs one engine in this process. With more, every worker is sent a pickled copy of its shard's
+# agents (schedules and route geometries), and snapshots become one merged Parquet file instead of
+# the per-snapshot GeoJSON a single engine writes by default.
+N_WORKERS = 1
+SHARD_BY = "household_id"
+
+# Seconds of simulated time between checkpoints (None disables checkpointing)
+CHECKPOINT_INTERVAL = 3600
+
+# Route cache: in-memory LRU size and the on-disk tier shared across runs (None disables it)
+ROUTE_CACHE_SIZE = 100_000
+ROUTE_CACHE_PATH = PROCESSED_DATA_DIR / "route_cache.sqlite"
+
+# Zone x zone skim matrices (memory-mapped .npy, see utils/zone_skims.py)
+SKIM_DIR = PROCESSED_DATA_DIR / "skims"
+
 # Mode utility weights (modifiable later)
 MODE_WEIGHTS = {
     "walk": {"time": -1.0, "cost": 0, "access": 1.0},
@@ -1,3 +1,9 @@
+import weakref
+import numpy as np
+
+# Projected CRS for metric distances (UTM zone 51N, as used for the simulation outputs)
+METRIC_CRS = "EPSG:32651"
+
 def load_gpkg(path, layer=None):
     """Load GeoPackage as GeoDataFrame."""
     pass
@@ -9,3 +15,113 @@ def get_building_centroids(gdf):
 def generate_accessibility_buffer(gdf, distance):
     """Create buffer zones for accessibility checks."""
     pass
+
+def project_xy(x, y, from_crs, to_crs):
+    """Coordinate arrays from one CRS to another, as an (n, 2) array; unchanged if either CRS is None."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if from_crs is not None and to_crs is not None and from_crs != to_crs:
+        from pyproj import Transformer
+
+        x, y = Transformer.from_crs(from_crs, to_crs, always_xy=True).transform(x, y)
+    return np.column_stack([x, y])
+
+def geometry_xy(geoms, crs=METRIC_CRS, to_crs=METRIC_CRS):
+    """
+    Point coordinates (centroids of other geometries) of one geometry, a
+    sequence of them or a GeoSeries/GeoDataFrame, in to_crs. A GeoSeries
+    keeps its own CRS; bare geometries are taken to be in crs.
+    """
+    import shapely
+
+    if hasattr(geoms, "geometry"):
+        crs = getattr(geoms, "crs", None) or crs
+        geoms = geoms.geometry.to_numpy()
+    points = shapely.centroid(np.atleast_1d(np.asarray(geoms, dtype=object)))
+    return project_xy(shapely.get_x(points), shapely.get_y(points), crs, to_crs)
+
+class NodeIndex:
+    """
+    KD-tree over the nodes of a graph, in a projected metric CRS, so that
+    snap distances are in metres. Node coordinates come from the x/lon and
+    y/lat node attributes (in graph_crs); nodes without them are left out.
+    Use node_index_for(G) to build it once per graph.
+    """
+
+    def __init__(self, node_ids, x, y, graph_crs="EPSG:4326", metric_crs=METRIC_CRS):
+        from scipy.spatial import cKDTree
+
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        self.nodes = np.flatnonzero(np.isfinite(x) & np.isfinite(y))  # integer ids of the indexed nodes
+        self.node_ids = np.asarray(node_ids)
+        self.metric_crs = metric_crs
+        self.tree = cKDTree(project_xy(x[self.nodes], y[self.nodes], graph_crs, metric_crs))
+
+    @classmethod
+    def from_graph(cls, G, graph_crs="EPSG:4326", metric_crs=METRIC_CRS):
+        from utils.compiled_graph import compile_graph
+
+        cg = compile_graph(G)
+        return cls(cg.node_ids, cg.node_x, cg.node_y, graph_crs, metric_crs)
+
+    def query_xy(self, xy, max_distance=np.inf):
+        """
+        Nearest node of each (x, y) row (metric CRS): integer node ids of
+        the compiled graph and distances in metres. -1 / inf where there is
+        no node within max_distance or the point is missing.
+        """
+        xy = np.atleast_2d(np.asarray(xy, dtype=np.float64))
+        nodes = np.full(len(xy), -1, dtype=np.int64)
+        dist = np.full(len(xy), np.inf)
+        valid = np.isfinite(xy).all(axis=1)
+        if len(self.nodes) and valid.any():
+            d, i = self.tree.query(xy[valid], distance_upper_bound=max_distance)
+            found = np.isfinite(d)
+            rows = np.flatnonzero(valid)[found]
+            nodes[rows] = self.nodes[i[found]]
+            dist[rows] = d[found]
+        return nodes, dist
+
+    def query(self, geoms, crs=METRIC_CRS, max_distance=np.inf):
+        """query_xy for geometries (see geometry_xy)."""
+        return self.query_xy(geometry_xy(geoms, crs, self.metric_crs), max_distance)
+
+    def nearest(self, geoms, crs=METRIC_CRS, max_distance=np.inf):
+        """Original node ids nearest to the geometries (None where there is none)."""
+        nodes, _ = self.query(geoms, crs, max_distance)
+        return [self.node_ids[n] if n >= 0 else None for n in nodes]
+
+_node_indexes = weakref.WeakKeyDictionary()
+
+def node_index_for(G, graph_crs="EPSG:4326", metric_crs=METRIC_CRS):
+    """NodeIndex of a graph, built on first use and reused while the compiled graph lives."""
+    from utils.compiled_graph import compile_graph
+
+    cg = compile_graph(G)
+    indexes = _node_indexes.setdefault(cg, {})
+    key = (graph_crs, metric_crs)
+    if key not in indexes:
+        indexes[key] = NodeIndex(cg.node_ids, cg.node_x, cg.node_y, graph_crs, metric_crs)
+    return indexes[key]
+
+def get_nearest_node(geometry, G, crs=METRIC_CRS, graph_crs="EPSG:4326"):
+    """Id of the graph node nearest to a geometry (its centroid), or None for an empty graph."""
+    return node_index_for(G, graph_crs).nearest(geometry, crs)[0]
+
+def building_snap_table(buildings_gdf, G, crs=METRIC_CRS, graph_crs="EPSG:4326"):
+    """
+    Nearest graph node of every building in one vectorized query, as a
+    DataFrame on the buildings' index: node (integer id of the compiled
+    graph, -1 if none), node_id (original id) and snap_dist_m.
+    buildings_gdf's own CRS wins over crs when it has one.
+    """
+    import pandas as pd
+
+    index = node_index_for(G, graph_crs)
+    nodes, dist = index.query(buildings_gdf, crs)
+    return pd.DataFrame({
+        "node": nodes,
+        "node_id": pd.array([index.node_ids[n] if n >= 0 else None for n in nodes], dtype=object),
+        "snap_dist_m": dist,
+    }, index=buildings_gdf.index)
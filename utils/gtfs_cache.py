@@ -0,0 +1,190 @@
+# gtfs_cache.py
+
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+GTFS_CACHE_VERSION = 1
+GTFS_FILES = ("stops", "stop_times", "trips", "routes")
+
+# Id column → (code column, dictionary name) in the cached tables
+ID_CODES = {"stop_id": ("stop", "stop"), "trip_id": ("trip", "trip"), "route_id": ("route", "route")}
+TIME_COLUMNS = ("arrival_time", "departure_time")
+
+def file_hash(path, block_size=1 << 20):
+    """sha256 of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_hashes(gtfs_path):
+    return {name: file_hash(Path(gtfs_path) / f"{name}.txt") for name in GTFS_FILES}
+
+def source_stats(gtfs_path):
+    """(size, mtime_ns) of each feed file: a cheap check before hashing."""
+    stats = {name: (Path(gtfs_path) / f"{name}.txt").stat() for name in GTFS_FILES}
+    return {name: [st.st_size, st.st_mtime_ns] for name, st in stats.items()}
+
+def _id_text(values):
+    """Ids as strings, integral floats without the .0 (1.0 → "1"), missing left as NaN."""
+    def text(value):
+        if isinstance(value, (float, np.floating)) and float(value).is_integer():
+            return str(int(value))
+        return str(value)
+    return values.map(text, na_action="ignore").astype(object)
+
+def _storable(df):
+    """Object columns holding mixed types become strings so that Parquet can store them."""
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if not values.map(type).eq(str).all():
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def ingest_gtfs(gtfs_path, cache_dir):
+    """
+    Convert a GTFS feed (stops/stop_times/trips/routes.txt) to Parquet
+    tables in cache_dir. stop_id, trip_id and route_id are replaced by
+    int32 codes (stop, trip, route) into the id dictionaries ids_<kind>,
+    and arrival/departure times are int32 seconds (-1 where missing). Ids
+    mixing numbers and strings are all kept as strings. A
+    manifest.json records the source file hashes the cache was built from.
+    """
+    from utils.timetable_router import gtfs_time_to_seconds
+
+    gtfs_path, cache_dir = Path(gtfs_path), Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tables = {name: pd.read_csv(gtfs_path / f"{name}.txt") for name in GTFS_FILES}
+
+    ids = {
+        "stop": pd.concat([tables["stops"]["stop_id"], tables["stop_times"]["stop_id"]], ignore_index=True),
+        "trip": pd.concat([tables["trips"]["trip_id"], tables["stop_times"]["trip_id"]], ignore_index=True),
+        "route": pd.concat([tables["routes"]["route_id"], tables["trips"]["route_id"]], ignore_index=True),
+    }
+    for id_col, (_, kind) in ID_CODES.items():
+        if pd.api.types.infer_dtype(ids[kind].dropna()) in ("mixed", "mixed-integer"):
+            ids[kind] = _id_text(ids[kind])
+            for df in tables.values():
+                if id_col in df:
+                    df[id_col] = _id_text(df[id_col])
+    ids = {kind: pd.Index(pd.unique(values.dropna())).sort_values() for kind, values in ids.items()}
+    for kind, index in ids.items():
+        _storable(pd.DataFrame({"id": index})).to_parquet(cache_dir / f"ids_{kind}.parquet", index=False)
+
+    for name, df in tables.items():
+        for id_col, (code_col, kind) in ID_CODES.items():
+            if id_col in df:
+                df[id_col] = ids[kind].get_indexer(df[id_col]).astype(np.int32)
+                df = df.rename(columns={id_col: code_col})
+        for col in TIME_COLUMNS:
+            if col in df:
+                df[col] = gtfs_time_to_seconds(df[col]).astype(np.int32)
+        if "stop_sequence" in df:
+            df["stop_sequence"] = df["stop_sequence"].astype(np.int32)
+        _storable(df).to_parquet(cache_dir / f"{name}.parquet", index=False)
+
+    manifest = {"version": GTFS_CACHE_VERSION, "source": str(gtfs_path), "sources": source_hashes(gtfs_path),
+                "stats": source_stats(gtfs_path)}
+    _write_manifest(cache_dir, manifest)
+    return GTFSFeed(cache_dir)
+
+def _write_manifest(cache_dir, manifest):
+    with open(Path(cache_dir) / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+class GTFSFeed:
+    """
+    A GTFS feed cached by ingest_gtfs. Nothing is read up front: each
+    table() call reads just the requested Parquet columns, and code columns
+    come back as categorical id columns (stop_id, trip_id, route_id) built
+    from the int32 codes without re-parsing any strings.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / "manifest.json") as f:
+            self.manifest = json.load(f)
+        self._ids = {}
+
+    def is_current(self, gtfs_path):
+        """
+        True if the cache matches this reader's version and the feed's
+        current files. The files are only hashed when their size or mtime
+        changed; if the bytes are still the same the new stats are recorded.
+        """
+        if self.manifest.get("version") != GTFS_CACHE_VERSION:
+            return False
+        stats = source_stats(gtfs_path)
+        if self.manifest.get("stats") == stats:
+            return True
+        if self.manifest.get("sources") != source_hashes(gtfs_path):
+            return False
+        self.manifest["stats"] = stats
+        _write_manifest(self.cache_dir, self.manifest)
+        return True
+
+    def ids(self, kind):
+        """Id dictionary of "stop", "trip" or "route": code i is ids(kind)[i]."""
+        if kind not in self._ids:
+            self._ids[kind] = pd.Index(pd.read_parquet(self.cache_dir / f"ids_{kind}.parquet")["id"])
+        return self._ids[kind]
+
+    def table(self, name, columns=None, decode=True):
+        """
+        One cached table. columns uses the GTFS names (stop_id, not stop);
+        with decode=False the id columns stay int32 codes.
+        """
+        codes = {id_col: code_col for id_col, (code_col, _) in ID_CODES.items()}
+        read = None if columns is None else [codes.get(col, col) for col in columns]
+        df = pd.read_parquet(self.cache_dir / f"{name}.parquet", columns=read)
+        for id_col, (code_col, kind) in ID_CODES.items():
+            if code_col in df:
+                if decode:
+                    df[code_col] = pd.Categorical.from_codes(df[code_col], categories=self.ids(kind))
+                df = df.rename(columns={code_col: id_col})
+        return df
+
+    def stop_times(self, columns=None):
+        """
+        stop_times merged with trips and routes, as gtfs_to_netx.load_gtfs
+        returns it; only the requested columns are read from each table.
+        """
+        def read(name, keys):
+            if columns is None:
+                return self.table(name, decode=False)
+            present = self._columns(name)
+            return self.table(name, list(dict.fromkeys([c for c in columns if c in present] + keys)), decode=False)
+
+        def known(df, key):
+            # Code -1 is a missing id, which must not join to other missing ids
+            return df[df[key] >= 0]
+
+        # Joined on the int32 codes; ids are decoded once at the end
+        merged = known(read("stop_times", ["trip_id"]), "trip_id").merge(
+            known(read("trips", ["trip_id", "route_id"]), "trip_id"), on="trip_id")
+        merged = known(merged, "route_id").merge(known(read("routes", ["route_id"]), "route_id"), on="route_id")
+        for id_col, (_, kind) in ID_CODES.items():
+            if id_col in merged:
+                merged[id_col] = pd.Categorical.from_codes(merged[id_col], categories=self.ids(kind))
+        return merged if columns is None else merged[list(columns)]
+
+    def _columns(self, name):
+        import pyarrow.parquet as pq
+
+        names = pq.read_schema(self.cache_dir / f"{name}.parquet").names
+        codes = {code_col: id_col for id_col, (code_col, _) in ID_CODES.items()}
+        return [codes.get(col, col) for col in names]
+
+def open_gtfs(gtfs_path, cache_dir):
+    """GTFSFeed for a feed directory, (re)ingesting it when the cache is missing or stale."""
+    cache_dir = Path(cache_dir)
+    if (cache_dir / "manifest.json").exists():
+        feed = GTFSFeed(cache_dir)
+        if feed.is_current(gtfs_path):
+            return feed
+    return ingest_gtfs(gtfs_path, cache_dir)
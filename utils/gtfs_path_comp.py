@@ -1,17 +1,59 @@
 from shapely.geometry import Point
-import networkx as nx
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from tqdm import tqdm
+from utils.compiled_graph import CompiledGraph, compile_graph, path_from_predecessors
+from utils.route_cache import MISSING, RouteCache, cached_node_path
 
 def is_walkable(geom1, geom2, threshold=500):
     return geom1.distance(geom2) <= threshold
 
-def compute_agent_paths_with_transfers(agent_trips_df, buildings_gdf, G_road, G_rail):
+def transfer_index(road, rail):
+    """Aligned road and rail node ids of the stops shared by both graphs (transfer nodes)."""
+    rail_stops = set(rail.node_ids)
+    shared = [stop for stop in road.node_ids if stop in rail_stops]
+    return road.node_index(shared), rail.node_index(shared)
+
+def best_transfer_path(road, rail, origin_road, dest_rail, transfers, weight="length", cache=None):
+    """
+    Shortest road -> rail path through any transfer stop, or None.
+
+    One search from the origin on the road graph and one towards the
+    destination on the reversed rail graph give the distance to and from
+    every transfer stop; the best transfer is their vectorized min.
+    """
+    origin = road.node_index(origin_road)
+    dest = rail.node_index(dest_rail)
+    if origin < 0 or dest < 0 or not len(transfers[0]):
+        return None
+
+    def search():
+        dist_road, pred_road = road.dijkstra(origin, weight)
+        dist_rail, pred_rail = rail.dijkstra(dest, weight, reverse=True)
+        total = dist_road[transfers[0]] + dist_rail[transfers[1]]
+        best = int(np.argmin(total))
+        if not np.isfinite(total[best]):
+            return None
+        part1 = path_from_predecessors(pred_road, origin, transfers[0][best])
+        part2 = path_from_predecessors(pred_rail, dest, transfers[1][best])[::-1]
+        return road.node_ids[part1].tolist() + rail.node_ids[part2[1:]].tolist()  # avoid duplicate transfer stop
+
+    if cache is None:
+        return search()
+    key = (int(origin), int(dest), f"transfer:{weight}", road.fingerprint(weight) + rail.fingerprint(weight))
+    return cache.get_or_compute(key, search)
+
+def compute_agent_paths_with_transfers(agent_trips_df, buildings_gdf, G_road, G_rail, cache=None, n_workers=1):
+    if n_workers != 1:
+        # Pool of n_workers processes (all cores if None), see compute_agent_paths_parallel
+        return compute_agent_paths_parallel(agent_trips_df, buildings_gdf, G_road, G_rail, n_workers, cache=cache)
+
     paths = []
+    road, rail = compile_graph(G_road), compile_graph(G_rail)
 
     # Find transfer nodes (shared stop_ids in both graphs)
-    transfer_stops = set(G_road.nodes).intersection(set(G_rail.nodes))
+    transfers = transfer_index(road, rail)
 
     for _, row in tqdm(agent_trips_df.iterrows(), total=len(agent_trips_df)):
         agent_id = row["agent_id"]
@@ -39,34 +81,18 @@ def compute_agent_paths_with_transfers(agent_trips_df, buildings_gdf, G_road, G_
         dest_road = buildings_gdf.loc[dest_id]["nearest_road_stop_id"]
         dest_rail = buildings_gdf.loc[dest_id]["nearest_rail_stop_id"]
 
-        try:
-            # --- Case 2: Single-mode trip ---
-            if preferred_mode == "road":
-                path = nx.shortest_path(G_road, origin_road, dest_road, weight="length")
-                mode_used = "road"
-            elif preferred_mode == "rail":
-                path = nx.shortest_path(G_rail, origin_rail, dest_rail, weight="length")
-                mode_used = "rail"
-            else:
-                # --- Case 3: Multi-modal with transfer ---
-                min_total_length = float("inf")
-                best_path = []
-                for transfer in transfer_stops:
-                    try:
-                        part1 = nx.shortest_path(G_road, origin_road, transfer, weight="length")
-                        part2 = nx.shortest_path(G_rail, transfer, dest_rail, weight="length")
-                        total_length = (
-                            nx.path_weight(G_road, part1, "length") +
-                            nx.path_weight(G_rail, part2, "length")
-                        )
-                        if total_length < min_total_length:
-                            min_total_length = total_length
-                            best_path = part1 + part2[1:]  # avoid duplicate transfer stop
-                    except (nx.NetworkXNoPath, nx.NodeNotFound):
-                        continue
-                path = best_path
-                mode_used = "mixed"
-        except (nx.NetworkXNoPath, nx.NodeNotFound):
+        # --- Case 2: Single-mode trip ---
+        if preferred_mode == "road":
+            path = cached_node_path(road, origin_road, dest_road, "length", cache)
+            mode_used = "road"
+        elif preferred_mode == "rail":
+            path = cached_node_path(rail, origin_rail, dest_rail, "length", cache)
+            mode_used = "rail"
+        else:
+            # --- Case 3: Multi-modal with transfer ---
+            path = best_transfer_path(road, rail, origin_road, dest_rail, transfers, "length", cache) or []
+            mode_used = "mixed"
+        if path is None:
             path = []
             mode_used = "none"
 
@@ -80,19 +106,23 @@ def compute_agent_paths_with_transfers(agent_trips_df, buildings_gdf, G_road, G_
     return pd.DataFrame(paths)
 
 from shapely.geometry import LineString
-import numpy as np
 
 def get_node_geometry(G, node_id):
+    if isinstance(G, CompiledGraph):
+        i = G.node_index(node_id)
+        return Point(G.node_x[i], G.node_y[i])
     node = G.nodes[node_id]
     return Point(node["x"], node["y"]) if "x" in node else node["geometry"]
 
+def node_coords(G, path):
+    """(x, y) of each node of path in G (networkx or CompiledGraph), None where G lacks the node."""
+    if isinstance(G, CompiledGraph):
+        return [(float(G.node_x[i]), float(G.node_y[i])) if i >= 0 else None for i in G.node_index(path)]
+    return [get_node_geometry(G, node_id).coords[0] if node_id in G else None for node_id in path]
+
 def sequence_to_linestring(path, G_road, G_rail):
-    coords = []
-    for node_id in path:
-        if node_id in G_road:
-            coords.append(get_node_geometry(G_road, node_id).coords[0])
-        elif node_id in G_rail:
-            coords.append(get_node_geometry(G_rail, node_id).coords[0])
+    road, rail = node_coords(G_road, path), node_coords(G_rail, path)
+    coords = [r if r is not None else q for r, q in zip(road, rail) if r is not None or q is not None]
     if len(coords) < 2:
         return None
     return LineString(coords)
@@ -108,11 +138,208 @@ def estimate_travel_time(length_m, mode):
     speed_mps = (speed_kph[mode] * 1000) / 3600
     return round(length_m / speed_mps / 60, 2) if speed_mps > 0 else None
 
-def compute_agent_paths_geometries(agent_trips_df, buildings_gdf, G_road, G_rail):
+def tree_paths(cg, origins, targets, weight="length", chunk_size=256):
+    """
+    Paths origins[i] -> targets[i] (integer node ids) as index arrays, or
+    None where there is no path. One shortest-path tree is grown per unique
+    origin, chunk_size origins per search call, and every target of that
+    origin is read off its predecessor row.
+    """
+    paths = [None] * len(origins)
+    trips = np.flatnonzero((origins >= 0) & (targets >= 0))
+    uniq, row = np.unique(origins[trips], return_inverse=True)
+    for start in range(0, len(uniq), chunk_size):
+        _, pred = cg.dijkstra(uniq[start:start + chunk_size], weight)
+        in_chunk = (row >= start) & (row < start + chunk_size)
+        for trip, r in zip(trips[in_chunk], row[in_chunk] - start):
+            paths[trip] = path_from_predecessors(pred[r], origins[trip], targets[trip])
+    return paths
+
+def transfer_tree_paths(road, rail, origins, dests, transfers, weight="length", chunk_size=256):
+    """
+    Batched best_transfer_path: one road tree per unique origin stop and one
+    reverse rail tree per unique destination stop of each origin chunk.
+    Returns road -> rail node id lists, or None where there is no path.
+    """
+    paths = [None] * len(origins)
+    if not len(transfers[0]):
+        return paths
+    trips = np.flatnonzero((origins >= 0) & (dests >= 0))
+    uniq, row = np.unique(origins[trips], return_inverse=True)
+    for start in range(0, len(uniq), chunk_size):
+        dist_road, pred_road = road.dijkstra(uniq[start:start + chunk_size], weight)
+        in_chunk = (row >= start) & (row < start + chunk_size)
+        chunk_trips, road_rows = trips[in_chunk], row[in_chunk] - start
+        dest_stops, rail_rows = np.unique(dests[chunk_trips], return_inverse=True)
+        dist_rail, pred_rail = rail.dijkstra(dest_stops, weight, reverse=True)
+
+        total = dist_road[road_rows][:, transfers[0]] + dist_rail[rail_rows][:, transfers[1]]
+        best = np.argmin(total, axis=1)
+        found = np.isfinite(total[np.arange(len(best)), best])
+        for trip, r, q, b in zip(chunk_trips[found], road_rows[found], rail_rows[found], best[found]):
+            part1 = path_from_predecessors(pred_road[r], origins[trip], transfers[0][b])
+            part2 = path_from_predecessors(pred_rail[q], dests[trip], transfers[1][b])[::-1]
+            paths[trip] = road.node_ids[part1].tolist() + rail.node_ids[part2[1:]].tolist()
+    return paths
+
+def trip_endpoints(agent_trips_df, buildings_gdf, road, rail):
+    """
+    Vectorized per-trip lookups shared by the batch and parallel modes:
+    building geometries, the walk mask (<= 500 m), the preferred mode and
+    the integer road/rail node of each nearest stop (-1 if not in the graph).
+    """
+    origins = buildings_gdf.loc[agent_trips_df["origin_building_id"]]
+    dests = buildings_gdf.loc[agent_trips_df["destination_building_id"]]
+    origin_geoms = origins.geometry.to_numpy()
+    dest_geoms = dests.geometry.to_numpy()
+    return {
+        "origin_geoms": origin_geoms,
+        "dest_geoms": dest_geoms,
+        "walk": gpd.GeoSeries(origin_geoms).distance(gpd.GeoSeries(dest_geoms)).to_numpy() <= 500,
+        "preferred": agent_trips_df["preferred_mode"].to_numpy(),
+        "origin_road": road.node_index(origins["nearest_road_stop_id"]),
+        "dest_road": road.node_index(dests["nearest_road_stop_id"]),
+        "origin_rail": rail.node_index(origins["nearest_rail_stop_id"]),
+        "dest_rail": rail.node_index(dests["nearest_rail_stop_id"]),
+    }
+
+def compute_agent_paths_geometries_batched(agent_trips_df, buildings_gdf, G_road, G_rail, chunk_size=256):
+    """
+    Batch mode of compute_agent_paths_geometries, with the same output.
+
+    Trips are grouped by origin stop (nearest_road_stop_id /
+    nearest_rail_stop_id): one single-source tree per unique origin serves
+    every trip from it, instead of a point-to-point search per trip.
+    """
+    road, rail = compile_graph(G_road), compile_graph(G_rail)
+    transfers = transfer_index(road, rail)
+
+    ends = trip_endpoints(agent_trips_df, buildings_gdf, road, rail)
+    origin_geoms, dest_geoms, walk, preferred = ends["origin_geoms"], ends["dest_geoms"], ends["walk"], ends["preferred"]
+    origin_road, dest_road = ends["origin_road"], ends["dest_road"]
+    origin_rail, dest_rail = ends["origin_rail"], ends["dest_rail"]
+
+    paths = [None] * len(agent_trips_df)
+    modes = np.full(len(agent_trips_df), "none", dtype=object)
+    for mode, cg, o, d in (("road", road, origin_road, dest_road), ("rail", rail, origin_rail, dest_rail)):
+        trips = np.flatnonzero(~walk & (preferred == mode))
+        for trip, path in zip(trips, tree_paths(cg, o[trips], d[trips], chunk_size=chunk_size)):
+            if path is not None:
+                paths[trip] = cg.node_ids[path].tolist()
+                modes[trip] = mode
+
+    trips = np.flatnonzero(~walk & (preferred != "road") & (preferred != "rail"))
+    mixed = transfer_tree_paths(road, rail, origin_road[trips], dest_rail[trips], transfers, chunk_size=chunk_size)
+    for trip, path in zip(trips, mixed):
+        if path:
+            paths[trip] = path
+            modes[trip] = "mixed"
+
+    records = []
+    for trip, row in enumerate(agent_trips_df.itertuples(index=False)):
+        if walk[trip]:
+            line = LineString([origin_geoms[trip], dest_geoms[trip]])
+            mode = "walk"
+        else:
+            line = sequence_to_linestring(paths[trip], G_road, G_rail) if paths[trip] is not None else None
+            mode = modes[trip]
+        length = line.length if line else None
+        records.append({
+            "agent_id": row.agent_id,
+            "trip_no": row.trip_no,
+            "mode": mode,
+            "length_m": length,
+            "estimated_time_min": estimate_travel_time(length, mode) if length else None,
+            "geometry": line
+        })
+
+    return gpd.GeoDataFrame(records, geometry="geometry", crs=buildings_gdf.crs)
+
+def _route_through_cache(cache, keys, route):
+    """
+    Values for keys (None where a trip is not cacheable) from a RouteCache.
+    Distinct misses are computed in one call of route(trip positions),
+    which yields a value per position, and stored in the cache.
+    """
+    values = [MISSING] * len(keys)
+    todo, first = [], {}
+    for i, key in enumerate(keys):
+        if cache is not None and key is not None:
+            if key in first:
+                continue  # a miss already being routed
+            values[i] = cache.get(key)
+        if values[i] is MISSING:
+            todo.append(i)
+            if key is not None:
+                first[key] = i
+    for i, value in zip(todo, route(np.asarray(todo, dtype=np.int64))):
+        values[i] = value
+        if cache is not None and keys[i] is not None:
+            cache.put(keys[i], value)
+    return [values[first[key]] if value is MISSING else value for key, value in zip(keys, values)]
+
+def compute_agent_paths_parallel(agent_trips_df, buildings_gdf, G_road, G_rail, n_workers=None, chunk_size=256,
+                                 cache=None):
+    """
+    compute_agent_paths_with_transfers on a process pool, with the same
+    output. The compiled road and rail graphs are placed in shared memory
+    once (utils.parallel_routing); each worker routes chunks of trips,
+    grouped by origin stop as in the batch mode. With a RouteCache, trips
+    are looked up in it first (same keys as the serial mode) and only the
+    misses go to the pool.
+    """
+    from utils.parallel_routing import ParallelRouter
+
+    road, rail = compile_graph(G_road), compile_graph(G_rail)
+    transfers = transfer_index(road, rail)
+    ends = trip_endpoints(agent_trips_df, buildings_gdf, road, rail)
+    walk, preferred = ends["walk"], ends["preferred"]
+
+    stop_sequences = [[] for _ in range(len(agent_trips_df))]
+    modes = np.where(walk, "walk", "none").astype(object)
+    with ParallelRouter({"road": road, "rail": rail}, n_workers=n_workers, chunk_size=chunk_size,
+                        reverse=("rail",)) as router:
+        for mode, cg in (("road", road), ("rail", rail)):
+            trips = np.flatnonzero(~walk & (preferred == mode))
+            origins, dests = ends[f"origin_{mode}"][trips], ends[f"dest_{mode}"][trips]
+            keys = [(int(o), int(d), "length", cg.fingerprint("length")) if o >= 0 and d >= 0 else None
+                    for o, d in zip(origins, dests)]
+            routed = _route_through_cache(
+                cache, keys, lambda todo: (path for path, _ in router.paths(mode, origins[todo], dests[todo])))
+            for trip, path in zip(trips, routed):
+                if path is not None:
+                    stop_sequences[trip] = cg.node_ids[path].tolist()
+                    modes[trip] = mode
+
+        trips = np.flatnonzero(~walk & (preferred != "road") & (preferred != "rail"))
+        origins, dests = ends["origin_road"][trips], ends["dest_rail"][trips]
+        fingerprint = road.fingerprint("length") + rail.fingerprint("length")
+        keys = [(int(o), int(d), "transfer:length", fingerprint) if o >= 0 and d >= 0 and len(transfers[0]) else None
+                for o, d in zip(origins, dests)]
+        routed = _route_through_cache(
+            cache, keys, lambda todo: router.transfer_paths("road", "rail", origins[todo], dests[todo], transfers))
+        for trip, path in zip(trips, routed):
+            stop_sequences[trip] = path or []
+            modes[trip] = "mixed"
+
+    return pd.DataFrame({
+        "agent_id": agent_trips_df["agent_id"].to_numpy(),
+        "trip_no": agent_trips_df["trip_no"].to_numpy(),
+        "mode": modes,
+        "stop_sequence": stop_sequences,
+    })
+
+def compute_agent_paths_geometries(agent_trips_df, buildings_gdf, G_road, G_rail, cache=None, batch=False,
+                                   chunk_size=256):
+    """batch=True groups trips by origin stop (see compute_agent_paths_geometries_batched); the cache is not used then."""
+    if batch:
+        return compute_agent_paths_geometries_batched(agent_trips_df, buildings_gdf, G_road, G_rail, chunk_size)
+
     from tqdm import tqdm
     records = []
+    road, rail = compile_graph(G_road), compile_graph(G_rail)
 
-    transfer_stops = set(G_road.nodes).intersection(set(G_rail.nodes))
+    transfers = transfer_index(road, rail)
 
     for _, row in tqdm(agent_trips_df.iterrows(), total=len(agent_trips_df)):
         agent_id = row["agent_id"]
@@ -136,34 +363,24 @@ def compute_agent_paths_geometries(agent_trips_df, buildings_gdf, G_road, G_rail
 
             path = []
             mode = "none"
-            try:
-                if preferred_mode == "road":
-                    path = nx.shortest_path(G_road, origin_road, dest_road, weight="length")
-                    mode = "road"
-                elif preferred_mode == "rail":
-                    path = nx.shortest_path(G_rail, origin_rail, dest_rail, weight="length")
-                    mode = "rail"
-                else:
-                    best_path, min_len = [], float("inf")
-                    for transfer in transfer_stops:
-                        try:
-                            p1 = nx.shortest_path(G_road, origin_road, transfer, weight="length")
-                            p2 = nx.shortest_path(G_rail, transfer, dest_rail, weight="length")
-                            total_len = nx.path_weight(G_road, p1, "length") + nx.path_weight(G_rail, p2, "length")
-                            if total_len < min_len:
-                                best_path = p1 + p2[1:]
-                                min_len = total_len
-                                mode = "mixed"
-                        except:
-                            continue
-                    path = best_path
-
-                line = sequence_to_linestring(path, G_road, G_rail)
-                length = line.length if line else None
+            if preferred_mode == "road":
+                path = cached_node_path(road, origin_road, dest_road, "length", cache)
+                mode = "road"
+            elif preferred_mode == "rail":
+                path = cached_node_path(rail, origin_rail, dest_rail, "length", cache)
+                mode = "rail"
+            else:
+                path = best_transfer_path(road, rail, origin_road, dest_rail, transfers, "length", cache) or []
+                if path:
+                    mode = "mixed"
 
-            except (nx.NetworkXNoPath, nx.NodeNotFound):
+            if path is None:
                 line = None
                 length = None
+                mode = "none"
+            else:
+                line = sequence_to_linestring(path, G_road, G_rail)
+                length = line.length if line else None
 
         records.append({
             "agent_id": agent_id,
@@ -180,13 +397,15 @@ if __name__ == "__main__":
     agent_trips_df = pd.read_parquet("data/processed/agent_trips.parquet")
     buildings_gdf = gpd.read_file("data/processed/buildings_with_stops.gpkg").set_index("building_id")
 
-    # Load transport graphs
-    import pickle
-    with open("data/processed/graph_road.pkl", "rb") as f:
-        G_road = pickle.load(f)
-    with open("data/processed/graph_rail.pkl", "rb") as f:
-        G_rail = pickle.load(f)
+    from utils.config import ROUTE_CACHE_PATH, ROUTE_CACHE_SIZE
+
+    # Memory-mapped compiled graphs written by gtfs_to_netx
+    from utils.compiled_graph import load_graph
+    G_road = load_graph("data/processed/graph_road")
+    G_rail = load_graph("data/processed/graph_rail")
 
-    agent_paths_df = compute_agent_paths_with_transfers(agent_trips_df, buildings_gdf, G_road, G_rail)
+    with RouteCache(ROUTE_CACHE_SIZE, ROUTE_CACHE_PATH) as cache:
+        agent_paths_df = compute_agent_paths_with_transfers(agent_trips_df, buildings_gdf, G_road, G_rail, cache=cache)
+        print(f"Route cache: {cache.stats()}")
 
     agent_paths_df.to_parquet("data/processed/agent_trip_paths.parquet", index=False)
\ No newline at end of file
@@ -4,6 +4,7 @@ from shapely.geometry import Point
 from pathlib import Path
 from sklearn.neighbors import BallTree
 import numpy as np
+from utils.geospatial import METRIC_CRS, geometry_xy
 
 def load_stops(stops_df):
     # Convert GTFS stops to GeoDataFrame
@@ -30,6 +31,48 @@ def assign_nearest_stop(buildings_gdf, stops_gdf, label):
 
     return buildings
 
+def building_centroid_xy(buildings_gdf, metric_crs=METRIC_CRS, chunk_size=100_000):
+    """Building centroids in metric_crs as an (n, 2) array, projected chunk by chunk."""
+    xy = np.empty((len(buildings_gdf), 2))
+    for start in range(0, len(buildings_gdf), chunk_size):
+        xy[start:start + chunk_size] = geometry_xy(buildings_gdf.iloc[start:start + chunk_size], to_crs=metric_crs)
+    return xy
+
+def assign_nearest_stops(buildings_gdf, stops_gdfs, k=3, metric_crs=METRIC_CRS, chunk_size=100_000,
+                         centroids=None):
+    """
+    k nearest stops of every building for several stop sets in one pass.
+
+    stops_gdfs maps a label ("road", "rail") to a stops GeoDataFrame.
+    Buildings and stops are projected once to metric_crs (pass centroids
+    from building_centroid_xy to reuse them) and queried against one
+    KD-tree per label, chunk_size buildings at a time. Returns
+    buildings_gdf in EPSG:4326, as assign_nearest_stop does, with
+    nearest_{label}_stop_id / nearest_{label}_stop_dist_m for the nearest
+    stop plus the _2 ... _k candidates in order of distance (metres).
+    """
+    from scipy.spatial import cKDTree
+
+    if centroids is None:
+        centroids = building_centroid_xy(buildings_gdf, metric_crs, chunk_size)
+    n = len(centroids)
+    buildings = buildings_gdf.to_crs("EPSG:4326")
+    for label, stops in stops_gdfs.items():
+        stop_ids = stops["stop_id"].to_numpy()
+        kk = min(k, len(stops))
+        tree = cKDTree(geometry_xy(stops, to_crs=metric_crs))
+        idx = np.empty((n, kk), dtype=np.int64)
+        dist = np.empty((n, kk))
+        for start in range(0, n, chunk_size):
+            d, i = tree.query(centroids[start:start + chunk_size], k=kk)
+            dist[start:start + chunk_size] = d.reshape(-1, kk)
+            idx[start:start + chunk_size] = i.reshape(-1, kk)
+        for j in range(kk):
+            suffix = "" if j == 0 else f"_{j + 1}"
+            buildings[f"nearest_{label}_stop_id{suffix}"] = stop_ids[idx[:, j]]
+            buildings[f"nearest_{label}_stop_dist_m{suffix}"] = dist[:, j]
+    return buildings
+
 if __name__ == "__main__":
     # Load building GeoDataFrame
     buildings_gdf = gpd.read_file("data/processed/buildings_qc.gpkg")  # Adjust path as needed
@@ -40,9 +83,8 @@ if __name__ == "__main__":
     road_stops_gdf = load_stops(road_stops)
     rail_stops_gdf = load_stops(rail_stops)
 
-    # Assign nearest stops
-    buildings_gdf = assign_nearest_stop(buildings_gdf, road_stops_gdf, "road")
-    buildings_gdf = assign_nearest_stop(buildings_gdf, rail_stops_gdf, "rail")
+    # Assign the 3 nearest road and rail stops (metric CRS, one pass over the buildings)
+    buildings_gdf = assign_nearest_stops(buildings_gdf, {"road": road_stops_gdf, "rail": rail_stops_gdf}, k=3)
 
     # Save with nearest stop info
     buildings_gdf.to_file("data/processed/buildings_with_stops.gpkg", driver="GPKG")
@@ -1,12 +1,29 @@
+import numpy as np
 import pandas as pd
 import networkx as nx
 from pathlib import Path
-from geopy.distance import geodesic
-from tqdm import tqdm
 
 GTFS_DIR = Path("data/raw/gtfs")
+GTFS_CACHE_DIR = Path("data/processed/gtfs_cache")
+EARTH_RADIUS_M = 6371000
+
+# stop_times columns that build_graph uses
+GRAPH_COLUMNS = ["trip_id", "stop_sequence", "stop_id", "route_id"]
+
+def load_gtfs(gtfs_path, cache_dir=None, columns=None):
+    """
+    stops and stop_times (merged with trips and routes) of a feed. With a
+    cache_dir the typed cache of utils.gtfs_cache is used (built on first
+    use or when the feed files change): ids come back as categoricals,
+    times as seconds, and only the stop_times columns listed are read.
+    """
+    if cache_dir is not None:
+        from utils.gtfs_cache import open_gtfs
+
+        print(f"📂 Loading GTFS from {gtfs_path.name} (cached)...")
+        feed = open_gtfs(gtfs_path, cache_dir)
+        return feed.table("stops"), feed.stop_times(columns)
 
-def load_gtfs(gtfs_path):
     print(f"📂 Loading GTFS from {gtfs_path.name}...")
     stops = pd.read_csv(gtfs_path / "stops.txt")
     stop_times = pd.read_csv(gtfs_path / "stop_times.txt")
@@ -18,42 +35,69 @@ def load_gtfs(gtfs_path):
     stop_times = stop_times.merge(routes, on="route_id")
     return stops, stop_times
 
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres between coordinate arrays (degrees)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def trip_edges(stops, stop_times):
+    """
+    One row per distinct stop pair (from_stop, to_stop) visited consecutively
+    by some trip, with its haversine distance and route. When several trips
+    share a pair, the route of the last trip (by trip_id) is kept.
+    """
+    st = stop_times.loc[stop_times["trip_id"].notna(), ["trip_id", "stop_sequence", "stop_id", "route_id"]]
+    st = st.sort_values(["trip_id", "stop_sequence"], kind="stable")
+
+    # Consecutive stops of the same trip
+    trip = st["trip_id"].to_numpy()
+    stop = st["stop_id"].to_numpy()
+    same_trip = trip[1:] == trip[:-1]
+    edges = pd.DataFrame({
+        "from_stop": stop[:-1][same_trip],
+        "to_stop": stop[1:][same_trip],
+        "route": st["route_id"].to_numpy()[1:][same_trip],
+    })
+    edges = edges.drop_duplicates(["from_stop", "to_stop"], keep="last")
+
+    coords = stops.drop_duplicates("stop_id").set_index("stop_id")[["stop_lat", "stop_lon"]]
+    start = coords.reindex(edges["from_stop"]).to_numpy()
+    end = coords.reindex(edges["to_stop"]).to_numpy()
+    edges["distance"] = haversine_m(start[:, 0], start[:, 1], end[:, 0], end[:, 1])
+    return edges.reset_index(drop=True)
+
 def build_graph(stops, stop_times):
     print("🛠️ Building transport network graph...")
     G = nx.DiGraph()
 
     # Add nodes with lat/lon
-    for _, row in stops.iterrows():
-        G.add_node(row["stop_id"], lat=row["stop_lat"], lon=row["stop_lon"], name=row["stop_name"])
-
-    # Sort and add edges by trip sequence
-    trip_groups = stop_times.groupby("trip_id")
-    for trip_id, group in tqdm(trip_groups, desc="⏱️ Adding trip edges"):
-        group = group.sort_values("stop_sequence")
-        prev_stop = None
-        for _, row in group.iterrows():
-            curr_stop = row["stop_id"]
-            if prev_stop is not None:
-                coord1 = (stops.loc[stops["stop_id"] == prev_stop, "stop_lat"].values[0],
-                          stops.loc[stops["stop_id"] == prev_stop, "stop_lon"].values[0])
-                coord2 = (stops.loc[stops["stop_id"] == curr_stop, "stop_lat"].values[0],
-                          stops.loc[stops["stop_id"] == curr_stop, "stop_lon"].values[0])
-                distance = geodesic(coord1, coord2).meters
-                G.add_edge(prev_stop, curr_stop, weight=distance, route=row["route_id"])
-            prev_stop = curr_stop
+    G.add_nodes_from(
+        (stop_id, {"lat": lat, "lon": lon, "name": name})
+        for stop_id, lat, lon, name in zip(stops["stop_id"], stops["stop_lat"], stops["stop_lon"], stops["stop_name"])
+    )
+
+    # Add edges by trip sequence
+    edges = trip_edges(stops, stop_times)
+    G.add_edges_from(
+        (u, v, {"weight": distance, "route": route})
+        for u, v, distance, route in zip(edges["from_stop"], edges["to_stop"], edges["distance"], edges["route"])
+    )
 
     print(f"✅ Graph has {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
     return G
 
 if __name__ == "__main__":
+    from utils.compiled_graph import save_graph
+
     # Build road network
     road_gtfs_path = GTFS_DIR / "road"
-    road_stops, road_stop_times = load_gtfs(road_gtfs_path)
+    road_stops, road_stop_times = load_gtfs(road_gtfs_path, GTFS_CACHE_DIR / "road", GRAPH_COLUMNS)
     road_graph = build_graph(road_stops, road_stop_times)
-    nx.write_gpickle(road_graph, "data/processed/graph_road.gpickle")
+    save_graph(road_graph, "data/processed/graph_road")
     
     # Build rail network
     rail_gtfs_path = GTFS_DIR / "rail"
-    rail_stops, rail_stop_times = load_gtfs(rail_gtfs_path)
+    rail_stops, rail_stop_times = load_gtfs(rail_gtfs_path, GTFS_CACHE_DIR / "rail", GRAPH_COLUMNS)
     rail_graph = build_graph(rail_stops, rail_stop_times)
-    nx.write_gpickle(rail_graph, "data/processed/graph_rail.gpickle")
+    save_graph(rail_graph, "data/processed/graph_rail")
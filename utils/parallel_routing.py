@@ -0,0 +1,174 @@
+# parallel_routing.py
+
+import os
+from multiprocessing import Pool, shared_memory
+import numpy as np
+from utils.compiled_graph import CompiledGraph, path_from_predecessors
+
+class SharedGraphs:
+    """
+    Compiled graphs copied once into multiprocessing shared memory.
+
+    Each array of CompiledGraph.to_arrays() (including the compiled matrices
+    for `weights`, and their reversed matrices for the graphs named in
+    `reverse`) gets its own shared block. Workers attach to the blocks
+    through the small picklable `descriptor` and rebuild the graphs with
+    CompiledGraph.from_arrays, so no worker unpickles or copies a graph.
+    The blocks are freed by close() (or on leaving a with block).
+    """
+
+    def __init__(self, graphs, weights=("length",), reverse=()):
+        self._blocks = []
+        self.descriptor = {}
+        for name, cg in graphs.items():
+            arrays, meta = cg.to_arrays(weights=[w for w in weights if w in cg.edge_attrs], reverse=name in reverse)
+            specs = {}
+            for key, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+                self._blocks.append(block)
+                specs[key] = (block.name, array.dtype.str, array.shape)
+            self.descriptor[name] = (specs, meta)
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+_graphs = {}
+_attached = []
+
+def attach_graphs(descriptor):
+    """Pool initializer: map the shared blocks and rebuild read-only graph views."""
+    for name, (specs, meta) in descriptor.items():
+        arrays = {}
+        for key, (block_name, dtype, shape) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            _attached.append(block)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            array.setflags(write=False)
+            arrays[key] = array
+        _graphs[name] = CompiledGraph.from_arrays(arrays, meta)
+
+# Memory for one batch of shortest-path trees (float64 distances + int32 predecessors per node)
+TREE_BATCH_BYTES = 64 << 20
+
+def tree_batch_size(n_nodes, max_bytes=TREE_BATCH_BYTES, max_batch=256):
+    """Origins per dijkstra call so that the batch's dense result rows fit in max_bytes."""
+    return int(np.clip(max_bytes // (12 * max(n_nodes, 1)), 1, max_batch))
+
+def fallback_paths(cg, origins, targets, weights, weight_rank, batch_size=None):
+    """
+    Paths origins[i] -> targets[i] trying weights[weight_rank[i, 0]], then
+    weight_rank[i, 1], ... until one exists (-1 ends a trip's list). One
+    shortest-path tree per unique (weight, origin) is searched, batch_size
+    origins per search call (default: tree_batch_size of the graph, since
+    each call returns dense batch_size x n_nodes arrays).
+    Returns (paths as index arrays or None, index of the weight that worked or -1).
+    """
+    batch_size = batch_size or tree_batch_size(cg.n_nodes)
+    paths = [None] * len(origins)
+    used = np.full(len(origins), -1, dtype=np.int64)
+    for rank in range(weight_rank.shape[1]):
+        todo = np.flatnonzero((used < 0) & (weight_rank[:, rank] >= 0) & (origins >= 0) & (targets >= 0))
+        for w in np.unique(weight_rank[todo, rank]):
+            trips = todo[weight_rank[todo, rank] == w]
+            uniq, row = np.unique(origins[trips], return_inverse=True)
+            for start in range(0, len(uniq), batch_size):
+                _, pred = cg.dijkstra(uniq[start:start + batch_size], weights[w])
+                in_batch = (row >= start) & (row < start + batch_size)
+                for trip, r in zip(trips[in_batch], row[in_batch] - start):
+                    path = path_from_predecessors(pred[r], origins[trip], targets[trip])
+                    if path is not None:
+                        paths[trip] = path
+                        used[trip] = w
+    return paths, used
+
+def _route_chunk(task):
+    kind, args = task
+    if kind == "paths":
+        graph, weights, origins, targets, weight_rank, batch_size = args
+        paths, used = fallback_paths(_graphs[graph], origins, targets, weights, weight_rank, batch_size)
+        return [None if p is None else p.tolist() for p in paths], used
+    if kind == "transfer":
+        from utils.gtfs_path_comp import transfer_tree_paths
+        road, rail, weight, origins, dests, transfers = args
+        return transfer_tree_paths(_graphs[road], _graphs[rail], origins, dests, transfers, weight)
+    raise ValueError(f"Unknown routing task {kind!r}")
+
+def _chunks(n, chunk_size):
+    return [slice(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+class ParallelRouter:
+    """
+    Process pool of routing workers over SharedGraphs.
+
+    Trips are cut into chunks that the workers route independently; results
+    stream back in input order (Pool.imap). The pool and the shared blocks
+    live until close(). Graphs searched backwards (the rail side of
+    transfer_paths) should be named in `reverse`, so that their reversed
+    matrices are compiled once here rather than in every worker.
+    batch_size is the number of origins per shortest-path search in paths();
+    by default it is sized from each graph's node count (tree_batch_size).
+    """
+
+    def __init__(self, graphs, weights=("length",), n_workers=None, chunk_size=1024, reverse=(),
+                 batch_size=None):
+        self.shared = SharedGraphs(graphs, weights, reverse)
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        try:
+            self.pool = Pool(n_workers or os.cpu_count(), initializer=attach_graphs,
+                             initargs=(self.shared.descriptor,))
+        except BaseException:
+            self.shared.close()
+            raise
+
+    def paths(self, graph, origins, targets, weights=("length",), weight_rank=None):
+        """
+        Route origins[i] -> targets[i] (integer node ids) on graph.
+        weight_rank (trips x k indices into weights) gives each trip's
+        weights in fallback order; by default every trip uses weights[0].
+        Yields (path index list or None, weight index or -1) per trip.
+        """
+        origins = np.asarray(origins, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if weight_rank is None:
+            weight_rank = np.zeros((len(origins), 1), dtype=np.int64)
+        weight_rank = np.asarray(weight_rank, dtype=np.int64)
+        tasks = [
+            ("paths", (graph, list(weights), origins[s], targets[s], weight_rank[s], self.batch_size))
+            for s in _chunks(len(origins), self.chunk_size)
+        ]
+        for paths, used in self.pool.imap(_route_chunk, tasks):
+            yield from zip(paths, used.tolist())
+
+    def transfer_paths(self, road, rail, origins, dests, transfers, weight="length"):
+        """Parallel transfer_tree_paths; yields road -> rail node id lists (or None) per trip."""
+        origins = np.asarray(origins, dtype=np.int64)
+        dests = np.asarray(dests, dtype=np.int64)
+        tasks = [
+            ("transfer", (road, rail, weight, origins[s], dests[s], transfers))
+            for s in _chunks(len(origins), self.chunk_size)
+        ]
+        for paths in self.pool.imap(_route_chunk, tasks):
+            yield from paths
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
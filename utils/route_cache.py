@@ -0,0 +1,136 @@
+# route_cache.py
+
+import json
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+
+MISSING = object()
+
+class RouteCache:
+    """
+    Cache of shortest paths keyed by (origin node, destination node, mode
+    profile, graph fingerprint).
+
+    Recent routes live in an in-memory LRU of at most maxsize entries. With a
+    path, routes are also written to an SQLite file that later runs (and
+    scenario sweeps on the same network) read back on a memory miss. Paths
+    are stored as lists of integer node ids of the compiled graph; "no path"
+    is cached as None.
+
+    hits / misses / evictions / disk_hits count lookups since creation.
+    """
+
+    def __init__(self, maxsize=100_000, path=None, flush_every=1000):
+        self.maxsize = maxsize
+        self.path = None if path is None else str(path)
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self._routes = OrderedDict()
+        self._pending = {}  # routes not yet written to disk
+        self._db = None
+        if self.path is not None:
+            self._db = sqlite3.connect(self.path)
+            self._db.execute("CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, path TEXT)")
+
+    @staticmethod
+    def _disk_key(key):
+        return json.dumps(key)
+
+    def __len__(self):
+        return len(self._routes)
+
+    def get(self, key):
+        """Cached route for key, or MISSING."""
+        if key in self._routes:
+            self._routes.move_to_end(key)
+            self.hits += 1
+            return self._routes[key]
+        if self._db is not None:
+            disk_key = self._disk_key(key)
+            row = (self._pending[disk_key],) if disk_key in self._pending else \
+                self._db.execute("SELECT path FROM routes WHERE key = ?", (disk_key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                value = json.loads(row[0])
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        return MISSING
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self._db is not None:
+            self._pending[self._disk_key(key)] = json.dumps(value)
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is MISSING:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key, value):
+        self._routes[key] = value
+        self._routes.move_to_end(key)
+        while len(self._routes) > self.maxsize:
+            self._routes.popitem(last=False)
+            self.evictions += 1
+
+    def flush(self):
+        """Write pending routes to the disk tier."""
+        if self._db is not None and self._pending:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO routes (key, path) VALUES (?, ?)", self._pending.items())
+            self._pending = {}
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_hits": self.disk_hits,
+            "size": len(self._routes),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def cached_shortest_path(cg, source, target, weight="length", cache=None):
+    """
+    CompiledGraph.shortest_path_indices through a RouteCache. The mode
+    profile is the weight name and the fingerprint covers the graph and that
+    weight, so a changed network or penalty never returns a stale route.
+    """
+    if cache is None or source < 0 or target < 0:
+        return cg.shortest_path_indices(source, target, weight)
+    key = (int(source), int(target), weight, cg.fingerprint(weight))
+    path = cache.get(key)
+    if path is MISSING:
+        path = cg.shortest_path_indices(source, target, weight)
+        cache.put(key, None if path is None else path.tolist())
+        return path
+    return None if path is None else np.asarray(path, dtype=np.int64)
+
+def cached_node_path(cg, source, target, weight="length", cache=None):
+    """Like cached_shortest_path, but between original node ids; a list or None."""
+    path = cached_shortest_path(cg, cg.node_index(source), cg.node_index(target), weight, cache)
+    return None if path is None else cg.node_ids[path].tolist()
@@ -0,0 +1,310 @@
+# timetable_router.py
+
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+
+WALK_SPEED_MPS = 1.33
+EARTH_RADIUS_M = 6371000
+
+def gtfs_time_to_seconds(times):
+    """GTFS "HH:MM:SS" times (hours may exceed 24) to int64 seconds; -1 where missing."""
+    if pd.api.types.is_numeric_dtype(getattr(times, "dtype", None)):
+        # Already seconds, as in the typed GTFS cache (utils.gtfs_cache)
+        return pd.Series(times).fillna(-1).to_numpy(dtype=np.int64)
+    parts = pd.Series(times, dtype=object).astype(str).str.strip().str.split(":", expand=True)
+    if parts.shape[1] < 3:
+        return np.full(len(parts), -1, dtype=np.int64)
+    hms = parts.iloc[:, :3].apply(pd.to_numeric, errors="coerce")
+    seconds = hms[0] * 3600 + hms[1] * 60 + hms[2]
+    return seconds.fillna(-1).to_numpy(dtype=np.int64)
+
+class Timetable:
+    """
+    Connection Scan router over a GTFS timetable.
+
+    A connection is one vehicle hop between consecutive timed stops of a
+    trip. Connections are kept as NumPy arrays sorted by departure time:
+    dep_stop, arr_stop (stop codes into stop_ids), dep_time, arr_time
+    (seconds since service-day midnight) and trip (codes into trip_ids;
+    trip_route maps a trip to its route code in route_ids).
+
+    Optional footpaths connect stops within walk_radius_m of each other at
+    WALK_SPEED_MPS. min_transfer_s is added whenever a rider changes
+    vehicles at a stop (not before the first vehicle).
+    """
+
+    def __init__(self, stop_ids, trip_ids, route_ids, trip_route, dep_stop, arr_stop, dep_time, arr_time, trip,
+                 foot_indptr=None, foot_target=None, foot_time=None, min_transfer_s=0):
+        order = np.lexsort((arr_time, dep_time))
+        self.stop_ids = np.asarray(stop_ids)
+        self.trip_ids = np.asarray(trip_ids)
+        self.route_ids = np.asarray(route_ids)
+        self.trip_route = np.asarray(trip_route, dtype=np.int32)
+        self.dep_stop = np.asarray(dep_stop, dtype=np.int32)[order]
+        self.arr_stop = np.asarray(arr_stop, dtype=np.int32)[order]
+        self.dep_time = np.asarray(dep_time, dtype=np.int64)[order]
+        self.arr_time = np.asarray(arr_time, dtype=np.int64)[order]
+        self.trip = np.asarray(trip, dtype=np.int32)[order]
+        n = len(self.stop_ids)
+        self.foot_indptr = np.zeros(n + 1, dtype=np.int64) if foot_indptr is None else np.asarray(foot_indptr)
+        self.foot_target = np.zeros(0, dtype=np.int32) if foot_target is None else np.asarray(foot_target)
+        self.foot_time = np.zeros(0, dtype=np.int64) if foot_time is None else np.asarray(foot_time)
+        self.min_transfer_s = int(min_transfer_s)
+        self._stop_index = pd.Index(self.stop_ids)
+
+        # Plain lists are much faster than NumPy scalars inside the scan loop
+        self._conn = list(zip(self.dep_stop.tolist(), self.arr_stop.tolist(), self.dep_time.tolist(),
+                              self.arr_time.tolist(), self.trip.tolist()))
+        self._foot = [
+            list(zip(self.foot_target[a:b].tolist(), self.foot_time[a:b].tolist()))
+            for a, b in zip(self.foot_indptr[:-1].tolist(), self.foot_indptr[1:].tolist())
+        ]
+        self._foot_in = [[] for _ in range(n)]  # stop → [(stop walked from, walk time)]
+        for stop, paths in enumerate(self._foot):
+            for target, walk in paths:
+                self._foot_in[target].append((stop, walk))
+
+    @classmethod
+    def from_gtfs(cls, stops, stop_times, walk_radius_m=0, min_transfer_s=0):
+        """
+        Build from the tables returned by gtfs_to_netx.load_gtfs (stop_times
+        already merged with trips and routes). Stops without a time are
+        skipped, so a connection then spans to the next timed stop.
+        """
+        st = stop_times[["trip_id", "route_id", "stop_id", "stop_sequence", "arrival_time", "departure_time"]].copy()
+        st["arr"] = gtfs_time_to_seconds(st["arrival_time"])
+        st["dep"] = gtfs_time_to_seconds(st["departure_time"])
+        st["arr"] = st["arr"].where(st["arr"] >= 0, st["dep"])
+        st["dep"] = st["dep"].where(st["dep"] >= 0, st["arr"])
+        st = st[st["dep"] >= 0].sort_values(["trip_id", "stop_sequence"], kind="stable")
+
+        stop_ids = pd.Index(pd.unique(pd.concat([stops["stop_id"], st["stop_id"]], ignore_index=True)))
+        trip_code, trip_ids = pd.factorize(st["trip_id"])
+        route_code, route_ids = pd.factorize(st["route_id"])
+        stop_code = stop_ids.get_indexer(st["stop_id"])
+        trip_route = np.zeros(len(trip_ids), dtype=np.int32)
+        trip_route[trip_code] = route_code
+
+        # Consecutive stops of the same trip form a connection
+        same_trip = trip_code[1:] == trip_code[:-1]
+        dep_time = st["dep"].to_numpy()
+        arr_time = st["arr"].to_numpy()
+        foot = cls._footpaths(stops, stop_ids, walk_radius_m) if walk_radius_m > 0 else (None, None, None)
+        return cls(
+            stop_ids.to_numpy(), trip_ids.to_numpy(), route_ids.to_numpy(), trip_route,
+            dep_stop=stop_code[:-1][same_trip],
+            arr_stop=stop_code[1:][same_trip],
+            dep_time=dep_time[:-1][same_trip],
+            arr_time=arr_time[1:][same_trip],
+            trip=trip_code[:-1][same_trip],
+            foot_indptr=foot[0], foot_target=foot[1], foot_time=foot[2],
+            min_transfer_s=min_transfer_s,
+        )
+
+    @staticmethod
+    def _footpaths(stops, stop_ids, walk_radius_m):
+        """Walking links between stops within walk_radius_m (local equirectangular metres)."""
+        from scipy.spatial import cKDTree
+
+        coords = stops.drop_duplicates("stop_id").set_index("stop_id")[["stop_lat", "stop_lon"]]
+        coords = coords.reindex(stop_ids)
+        known = np.flatnonzero(coords["stop_lat"].notna().to_numpy())
+        lat = np.radians(coords["stop_lat"].to_numpy()[known])
+        lon = np.radians(coords["stop_lon"].to_numpy()[known])
+        xy = np.column_stack([lon * np.cos(lat.mean()), lat]) * EARTH_RADIUS_M
+
+        pairs = cKDTree(xy).query_pairs(walk_radius_m, output_type="ndarray")
+        src = np.concatenate([pairs[:, 0], pairs[:, 1]])
+        dst = np.concatenate([pairs[:, 1], pairs[:, 0]])
+        walk_time = np.ceil(np.linalg.norm(xy[src] - xy[dst], axis=1) / WALK_SPEED_MPS).astype(np.int64)
+        src, dst = known[src], known[dst]
+        order = np.argsort(src, kind="stable")
+        indptr = np.searchsorted(src[order], np.arange(len(stop_ids) + 1))
+        return indptr, dst[order].astype(np.int32), walk_time[order]
+
+    @property
+    def n_stops(self):
+        return len(self.stop_ids)
+
+    def stop_code(self, stop_id):
+        code = int(self._stop_index.get_indexer([stop_id])[0])
+        if code < 0:
+            raise KeyError(f"Unknown stop {stop_id!r}")
+        return code
+
+    def scan(self, source, departure, target=None, max_duration=None):
+        """
+        Earliest arrival at every stop (or until target is settled) leaving
+        stop code source at departure. Returns (arrival, journey) where
+        arrival is an int64 array (-1 where unreachable) and journey[stop]
+        is the (kind, from stop, start, end, trip) leg that reached it. Walk
+        legs carry a sixth item, the vehicle leg they continue (None for a
+        walk from the source), since a footpath may start at a stop reached
+        earlier on foot.
+        """
+        inf = float("inf")
+        n = self.n_stops
+        arrival = [inf] * n
+        alighted = [inf] * n  # earliest arrival at each stop by vehicle; footpaths start from these
+        ready = [inf] * n  # earliest time a new vehicle can be boarded at each stop
+        journey = [None] * n
+        boarded = {}  # trip → (boarding stop, boarding time)
+        horizon = inf if max_duration is None else departure + max_duration
+
+        # No vehicle has been left yet, so the first one needs no transfer slack
+        arrival[source] = ready[source] = departure
+        for stop, walk in self._foot[source]:
+            if departure + walk < arrival[stop]:
+                arrival[stop] = ready[stop] = departure + walk
+                journey[stop] = ("walk", source, departure, departure + walk, -1, None)
+
+        first = int(np.searchsorted(self.dep_time, departure))
+        for dep_stop, arr_stop, dep_time, arr_time, trip in self._conn[first:]:
+            if dep_time > horizon or (target is not None and dep_time >= arrival[target]):
+                break
+            if trip not in boarded:
+                if ready[dep_stop] > dep_time:
+                    continue
+                boarded[trip] = (dep_stop, dep_time)
+            if arr_time < alighted[arr_stop]:
+                board_stop, board_time = boarded[trip]
+                ride = ("transit", board_stop, board_time, arr_time, trip)
+                alighted[arr_stop] = arr_time
+                ready[arr_stop] = min(ready[arr_stop], arr_time + self.min_transfer_s)
+                if arr_time < arrival[arr_stop]:
+                    arrival[arr_stop] = arr_time
+                    journey[arr_stop] = ride
+                for stop, walk in self._foot[arr_stop]:
+                    if arr_time + walk < arrival[stop]:
+                        arrival[stop] = arr_time + walk
+                        ready[stop] = min(ready[stop], arr_time + walk + self.min_transfer_s)
+                        journey[stop] = ("walk", arr_stop, arr_time, arr_time + walk, -1, ride)
+
+        arrival = np.array([-1 if a == inf else a for a in arrival], dtype=np.int64)
+        return arrival, journey
+
+    def legs(self, journey, source, target):
+        """Legs from source to target, reconstructed from a scan() journey."""
+        legs = []
+        stop, leg = target, journey[target]
+        while stop != source:
+            kind, from_stop, start, end, trip = leg[:5]
+            legs.append({
+                "mode": kind,
+                "from_stop": self.stop_ids[from_stop],
+                "to_stop": self.stop_ids[stop],
+                "departure": start,
+                "arrival": end,
+                "trip_id": self.trip_ids[trip] if trip >= 0 else None,
+                "route_id": self.route_ids[self.trip_route[trip]] if trip >= 0 else None,
+            })
+            stop = from_stop
+            leg = leg[5] if kind == "walk" and leg[5] is not None else journey[stop]
+        return legs[::-1]
+
+    def earliest_arrival(self, source_stop, departure, target_stop=None, max_duration=None):
+        """
+        With a target: the earliest-arrival journey as a dict (departure,
+        arrival, travel_time, transfers, legs) or None if unreachable.
+        Without one: a Series of earliest arrival times (seconds) per
+        reachable stop.
+        """
+        source = self.stop_code(source_stop)
+        target = None if target_stop is None else self.stop_code(target_stop)
+        arrival, journey = self.scan(source, departure, target, max_duration)
+        if target is None:
+            reached = arrival >= 0
+            return pd.Series(arrival[reached], index=self.stop_ids[reached], name="arrival")
+        if arrival[target] < 0:
+            return None
+        legs = self.legs(journey, source, target)
+        transit_legs = sum(leg["mode"] == "transit" for leg in legs)
+        return {
+            "departure": departure,
+            "arrival": int(arrival[target]),
+            "travel_time": int(arrival[target]) - departure,
+            "transfers": max(transit_legs - 1, 0),
+            "legs": legs,
+        }
+
+    def profile(self, source_stop, target_stop, window_start, window_end, max_duration=None):
+        """
+        Pareto-optimal journeys leaving source_stop within
+        [window_start, window_end]: one row per useful departure with its
+        arrival, travel time and transfers, latest departure first. A
+        departure is kept only if it arrives strictly earlier than every
+        later departure in the window; journeys no faster than walking
+        straight to the target, or longer than max_duration, are left out.
+
+        Profile Connection Scan: a single pass over the connections by
+        decreasing departure time keeps, per stop, the Pareto set of
+        (departure, arrival at target) pairs and, per trip, the arrival
+        reached by staying on board.
+        """
+        source = self.stop_code(source_stop)
+        target = self.stop_code(target_stop)
+        columns = ["departure", "arrival", "travel_time", "transfers"]
+        if source == target:
+            return pd.DataFrame(columns=columns)
+
+        inf = float("inf")
+        final_walk = {stop: walk for stop, walk in self._foot_in[target]}
+        direct_walk = final_walk.get(source, inf)
+        profiles = {}  # stop → ([departure], [arrival], [transit legs]) with both times increasing
+        result = ([], [], [])
+        trip_best = {}  # trip → (arrival, transit legs) staying on board
+
+        def evaluate(stop, time):
+            deps, arrs, legs = profiles.get(stop, ([], [], []))
+            i = bisect_left(deps, time)
+            return (arrs[i], legs[i]) if i < len(deps) else (inf, 0)
+
+        def insert(profile, departure, arrival, legs):
+            deps, arrs, n_legs = profile
+            i = bisect_left(deps, departure)
+            if i < len(deps) and arrs[i] <= arrival:
+                return  # a departure at least as late arrives no later
+            end = i + 1 if i < len(deps) and deps[i] == departure else i
+            start = bisect_left(arrs, arrival, 0, i)  # earlier departures arriving no earlier
+            deps[start:end] = [departure]
+            arrs[start:end] = [arrival]
+            n_legs[start:end] = [legs]
+
+        def reach(stop, departure, best):
+            insert(profiles.setdefault(stop, ([], [], [])), departure, *best)
+            if stop == source and window_start <= departure <= window_end and best[0] < departure + direct_walk \
+                    and (max_duration is None or best[0] - departure <= max_duration):
+                insert(result, departure, *best)
+
+        first = int(np.searchsorted(self.dep_time, window_start))
+        last = len(self._conn) if max_duration is None else \
+            int(np.searchsorted(self.dep_time, window_end + max_duration, side="right"))
+        for dep_stop, arr_stop, dep_time, arr_time, trip in reversed(self._conn[first:last]):
+            best = (inf, 0)
+            if arr_stop == target:
+                best = (arr_time, 1)
+            elif arr_stop in final_walk:
+                best = (arr_time + final_walk[arr_stop], 1)
+            best = min(best, trip_best.get(trip, best))
+            arrival, legs = evaluate(arr_stop, arr_time + self.min_transfer_s)
+            best = min(best, (arrival, legs + 1))
+            if best[0] == inf:
+                continue
+            trip_best[trip] = best
+            reach(dep_stop, dep_time, best)
+            for stop, walk in self._foot_in[dep_stop]:
+                reach(stop, dep_time - walk, best)
+
+        rows = [
+            {"departure": dep, "arrival": arr, "travel_time": arr - dep, "transfers": legs - 1}
+            for dep, arr, legs in zip(*result)
+        ]
+        return pd.DataFrame(rows[::-1], columns=columns)
+
+if __name__ == "__main__":
+    from utils.gtfs_to_netx import GTFS_CACHE_DIR, GTFS_DIR, load_gtfs
+
+    rail_stops, rail_stop_times = load_gtfs(GTFS_DIR / "rail", GTFS_CACHE_DIR / "rail")
+    timetable = Timetable.from_gtfs(rail_stops, rail_stop_times, walk_radius_m=300, min_transfer_s=120)
+    print(f"Timetable has {timetable.n_stops} stops and {len(timetable.dep_time)} connections.")
@@ -0,0 +1,201 @@
+# zone_skims.py
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from utils.compiled_graph import compile_graph
+from utils.geospatial import METRIC_CRS, NodeIndex
+from utils.parallel_routing import SharedGraphs, attach_graphs
+
+SKIM_METRICS = ("travel_time", "distance", "cost", "transfers")
+SKIM_UNITS = {"travel_time": "min", "distance": "m", "cost": "PHP", "transfers": "count"}
+SKIM_VERSION = 2
+
+# Fallback speeds when a graph has no travel_time attribute (as in gtfs_path_comp.estimate_travel_time)
+SPEED_KPH = {"walk": 5, "road": 20, "rail": 30}
+
+def zone_nodes(cg, zones_gdf, zone_col="MUCEPCode", graph_crs="EPSG:4326"):
+    """
+    Representative node per zone: the graph node nearest to the zone
+    centroid, in metres (see geospatial.NodeIndex). Returns (zone ids,
+    integer node ids). With graph_crs=None nothing is reprojected.
+    """
+    index = NodeIndex(cg.node_ids, cg.node_x, cg.node_y, graph_crs, METRIC_CRS if graph_crs else None)
+    nodes, _ = index.query(zones_gdf, crs=graph_crs)
+    return zones_gdf[zone_col].to_numpy(), nodes
+
+def zone_codes(zones):
+    """
+    Zone codes as the strings skims are keyed by. Integral numbers lose
+    their decimal part, so MUCEP codes read as floats (3.0) match 3 and "3".
+    """
+    values = pd.Series(np.asarray(zones, dtype=object))
+    numbers = pd.to_numeric(values, errors="coerce")
+    integral = numbers.notna() & (numbers % 1 == 0)
+    codes = values.astype(str).astype(object)
+    codes[integral] = numbers[integral].astype(np.int64).astype(str).astype(object)
+    return codes.to_numpy()
+
+def tree_sums(pred, values):
+    """
+    Sum of per-node values along each shortest-path tree, from the root to
+    every node, by pointer jumping (log2(depth) passes). pred is a scipy
+    predecessor array with one tree per row; values[..., v] is the value of
+    the tree edge into v.
+    """
+    pred = np.atleast_2d(pred)
+    rows, n = pred.shape
+    # Flattened trees, each with a sentinel root (value 0) that points to itself
+    offset = np.arange(rows)[:, None] * (n + 1)
+    sentinel = offset + n
+    parent = np.concatenate([np.where(pred >= 0, pred + offset, sentinel), sentinel], axis=1).ravel()
+    acc = np.concatenate([np.broadcast_to(values, (rows, n)), np.zeros((rows, 1))], axis=1).ravel()
+    while True:
+        acc = acc + acc[parent]
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            break
+        parent = grand
+    return acc.reshape(rows, n + 1)[:, :n]
+
+def _skim_rows(mode, weight, metrics, origin_nodes, dest_nodes, rows, skim_dir):
+    """Compute the skim rows of some origin zones and write them into the memmapped matrices."""
+    from utils.parallel_routing import _graphs
+
+    cg = _graphs[mode]
+    dist, pred = cg.dijkstra(origin_nodes[rows], weight)
+    reached = np.isfinite(dist)
+
+    # Edge of the search tree into every reached node
+    child = np.flatnonzero(pred.ravel() >= 0)
+    edges = cg.edge_ids_between(pred.ravel()[child], child % cg.n_nodes, weight)
+
+    def tree_edge_values(values, fill=0):
+        per_node = np.full(pred.shape, fill, dtype=values.dtype)
+        per_node.ravel()[child] = values[edges]
+        return per_node
+
+    skims = {"travel_time": dist}
+    skims["distance"] = tree_sums(pred, tree_edge_values(np.nan_to_num(cg.length)))
+    if "cost" in metrics:
+        skims["cost"] = tree_sums(pred, tree_edge_values(np.nan_to_num(cg.cost)))
+
+    # A boarding is a tree edge on a route other than the one into its parent
+    route = tree_edge_values(cg.route.astype(np.int64), fill=-1)
+    parent_route = np.where(pred >= 0, np.take_along_axis(route, np.maximum(pred, 0), axis=1), -1)
+    boarding = (route >= 0) & (route != parent_route)
+    skims["transfers"] = np.maximum(tree_sums(pred, boarding.astype(np.float64)) - 1, 0)
+
+    for metric, values in skims.items():
+        out = np.lib.format.open_memmap(os.path.join(skim_dir, f"{mode}_{metric}.npy"), mode="r+")
+        out[rows] = np.where(reached, values, np.nan)[:, dest_nodes].astype(np.float32)
+        out.flush()
+        del out
+    return len(rows)
+
+def build_skims(graphs, zone_nodes_by_mode, zones, skim_dir, n_workers=None, chunk_size=64):
+    """
+    Zone x zone travel_time, distance, cost and transfer matrices per mode.
+
+    graphs maps mode → graph (networkx or CompiledGraph); zone_nodes_by_mode
+    maps mode → integer node id of each zone (see zone_nodes), in the order
+    of zones. Travel time is the fastest path (minutes); distance (metres),
+    cost and transfers are summed along that same path. Graphs without
+    travel_time use length at SPEED_KPH[mode]; graphs without any edge cost
+    (such as the GTFS graphs) get no cost matrix.
+
+    Each matrix is a float32 .npy in skim_dir (NaN where unreachable) that
+    ZoneSkims memory-maps. Origin zones are computed in chunks on a process
+    pool over SharedGraphs, which writes its rows straight into the files.
+    """
+    os.makedirs(skim_dir, exist_ok=True)
+    n_zones = len(zones)
+    compiled = {}
+    metrics = {}
+    for mode, G in graphs.items():
+        # A copy, so the skim weight is not added to the graph compile_graph caches for G
+        cg = compile_graph(G).copy()
+        if np.isnan(cg.travel_time).all():
+            cg.add_weight("skim_time", cg.length / (SPEED_KPH.get(mode, 20) * 1000 / 60))
+        else:
+            cg.add_weight("skim_time", cg.travel_time)
+        compiled[mode] = cg
+        metrics[mode] = [m for m in SKIM_METRICS if m != "cost" or not np.isnan(cg.cost).all()]
+        for metric in metrics[mode]:
+            np.lib.format.open_memmap(os.path.join(skim_dir, f"{mode}_{metric}.npy"), mode="w+",
+                                      dtype=np.float32, shape=(n_zones, n_zones))
+
+    jobs = [
+        (mode, "skim_time", metrics[mode], np.asarray(zone_nodes_by_mode[mode]),
+         np.asarray(zone_nodes_by_mode[mode]), np.arange(start, min(start + chunk_size, n_zones)), str(skim_dir))
+        for mode in graphs
+        for start in range(0, n_zones, chunk_size)
+    ]
+    with SharedGraphs(compiled, weights=("skim_time",)) as shared:
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=attach_graphs,
+                                 initargs=(shared.descriptor,)) as pool:
+            for _ in pool.map(_skim_rows, *zip(*jobs)):
+                pass
+
+    manifest = {
+        "version": SKIM_VERSION,
+        "zones": zone_codes(zones).tolist(),
+        "modes": list(graphs),
+        "metrics": metrics,
+        "units": {metric: SKIM_UNITS[metric] for metric in SKIM_METRICS},
+    }
+    with open(os.path.join(skim_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return ZoneSkims(skim_dir)
+
+class ZoneSkims:
+    """
+    Read-only, memory-mapped zone x zone skims written by build_skims.
+    Lookups are array reads: skims.lookup(origins, destinations, "rail", "travel_time").
+    metrics maps each mode to the matrices built for it.
+    """
+
+    def __init__(self, skim_dir):
+        self.skim_dir = str(skim_dir)
+        with open(os.path.join(self.skim_dir, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != SKIM_VERSION:
+            raise ValueError(f"Unsupported skim version {self.manifest['version']} in {skim_dir}")
+        self.zones = pd.Index(self.manifest["zones"])
+        self.modes = self.manifest["modes"]
+        self.metrics = self.manifest["metrics"]
+        self._matrices = {}
+
+    def matrix(self, mode, metric):
+        key = (mode, metric)
+        if metric not in self.metrics.get(mode, ()):
+            raise KeyError(f"No {metric} skim for mode {mode!r}")
+        if key not in self._matrices:
+            self._matrices[key] = np.load(os.path.join(self.skim_dir, f"{mode}_{metric}.npy"), mmap_mode="r")
+        return self._matrices[key]
+
+    def zone_index(self, zones):
+        return self.zones.get_indexer(pd.Index(zone_codes(zones)))
+
+    def lookup(self, origins, destinations, mode, metric="travel_time"):
+        """Vectorized skim values for origin/destination zone pairs; NaN for unknown zones."""
+        o = self.zone_index(np.atleast_1d(origins))
+        d = self.zone_index(np.atleast_1d(destinations))
+        known = (o >= 0) & (d >= 0)
+        values = np.full(len(o), np.nan, dtype=np.float32)
+        values[known] = self.matrix(mode, metric)[o[known], d[known]]
+        return values
+
+    def get(self, origin, destination, mode, metric="travel_time"):
+        return float(self.lookup([origin], [destination], mode, metric)[0])
+
+def attach_skims(trips_df, skims, origin_col="origin_mucep_code", dest_col="destination_mucep_code",
+                 modes=None, metrics=("travel_time",)):
+    """Add one "<mode>_<metric>" column per mode and metric built for that mode to a trip table."""
+    trips_df = trips_df.copy()
+    for mode in modes or skims.modes:
+        for metric in [m for m in metrics if m in skims.metrics[mode]]:
+            trips_df[f"{mode}_{metric}"] = skims.lookup(trips_df[origin_col], trips_df[dest_col], mode, metric)
+    return trips_df